@@ -0,0 +1,83 @@
+# benchmarks/bench_alarm_logger.py
+# 模擬 alarm storm：比較舊的「逐筆 put_item + 兩次 _to_decimal」與新的 BatchWriteItem 寫法。
+# 用法：python benchmarks/bench_alarm_logger.py [記錄數] [每次 round-trip 延遲 ms]
+import json
+import sys
+import time
+from collections import OrderedDict
+from decimal import Decimal
+
+from common import ROOT  # noqa: F401  (設定 sys.path)
+from tests.fakes import FakeTable, attach_client
+import alarm_logger
+
+
+def _to_decimal(v):
+    """舊版 alarm_logger 的遞迴轉換（保留作為比較基準）"""
+    if isinstance(v, float):
+        return Decimal(str(v))
+    if isinstance(v, list):
+        return [_to_decimal(x) for x in v]
+    if isinstance(v, dict):
+        return {k: _to_decimal(x) for k, x in v.items()}
+    return v
+
+
+def legacy_handler(event, table):
+    """舊版 handler 的寫入路徑：每筆 SNS 記錄一次 put_item"""
+    written = 0
+    for record in event["Records"]:
+        alarm = json.loads(record["Sns"]["Message"])
+        trigger = alarm.get("Trigger", {})
+        dims = {d.get("name"): d.get("value") for d in trigger.get("Dimensions", [])}
+        table.put_item(Item={
+            "AlarmName": alarm["AlarmName"], "StateChangeTime": alarm["StateChangeTime"],
+            "NewStateValue": alarm["NewStateValue"], "NewStateReason": alarm["NewStateReason"],
+            "MetricNamespace": trigger.get("Namespace"), "MetricName": trigger.get("MetricName"),
+            "Dimensions": _to_decimal(dims), "Raw": _to_decimal(alarm),
+        })
+        written += 1
+    return written
+
+
+def make_event(n, duplicate_ratio=0.2):
+    records = []
+    for i in range(n):
+        msg = {
+            "AlarmName": f"AvailabilityAlarm_site{i}", "NewStateValue": "ALARM",
+            "NewStateReason": "Threshold Crossed: 2 datapoints [0.0, 0.0] were less than the threshold (1.0).",
+            "StateChangeTime": "2026-10-17T00:00:00.000+0000",
+            "Trigger": {"MetricName": "IsSuccess", "Namespace": "WebsiteMonitor", "Threshold": 1.0,
+                        "Period": 300, "EvaluationPeriods": 2, "Statistic": "MINIMUM",
+                        "Dimensions": [{"name": "URL", "value": f"https://site{i}.example.com/"}]},
+        }
+        records.append({"EventSource": "aws:sns", "Sns": {"Message": json.dumps(msg)}})
+    records += records[: int(n * duplicate_ratio)]   # SNS 重送
+    return {"Records": records}
+
+
+def main(n, latency_ms):
+    event = make_event(n)
+    print(f"records: {len(event['Records'])} ({n} unique), simulated round-trip: {latency_ms} ms")
+    print(f"{'path':<28}{'seconds':>10}{'records/s':>12}{'API calls':>12}{'WCU':>10}")
+
+    legacy = FakeTable(key="AlarmName", sort_key="StateChangeTime", call_latency=latency_ms / 1000)
+    start = time.perf_counter()
+    legacy_handler(event, legacy)
+    secs = time.perf_counter() - start
+    print(f"{'legacy put_item loop':<28}{secs:>10.3f}{len(event['Records']) / secs:>12.0f}"
+          f"{legacy.calls.count('put_item'):>12}{legacy.consumed_wcu:>10.0f}")
+
+    table = attach_client(FakeTable(key="AlarmName", sort_key="StateChangeTime", call_latency=latency_ms / 1000),
+                          name=alarm_logger.TABLE_NAME)
+    alarm_logger.table = table
+    alarm_logger._seen_keys = OrderedDict()
+    start = time.perf_counter()
+    alarm_logger.handler(event, None)
+    secs = time.perf_counter() - start
+    print(f"{'batched + deduplicated':<28}{secs:>10.3f}{len(event['Records']) / secs:>12.0f}"
+          f"{table.meta.client.batch_calls:>12}{table.consumed_wcu:>10.0f}")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 2000, float(sys.argv[2]) if len(sys.argv) > 2 else 5.0)
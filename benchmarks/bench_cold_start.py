@@ -0,0 +1,113 @@
+# benchmarks/bench_cold_start.py
+# 量測每支 Lambda handler 的 cold start 成本：每次都開新的 Python 行程（與新 container 相同，沒有任何快取的模組），
+#   import   ：import handler 模組的時間（Lambda 的 Init Duration 主要就是這段）
+#   clients  ：第一次呼叫時建立 AWS client 的時間（aws_clients 延遲到這裡才建立）
+#   init     ：兩者加總，也就是第一個請求在 handler 邏輯之前要付出的成本
+# 最後兩行是對照組：新行程中 import boto3 後建立 resource Table（舊寫法）與 low-level client 各要多久。
+# 另外用 python -X importtime 列出 import 最重的頂層套件。
+#
+# 用法：python benchmarks/bench_cold_start.py [重複次數]
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+from common import ROOT
+
+LAYER = ROOT / "hello_lambda" / "layers" / "shared" / "python"
+HANDLERS = [
+    ("hello_lambda/lambda", "create_target"),
+    ("hello_lambda/lambda", "get_target"),
+    ("hello_lambda/lambda", "update_target"),
+    ("hello_lambda/lambda", "delete_target"),
+    ("hello_lambda/lambda", "list_targets"),
+    ("hello_lambda/lambda", "batch_targets"),
+    ("hello_lambda/lambda", "lambda_function"),
+    ("hello_lambda/lambda", "crawl_dispatcher"),
+    ("hello_lambda/lambda", "crawl_worker"),
+    ("hello_lambda/lambda", "export_items"),
+    ("hello_lambda/alarm_logger", "alarm_logger"),
+    ("hello_lambda/alarm_logger", "alarm_history"),
+]
+
+# 子行程：import handler → 建立它的 Table 用到的 client
+CHILD = r"""
+import importlib, json, sys, time
+t0 = time.perf_counter()
+mod = importlib.import_module(sys.argv[1])
+t1 = time.perf_counter()
+import aws_clients
+for value in list(vars(mod).values()):
+    if isinstance(value, aws_clients.Table):
+        value._factory()
+t2 = time.perf_counter()
+print(json.dumps({"import": (t1 - t0) * 1000, "clients": (t2 - t1) * 1000}))
+"""
+# 對照組：import boto3 之後建立 resource Table / low-level client
+REFERENCE = r"""
+import json, sys, time
+import boto3
+t0 = time.perf_counter()
+if sys.argv[1] == "resource":
+    boto3.resource("dynamodb").Table("CrawlerTargets")
+else:
+    boto3.client("dynamodb")
+print(json.dumps({"import": 0.0, "clients": (time.perf_counter() - t0) * 1000}))
+"""
+
+
+def _env(asset_dir):
+    env = dict(os.environ)
+    env.update({
+        "PYTHONPATH": os.pathsep.join([str(ROOT / asset_dir), str(LAYER)]),
+        "TABLE_NAME": "CrawlerTargets",
+        "ROLLUP_TABLE_NAME": "WebHealthAlarmRollups",
+        "AWS_DEFAULT_REGION": "us-east-2",
+        "AWS_ACCESS_KEY_ID": "bench",
+        "AWS_SECRET_ACCESS_KEY": "bench",
+        "METRICS_BACKEND": os.environ.get("METRICS_BACKEND", "emf"),
+        "PYTHONDONTWRITEBYTECODE": "1",
+    })
+    return env
+
+
+def measure(asset_dir, module, repeat, code=CHILD):
+    samples = []
+    for _ in range(repeat):
+        out = subprocess.run([sys.executable, "-c", code, module], env=_env(asset_dir), cwd=ROOT / asset_dir,
+                             capture_output=True, text=True, check=True)
+        samples.append(json.loads(out.stdout.strip().splitlines()[-1]))
+    return {k: statistics.median(s[k] for s in samples) for k in samples[0]}
+
+
+def heaviest_imports(asset_dir, module, top=3):
+    """python -X importtime：回傳 handler 直接 import 的模組中 cumulative 時間最長的 [(名稱, ms)]"""
+    out = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"], env=_env(asset_dir),
+                         cwd=ROOT / asset_dir, capture_output=True, text=True, check=True)
+    totals = {}
+    for line in out.stderr.splitlines():
+        parts = line.split("|")
+        if len(parts) != 3 or not parts[1].strip().isdigit():
+            continue
+        name = parts[2].rstrip()
+        depth = (len(name) - len(name.lstrip())) // 2   # 每多一層 import 縮排兩格
+        if depth == 1:
+            totals[name.strip()] = int(parts[1]) / 1000
+    return sorted(totals.items(), key=lambda kv: -kv[1])[:top]
+
+
+def main(repeat):
+    print(f"median of {repeat} fresh interpreters per handler (ms)")
+    print(f"{'handler':<22}{'import':>9}{'clients':>9}{'init':>9}  heaviest imports")
+    for asset_dir, module in HANDLERS:
+        r = measure(asset_dir, module, repeat)
+        heavy = ", ".join(f"{name} {ms:.0f}" for name, ms in heaviest_imports(asset_dir, module))
+        print(f"{module:<22}{r['import']:>9.1f}{r['clients']:>9.1f}{r['import'] + r['clients']:>9.1f}  {heavy}")
+    for kind in ("resource", "client"):
+        r = measure("hello_lambda/lambda", kind, repeat, code=REFERENCE)
+        print(f"{'boto3 ' + kind + ' (ref)':<22}{'':>9}{r['clients']:>9.1f}")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 5)
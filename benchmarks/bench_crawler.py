@@ -0,0 +1,250 @@
+# benchmarks/bench_crawler.py
+# Crawler 熱路徑的 benchmark：在子行程啟動本地 HTTP server farm（可設定延遲、錯誤率、大 body、掛住不回），
+# 以 N 個目標跑 lambda_function.handler（CloudWatch / DynamoDB 以 tests/fakes 取代），回報：
+#   總執行時間、每個探測的 p50 / p95 / p99 延遲、peak RSS、metric API 呼叫數
+# 可把結果存成 baseline JSON，之後比較時超過容許範圍就以 exit code 1 結束（可放進部署前檢查）。
+# handler 自己的 stdout（instrumentation 的 EMF 行、print）導到 /dev/null，只留報表與 baseline 比較結果。
+#
+# 用法：
+#   python benchmarks/bench_crawler.py --targets 500 --save-baseline benchmarks/baselines/crawler.json
+#   python benchmarks/bench_crawler.py --targets 500 --baseline benchmarks/baselines/crawler.json
+import argparse
+import contextlib
+import functools
+import http.server
+import json
+import multiprocessing
+import os
+import random
+import resource
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+from common import ROOT  # noqa: F401  (設定 sys.path)
+
+os.environ.setdefault("VALIDATOR_CACHE_FILE", os.path.join(tempfile.mkdtemp(), "validator_cache.json"))
+os.environ["METRICS_BACKEND"] = "api"   # 要計算 PutMetricData 呼叫數
+
+KINDS = ("ok", "slow", "error", "large", "hang")
+# 比較 baseline 時檢查的欄位（數值越小越好）
+CHECKED = ("runTimeMs", "p50Ms", "p95Ms", "p99Ms", "peakRssMb", "metricCalls")
+
+
+# --- server farm（子行程）----------------------------------------------------
+class _SiteHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"   # keep-alive，與真實網站相同
+    opts = {}
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        kind = self.path.strip("/").split("/")[0]
+        latency = self.opts["latency_ms"] / 1000 * random.uniform(0.5, 1.5)
+        if kind == "slow":
+            latency *= 5
+        elif kind == "hang":
+            latency = self.opts["hang_seconds"]
+        time.sleep(latency)
+        if kind == "error":
+            self._send(500, b"internal error")
+        elif kind == "large":
+            self._send(200, b"x" * (self.opts["large_kb"] * 1024))
+        else:
+            self._send(200, b"<html>" + b"y" * (self.opts["body_kb"] * 1024) + b"</html>")
+
+    def _send(self, status, body):
+        self.send_response(status)
+        self.send_header("Content-Type", "text/html")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        try:
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            pass   # crawler 已經 timeout 放棄
+
+
+class _Farm(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        pass   # crawler timeout 後斷線是預期行為，不印 traceback
+
+
+def _serve_farm(hosts, opts, ports_out):
+    _SiteHandler.opts = opts
+    servers = [_Farm(("127.0.0.1", 0), _SiteHandler) for _ in range(hosts)]
+    ports_out.put([s.server_address[1] for s in servers])
+    for s in servers[1:]:
+        threading.Thread(target=s.serve_forever, daemon=True).start()
+    servers[0].serve_forever()
+
+
+def start_farm(hosts, opts):
+    ports = multiprocessing.Queue()
+    proc = multiprocessing.Process(target=_serve_farm, args=(hosts, opts, ports), daemon=True)
+    proc.start()
+    return proc, ports.get(timeout=10)
+
+
+def make_targets(n, ports, rates, seed=42):
+    """依比例決定每個目標的行為，URL 路徑帶著行為名稱（/slow/17 ...）"""
+    rng = random.Random(seed)
+    targets = []
+    for i in range(n):
+        r, kind = rng.random(), "ok"
+        for k in KINDS[1:]:
+            if r < rates[k]:
+                kind = k
+                break
+            r -= rates[k]
+        url = f"http://127.0.0.1:{ports[i % len(ports)]}/{kind}/{i}"
+        targets.append({"targetId": f"t{i:05d}", "url": url})
+    return targets
+
+
+# --- crawler run -------------------------------------------------------------
+class _Context:
+    def __init__(self, timeout_ms):
+        self.deadline = time.monotonic() + timeout_ms / 1000
+
+    def get_remaining_time_in_millis(self):
+        return int((self.deadline - time.monotonic()) * 1000)
+
+
+def _percentile(values, q):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q / 100 * (len(ordered) - 1))))]
+
+
+def run_once(targets, probe_timeout, lambda_timeout_ms):
+    import lambda_function
+    from metrics_buffer import MetricBuffer
+    from schedule import Scheduler
+    from tests.fakes import FakeCloudWatch
+
+    cw = FakeCloudWatch()
+    lambda_function.metrics = MetricBuffer(cw)
+    lambda_function.scheduler = Scheduler()          # 每次都是全部到期
+    lambda_function.load_target_items = lambda: [dict(t) for t in targets]
+    lambda_function.get_state_writer = lambda: None
+    if not hasattr(lambda_function, "_bench_check_website"):
+        lambda_function._bench_check_website = lambda_function.check_website
+    lambda_function.check_website = functools.partial(lambda_function._bench_check_website, timeout=probe_timeout)
+
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        start = time.perf_counter()
+        lambda_function.handler({}, _Context(lambda_timeout_ms))
+        run_ms = (time.perf_counter() - start) * 1000
+    latencies = [d["Value"] * 1000 for d in cw.datums("WebsiteMonitor") if d["MetricName"] == "Latency"]
+    checked = sum(d["Value"] for d in cw.datums("WebsiteMonitorCrawler") if d["MetricName"] == "SitesChecked")
+    return {"runTimeMs": run_ms, "latencies": latencies, "metricCalls": len(cw.calls), "checked": checked}
+
+
+def run_benchmark(args):
+    rates = {"slow": args.slow_rate, "error": args.error_rate, "large": args.large_rate, "hang": args.hang_rate}
+    opts = {"latency_ms": args.latency_ms, "body_kb": args.body_kb, "large_kb": args.large_kb,
+            "hang_seconds": args.probe_timeout + 1}
+    proc, ports = start_farm(args.hosts, opts)
+    try:
+        targets = make_targets(args.targets, ports, rates)
+        runs = [run_once(targets, args.probe_timeout, args.lambda_timeout_ms) for _ in range(args.repeat)]
+    finally:
+        proc.terminate()
+    latencies = [v for r in runs for v in r["latencies"]]
+    return {
+        "targets": args.targets,
+        "hosts": args.hosts,
+        "repeat": args.repeat,
+        "runTimeMs": round(statistics.median(r["runTimeMs"] for r in runs), 1),
+        "p50Ms": round(_percentile(latencies, 50), 1),
+        "p95Ms": round(_percentile(latencies, 95), 1),
+        "p99Ms": round(_percentile(latencies, 99), 1),
+        # ru_maxrss 在 Linux 是 KB（macOS 是 bytes）
+        "peakRssMb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1),
+        "metricCalls": max(r["metricCalls"] for r in runs),
+        "sitesChecked": min(r["checked"] for r in runs),
+        "config": {k: v for k, v in vars(args).items() if k not in ("baseline", "save_baseline", "tolerance")},
+    }
+
+
+def compare(result, baseline, tolerance):
+    """回傳退步的欄位清單 [(欄位, baseline, 本次)]；超過 baseline × (1 + tolerance) 才算退步"""
+    regressions = []
+    for key in CHECKED:
+        base = baseline.get(key)
+        if base is None:
+            continue
+        # 很小的數值（例如 p50 只有幾 ms）另外給一點絕對誤差，避免雜訊誤判
+        limit = base * (1 + tolerance) + (1 if key == "metricCalls" else 5 if key.endswith("Ms") else 0)
+        if result[key] > limit:
+            regressions.append((key, base, result[key]))
+    return regressions
+
+
+def config_differences(result, baseline):
+    """回傳與 baseline 不同的設定 [(欄位, baseline, 本次)]；設定不同時數字沒有可比性"""
+    base = baseline.get("config") or {}
+    return [(k, base.get(k), v) for k, v in result["config"].items() if base.get(k) != v]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark lambda_function.handler against a local site farm.")
+    parser.add_argument("--targets", type=int, default=300)
+    parser.add_argument("--hosts", type=int, default=8, help="number of local servers (distinct host:port)")
+    parser.add_argument("--latency-ms", type=float, default=30)
+    parser.add_argument("--body-kb", type=int, default=20)
+    parser.add_argument("--large-kb", type=int, default=2048)
+    parser.add_argument("--slow-rate", type=float, default=0.1)
+    parser.add_argument("--error-rate", type=float, default=0.05)
+    parser.add_argument("--large-rate", type=float, default=0.05)
+    parser.add_argument("--hang-rate", type=float, default=0.02)
+    parser.add_argument("--probe-timeout", type=float, default=2.0)
+    parser.add_argument("--lambda-timeout-ms", type=int, default=60000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--baseline", help="compare against this baseline JSON and exit 1 on regression")
+    parser.add_argument("--save-baseline", help="write the result to this JSON file")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed relative regression (default 0.25)")
+    args = parser.parse_args(argv)
+
+    result = run_benchmark(args)
+    print(f"targets: {result['targets']} on {result['hosts']} hosts, {result['repeat']} runs, "
+          f"{result['sitesChecked']} checked per run")
+    print(f"{'run time (median)':<22}{result['runTimeMs']:>10.1f} ms")
+    for q in ("p50", "p95", "p99"):
+        print(f"{'probe latency ' + q:<22}{result[q + 'Ms']:>10.1f} ms")
+    print(f"{'peak RSS':<22}{result['peakRssMb']:>10.1f} MB")
+    print(f"{'PutMetricData calls':<22}{result['metricCalls']:>10d}")
+
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(os.path.abspath(args.save_baseline)), exist_ok=True)
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+            f.write("\n")
+        print(f"baseline saved to {args.save_baseline}")
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        differences = config_differences(result, baseline)
+        for key, base, now in differences:
+            print(f"CONFIG MISMATCH {key}: {base} -> {now}")
+        if differences:
+            print(f"not comparing against {args.baseline}: rerun with the baseline's options or record a new baseline")
+            return 2
+        regressions = compare(result, baseline, args.tolerance)
+        for key, base, now in regressions:
+            print(f"REGRESSION {key}: {base} -> {now} (tolerance {args.tolerance:.0%})")
+        if regressions:
+            return 1
+        print(f"no regressions against {args.baseline}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
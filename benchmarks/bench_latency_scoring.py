@@ -0,0 +1,35 @@
+# benchmarks/bench_latency_scoring.py
+# LatencyAnomalyScore 的計算成本：N 個目標、視窗已滿時，一個 tick 整批評分要多久（numpy 與純 Python 各一次）。
+# 預算是每個目標 < 1ms。
+# 用法：python benchmarks/bench_latency_scoring.py [目標數量]
+import math
+import random
+import sys
+
+from common import timed
+import latency_baseline
+import numpy_loader
+
+
+def run(n, backend):
+    rng = random.Random(7)
+    ids = [f"t{i:05d}" for i in range(n)]
+    base = [rng.uniform(0.05, 2.0) for _ in ids]
+    history = latency_baseline.LatencyHistory(numpy_min_targets=0 if backend == "numpy" else math.inf)
+    for _ in range(latency_baseline.WINDOW):
+        history.score(ids, [b * rng.uniform(0.8, 1.2) for b in base])
+    batch = [b * rng.uniform(0.8, 1.2) for b in base]
+    _, ms = timed(lambda: history.score(ids, batch))
+    print(f"{backend:<10}{ms:>12.1f}{ms * 1000 / n:>14.2f}")
+
+
+def main(n):
+    print(f"targets: {n}, window: {latency_baseline.WINDOW}")
+    print(f"{'backend':<10}{'tick ms':>12}{'us/target':>14}")
+    if numpy_loader.load() is not None:
+        run(n, "numpy")
+    run(n, "python")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10000)
@@ -0,0 +1,59 @@
+# benchmarks/bench_list_targets.py
+# 比較 GET /targets 舊的「整表 Scan + Python 篩選」與新的分頁 / ActiveIndex Query。
+# 最後一列是帶相符 If-None-Match 的條件式請求：ETag 是回應內容的摘要，仍要讀同樣的 DynamoDB 分頁、
+# 序列化後才能比對，所以 RCU 與延遲與一般請求相同，省下的只有回應大小（見 etag.py）。
+# 用法：python benchmarks/bench_list_targets.py [目標數量]
+import json
+import sys
+
+from common import timed
+from tests.fakes import FakeTable
+import list_targets
+
+
+def legacy_list(table, active_filter):
+    """原本 list_targets.handler 的讀取路徑（保留作為比較基準）"""
+    items, resp = [], table.scan()
+    items.extend(resp.get("Items", []))
+    while "LastEvaluatedKey" in resp:
+        resp = table.scan(ExclusiveStartKey=resp["LastEvaluatedKey"])
+        items.extend(resp.get("Items", []))
+    if active_filter is not None:
+        val = active_filter.lower() == "true"
+        items = [i for i in items if bool(i.get("active", True)) == val]
+    return json.dumps({"items": items, "count": len(items)})
+
+
+def main(n):
+    # page_items 約等於 1MB 分頁能容納的項目數
+    table = FakeTable(indexes={"ActiveIndex": ("activeStatus", "createdAt")}, page_items=3000)
+    for i in range(n):
+        active = i % 4 != 0
+        table.put_item(Item={
+            "targetId": f"{i:08d}", "url": f"https://site{i}.example.com/", "active": active,
+            "activeStatus": "true" if active else "false", "createdAt": f"2026-01-01T{i:08d}",
+            "updatedAt": f"2026-01-01T{i:08d}", "itemType": "target", "tags": ["news"], "notes": "",
+        })
+    list_targets.table = table
+
+    print(f"targets: {n}")
+    print(f"{'path':<32}{'median ms':>12}{'RCU/call':>12}{'body KB':>12}")
+    index_query = {"queryStringParameters": {"limit": "50", "active": "true"}}
+    tag = list_targets.handler(index_query, None)["headers"]["ETag"]
+    cases = [
+        ("legacy scan (all)", lambda: legacy_list(table, None)),
+        ("legacy scan (active=true)", lambda: legacy_list(table, "true")),
+        ("paged scan (limit=50)", lambda: list_targets.handler({"queryStringParameters": {"limit": "50"}}, None)["body"]),
+        ("index query (active=true, 50)", lambda: list_targets.handler(index_query, None)["body"]),
+        ("  + If-None-Match hit (304)", lambda: list_targets.handler(
+            dict(index_query, headers={"If-None-Match": tag}), None)["body"]),
+    ]
+    for name, fn in cases:
+        before = table.consumed_rcu
+        body, ms = timed(fn)
+        rcu = (table.consumed_rcu - before) / 5
+        print(f"{name:<32}{ms:>12.2f}{rcu:>12.1f}{len(body) / 1024:>12.1f}")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20000)
@@ -0,0 +1,26 @@
+# benchmarks/common.py
+# 讓 benchmark 腳本可以直接 import Lambda 模組與 tests/fakes.py（同 tests/unit/conftest.py）
+import os
+import sys
+import pathlib
+import statistics
+import time
+
+ROOT = pathlib.Path(__file__).resolve().parents[1]
+for path in (ROOT, ROOT / "hello_lambda" / "lambda", ROOT / "hello_lambda" / "alarm_logger",
+             ROOT / "hello_lambda" / "layers" / "shared" / "python"):
+    if str(path) not in sys.path:
+        sys.path.insert(0, str(path))
+
+os.environ.setdefault("TABLE_NAME", "CrawlerTargets")
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-2")
+
+
+def timed(fn, repeat=5):
+    """執行 fn repeat 次，回傳 (最後一次結果, 各次耗時 ms 的中位數)"""
+    samples, result = [], None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return result, statistics.median(samples)
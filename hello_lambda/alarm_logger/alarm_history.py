@@ -0,0 +1,178 @@
+# alarm_history.py
+# -----------------------------------------------------------------------------
+# Purpose
+#   Read API over WebHealthAlarmsTable (written by alarm_logger.py):
+#
+#   GET /alarms/{alarmName}/history?from=t1&to=t2[&limit&nextToken&raw=true]
+#       -> Query on the table key (AlarmName, StateChangeTime BETWEEN t1 AND t2)
+#   GET /alarms/transitions?state=ALARM&hours=N[&limit&nextToken]
+#       -> Query on StateTimeIndex (NewStateValue, StateChangeTime >= now - N h)
+#   GET /alarms/{alarmName}/rollups?from=YYYY-MM-DD&to=YYYY-MM-DD
+#       -> daily counters from the rollup table plus derived MTTR / flap count
+#
+#   Times are CloudWatch StateChangeTime strings (2026-10-17T00:00:00.000+0000);
+#   they sort lexicographically, so range conditions work on the raw strings.
+# -----------------------------------------------------------------------------
+
+import os
+import math
+import json
+import base64
+from instrumentation import instrumented, phase
+import aws_clients
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from typing import Any, Dict, Optional
+
+TABLE_NAME = os.environ["TABLE_NAME"]
+ROLLUP_TABLE_NAME = os.environ.get("ROLLUP_TABLE_NAME")
+STATE_TIME_INDEX = "StateTimeIndex"
+
+table = aws_clients.table(TABLE_NAME)
+rollup_table = aws_clients.table(ROLLUP_TABLE_NAME) if ROLLUP_TABLE_NAME else None
+
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 500
+MAX_HOURS = 24 * 366 * 10   # ?hours= 上限（更大的值會讓 timedelta overflow）
+# Everything except the full "Raw" payload, which is only returned with raw=true.
+SUMMARY_FIELDS = ["AlarmName", "StateChangeTime", "NewStateValue", "NewStateReason",
+                  "MetricNamespace", "MetricName", "Dimensions"]
+
+# -----------------------------------------------------------------------------
+# Utilities
+# -----------------------------------------------------------------------------
+def _json_default(v: Any) -> Any:
+    """DynamoDB returns numbers as Decimal; emit ints as ints, the rest as floats."""
+    if isinstance(v, Decimal):
+        return int(v) if v == v.to_integral_value() else float(v)
+    raise TypeError(f"cannot serialize {type(v).__name__}")
+
+def _response(status: int, body: Dict[str, Any]) -> Dict[str, Any]:
+    with phase("serialize"):
+        return {"statusCode": status, "body": json.dumps(body, default=_json_default)}
+
+def _encode_token(last_key: Dict[str, Any]) -> str:
+    raw = json.dumps(last_key, separators=(",", ":"), default=_json_default)
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+def _decode_token(token: str) -> Dict[str, Any]:
+    try:
+        data = json.loads(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)))
+    except ValueError:
+        raise ValueError("invalid nextToken")
+    if not isinstance(data, dict):
+        raise ValueError("invalid nextToken")
+    return data
+
+def _cw_time(dt: datetime) -> str:
+    """Format a datetime the way CloudWatch writes StateChangeTime."""
+    return dt.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.") + f"{dt.microsecond // 1000:03d}+0000"
+
+def _key_kwargs(pk: str, pk_value: Any, sk: str, sk_op: str, *sk_values: Any) -> Dict[str, Any]:
+    """String KeyConditionExpression (boto3.dynamodb.conditions costs 300+ ms of cold start to import)."""
+    names = {"#pk": pk, "#sk": sk}
+    values = {":pk": pk_value, **{f":sk{i}": v for i, v in enumerate(sk_values)}}
+    if sk_op == "BETWEEN":
+        sk_cond = "#sk BETWEEN :sk0 AND :sk1"
+    else:
+        sk_cond = f"#sk {sk_op} :sk0"
+    return {"KeyConditionExpression": f"#pk = :pk AND {sk_cond}",
+            "ExpressionAttributeNames": names, "ExpressionAttributeValues": values}
+
+def _page_kwargs(qs: Dict[str, str], raw: bool, key: Dict[str, Any]) -> Dict[str, Any]:
+    limit = max(1, min(int(qs.get("limit") or DEFAULT_LIMIT), MAX_LIMIT))
+    kwargs: Dict[str, Any] = dict(key, Limit=limit)
+    if qs.get("nextToken"):
+        kwargs["ExclusiveStartKey"] = _decode_token(qs["nextToken"])
+    if not raw:
+        names = {f"#p{i}": f for i, f in enumerate(SUMMARY_FIELDS)}
+        kwargs["ProjectionExpression"] = ", ".join(names)
+        kwargs["ExpressionAttributeNames"] = dict(kwargs["ExpressionAttributeNames"], **names)
+    return kwargs
+
+def _page_body(resp: Dict[str, Any]) -> Dict[str, Any]:
+    items = resp.get("Items", [])
+    body: Dict[str, Any] = {"items": items, "count": len(items)}
+    if "LastEvaluatedKey" in resp:
+        body["nextToken"] = _encode_token(resp["LastEvaluatedKey"])
+    return body
+
+# -----------------------------------------------------------------------------
+# Routes
+# -----------------------------------------------------------------------------
+def alarm_history(alarm_name: str, qs: Dict[str, str]) -> Dict[str, Any]:
+    """All transitions of one alarm between from and to (newest first)."""
+    t1 = qs.get("from") or "0000"
+    t2 = qs.get("to") or "9999"
+    with phase("dynamo"):
+        resp = table.query(
+            ScanIndexForward=False,
+            **_page_kwargs(qs, qs.get("raw") == "true",
+                           _key_kwargs("AlarmName", alarm_name, "StateChangeTime", "BETWEEN", t1, t2)),
+        )
+    return _response(200, _page_body(resp))
+
+def recent_transitions(qs: Dict[str, str], now: Optional[datetime] = None) -> Dict[str, Any]:
+    """All transitions into `state` (default ALARM) during the last `hours` hours."""
+    state = (qs.get("state") or "ALARM").upper()
+    hours = float(qs.get("hours") or 24)
+    if not math.isfinite(hours) or hours <= 0:
+        raise ValueError("hours must be a positive number")
+    hours = min(hours, MAX_HOURS)
+    since = _cw_time((now or datetime.now(timezone.utc)) - timedelta(hours=hours))
+    with phase("dynamo"):
+        resp = table.query(
+            IndexName=STATE_TIME_INDEX,
+            ScanIndexForward=False,
+            **_page_kwargs(qs, qs.get("raw") == "true",
+                           _key_kwargs("NewStateValue", state, "StateChangeTime", ">=", since)),
+        )
+    body = _page_body(resp)
+    body.update(state=state, since=since)
+    return _response(200, body)
+
+def alarm_rollups(alarm_name: str, qs: Dict[str, str]) -> Dict[str, Any]:
+    """Daily counters for one alarm plus MTTR and flap count over the range."""
+    if rollup_table is None:
+        return _response(404, {"error": "rollups are not enabled"})
+    today = datetime.now(timezone.utc).date()
+    d1 = qs.get("from") or (today - timedelta(days=30)).isoformat()
+    d2 = qs.get("to") or today.isoformat()
+    days, kwargs = [], _key_kwargs("AlarmName", alarm_name, "Period", "BETWEEN", d1, d2)
+    while True:
+        with phase("dynamo"):
+            resp = rollup_table.query(**kwargs)
+        days.extend(resp.get("Items", []))
+        if "LastEvaluatedKey" not in resp:
+            break
+        kwargs["ExclusiveStartKey"] = resp["LastEvaluatedKey"]
+
+    recoveries = sum(d.get("recoveries", 0) for d in days)
+    recovery_seconds = sum(d.get("recoverySeconds", 0) for d in days)
+    summary = {
+        "transitions": sum(d.get("transitions", 0) for d in days),
+        "flapCount": sum(d.get("alarmCount", 0) for d in days),
+        "recoveries": recoveries,
+        "mttrSeconds": round(float(recovery_seconds) / recoveries, 1) if recoveries else None,
+    }
+    return _response(200, {"alarmName": alarm_name, "from": d1, "to": d2, "days": days, "summary": summary})
+
+# -----------------------------------------------------------------------------
+# Lambda entry point
+# -----------------------------------------------------------------------------
+@instrumented("alarm_history")
+def handler(event: Dict[str, Any], context) -> Dict[str, Any]:
+    qs = event.get("queryStringParameters") or {}
+    params = event.get("pathParameters") or {}
+    resource = event.get("resource", "")
+    try:
+        if resource.endswith("/transitions"):
+            return recent_transitions(qs)
+        if resource.endswith("/rollups"):
+            return alarm_rollups(params["alarmName"], qs)
+        if resource.endswith("/history"):
+            return alarm_history(params["alarmName"], qs)
+    except ValueError as e:
+        # Bad limit/hours/nextToken values.
+        return _response(400, {"error": str(e)})
+    return _response(404, {"error": "unknown route"})
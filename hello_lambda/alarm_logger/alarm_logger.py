@@ -13,18 +13,43 @@
 #
 # Why Decimal conversion?
 #   DynamoDB's low-level API does not accept Python float due to precision issues.
-#   Boto3 expects numbers to be Decimal. The helper _to_decimal() converts any
-#   floats nested inside dicts/lists to Decimal so put_item won't fail.
+#   Boto3 expects numbers to be Decimal. The SNS message is parsed with
+#   json.loads(parse_float=Decimal), so every number is converted once, while
+#   parsing, instead of walking the payload again before each write.
+#
+# Batching & idempotency
+#   All records of one invocation are collected first and written with
+#   BatchWriteItem (25 items per call), retrying UnprocessedItems with backoff.
+#   Duplicate (AlarmName, StateChangeTime) pairs are dropped within a batch and,
+#   while the container is warm, across SNS redeliveries. Because the item key is
+#   exactly that pair, a redelivery that reaches a cold container simply
+#   overwrites the same item (an idempotent upsert), never a second row.
+#   If any item still cannot be written, the handler raises after the rest of
+#   the batch is stored, so Lambda retries the event and finally sends it to the DLQ.
+#
+# Daily rollups (optional, ROLLUP_TABLE_NAME)
+#   For every newly written transition we also maintain small counter items so
+#   MTTR / flap-count dashboards never scan the history:
+#     (AlarmName, "STATE")       -> last state, last change time, alarmSince
+#     (AlarmName, "YYYY-MM-DD")  -> transitions, alarmCount, okCount,
+#                                   insufficientCount, recoveries, recoverySeconds
+#   The STATE update is conditional on the transition being newer than the last
+#   one recorded, so redelivered or out-of-order events never double count.
 # -----------------------------------------------------------------------------
 
 import os
 import json
-import boto3
+import time
+import random
+from instrumentation import instrumented, phase
+import aws_clients
 import logging
+from collections import OrderedDict
 from datetime import datetime, timezone
 from decimal import Decimal
 from botocore.exceptions import ClientError
-from typing import Any, Dict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
 
 # -----------------------------------------------------------------------------
 # Configuration & clients
@@ -33,39 +58,141 @@ from typing import Any, Dict
 # Lambda function (see environment={"TABLE_NAME": alarm_table.table_name}).
 TABLE_NAME = os.environ["TABLE_NAME"]
 
-# Construct high-level DynamoDB resource client and bind to the target table.
-dynamodb = boto3.resource("dynamodb")
-table = dynamodb.Table(TABLE_NAME)
+# Table handles from the shared layer (aws_clients). They behave like boto3
+# Table resources but sit on the low-level client, which is created lazily on
+# first use instead of at import time (the resource layer is slow to build).
+table = aws_clients.table(TABLE_NAME)
+
+# Optional rollup table for per-alarm daily counters (see header).
+ROLLUP_TABLE_NAME = os.environ.get("ROLLUP_TABLE_NAME")
+rollup_table = aws_clients.table(ROLLUP_TABLE_NAME) if ROLLUP_TABLE_NAME else None
 
 # Configure structured logging. The logs go to CloudWatch Logs by default.
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
+# BatchWriteItem accepts at most 25 put requests per call.
+BATCH_SIZE = 25
+MAX_ATTEMPTS = 8
+
+# Keys written recently by this (warm) container. SNS delivers at-least-once, so
+# the same alarm transition can arrive again; we skip it instead of rewriting it.
+SEEN_CAPACITY = 4096
+_seen_keys: "OrderedDict[Tuple[str, str], None]" = OrderedDict()
+
 # -----------------------------------------------------------------------------
 # Utilities
 # -----------------------------------------------------------------------------
-def _to_decimal(v: Any) -> Any:
+def _remember(key: Tuple[str, str]) -> None:
+    """Add a key to the bounded recently-written set (oldest entries evicted first)."""
+    _seen_keys[key] = None
+    _seen_keys.move_to_end(key)
+    while len(_seen_keys) > SEEN_CAPACITY:
+        _seen_keys.popitem(last=False)
+
+def _batch_write(items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
     """
-    Recursively convert Python floats to Decimal so the object is safe to write
-    to DynamoDB. Supports scalars, lists, and dicts. All other types are passed
-    through unchanged.
+    Write items with BatchWriteItem, 25 at a time. Items DynamoDB returns as
+    UnprocessedItems (throttling, partition limits) are retried with jittered
+    exponential backoff. Returns the items that still could not be written.
     """
-    if isinstance(v, float):
-        # Use str() to avoid binary floating-point artifacts (e.g., 0.30000000004)
-        return Decimal(str(v))
-    if isinstance(v, list):
-        return [_to_decimal(x) for x in v]
-    if isinstance(v, dict):
-        return {k: _to_decimal(x) for k, x in v.items()}
-    return v
+    failed: List[Dict[str, Any]] = []
+    client = table.meta.client
+    for i in range(0, len(items), BATCH_SIZE):
+        pending = [{"PutRequest": {"Item": item}} for item in items[i:i + BATCH_SIZE]]
+        for attempt in range(MAX_ATTEMPTS):
+            try:
+                resp = client.batch_write_item(RequestItems={TABLE_NAME: pending})
+            except ClientError as e:
+                logger.error("BatchWriteItem failed (%d items): %s", len(pending), e, exc_info=True)
+                break
+            pending = resp.get("UnprocessedItems", {}).get(TABLE_NAME, [])
+            if not pending:
+                break
+            time.sleep(random.uniform(0, 0.05 * (2 ** attempt)))
+        failed.extend(r["PutRequest"]["Item"] for r in pending)
+    return failed
 
 def _now_iso_utc() -> str:
     """Return the current time in UTC as an ISO8601 string with timezone."""
     return datetime.now(timezone.utc).isoformat()
 
+def _parse_time(value: str) -> Optional[datetime]:
+    """Parse CloudWatch's StateChangeTime (e.g. 2026-10-17T00:00:00.000+0000)."""
+    try:
+        return datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return None
+
+# -----------------------------------------------------------------------------
+# Rollups
+# -----------------------------------------------------------------------------
+STATE_COUNTERS = {"ALARM": "alarmCount", "OK": "okCount", "INSUFFICIENT_DATA": "insufficientCount"}
+
+def _update_rollup(item: Dict[str, Any]) -> bool:
+    """
+    Apply one transition to the STATE item and the day's counter item.
+    Returns False when the transition is not newer than the last one recorded
+    (redelivery / out-of-order), in which case nothing is counted.
+    """
+    name, when, state = item["AlarmName"], item["StateChangeTime"], item["NewStateValue"]
+    sets = ["lastState = :s", "lastChange = :t"]
+    values: Dict[str, Any] = {":s": state, ":t": when}
+    if state == "ALARM":
+        sets.append("alarmSince = :t")
+    try:
+        old = rollup_table.update_item(
+            Key={"AlarmName": name, "Period": "STATE"},
+            UpdateExpression="SET " + ", ".join(sets),
+            ExpressionAttributeValues=values,
+            ConditionExpression="attribute_not_exists(lastChange) OR lastChange < :t",
+            ReturnValues="ALL_OLD",
+        ).get("Attributes", {})
+    except ClientError as e:
+        if e.response["Error"]["Code"] == "ConditionalCheckFailedException":
+            return False
+        raise
+
+    adds = ["transitions :one"]
+    day_values: Dict[str, Any] = {":one": 1}
+    counter = STATE_COUNTERS.get(state)
+    if counter:
+        adds.append(f"{counter} :one")
+    # ALARM -> OK: one recovery; its duration feeds MTTR = recoverySeconds / recoveries.
+    if state == "OK" and old.get("lastState") == "ALARM":
+        start, end = _parse_time(old.get("alarmSince")), _parse_time(when)
+        if start and end and end >= start:
+            adds += ["recoveries :one", "recoverySeconds :dur"]
+            day_values[":dur"] = Decimal(str(round((end - start).total_seconds(), 3)))
+    rollup_table.update_item(
+        Key={"AlarmName": name, "Period": when[:10]},
+        UpdateExpression="ADD " + ", ".join(adds),
+        ExpressionAttributeValues=day_values,
+    )
+    return True
+
+def _update_rollups(items: List[Dict[str, Any]]) -> int:
+    """Update rollups; transitions of one alarm are applied in time order, alarms in parallel."""
+    by_alarm: Dict[str, List[Dict[str, Any]]] = {}
+    for item in items:
+        by_alarm.setdefault(item["AlarmName"], []).append(item)
+
+    def apply(group: List[Dict[str, Any]]) -> int:
+        counted = 0
+        for item in sorted(group, key=lambda i: _parse_time(i["StateChangeTime"]) or datetime.min.replace(tzinfo=timezone.utc)):
+            try:
+                counted += _update_rollup(item)
+            except ClientError as e:
+                logger.error("Failed to update rollup for alarm '%s': %s", item["AlarmName"], e, exc_info=True)
+        return counted
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        return sum(pool.map(apply, by_alarm.values()))
+
 # -----------------------------------------------------------------------------
 # Lambda entry point
 # -----------------------------------------------------------------------------
+@instrumented("alarm_logger")
 def handler(event: Dict[str, Any], context) -> Dict[str, Any]:
 
 
@@ -75,7 +202,10 @@ def handler(event: Dict[str, Any], context) -> Dict[str, Any]:
         logger.warning("SNS event contained no Records; nothing to do.")
         return {"statusCode": 200, "body": "no-records"}
 
-    written = 0  # counter for successful writes
+    # Items keyed by (AlarmName, StateChangeTime): a later duplicate in the same
+    # batch replaces nothing, it is simply counted and dropped.
+    batch: "OrderedDict[Tuple[str, str], Dict[str, Any]]" = OrderedDict()
+    duplicates = 0
 
     for idx, record in enumerate(records):
         # 1) Validate the event source so we only process SNS-origin messages.
@@ -90,12 +220,14 @@ def handler(event: Dict[str, Any], context) -> Dict[str, Any]:
             continue
 
         # 3) Parse the SNS message as JSON. If parsing fails, keep the raw text.
+        #    parse_float=Decimal converts numbers once, during parsing.
         try:
-            alarm = json.loads(msg)
-            parsed_ok = True
+            alarm = json.loads(msg, parse_float=Decimal)
+            parsed_ok = isinstance(alarm, dict)
         except json.JSONDecodeError:
-            alarm = {"RawMessage": msg}
             parsed_ok = False
+        if not parsed_ok:
+            alarm = {"RawMessage": msg}
             logger.warning("SNS message %s was not valid JSON; storing as RawMessage.", idx)
 
         # 4) Extract normalized fields with safe defaults.
@@ -105,6 +237,12 @@ def handler(event: Dict[str, Any], context) -> Dict[str, Any]:
         # CloudWatch may provide StateChangeTime; if missing, use now().
         state_change_time = alarm.get("StateChangeTime") or _now_iso_utc()
 
+        # Skip transitions we already hold in this batch or wrote recently.
+        key = (alarm_name, state_change_time)
+        if key in batch or key in _seen_keys:
+            duplicates += 1
+            continue
+
         # Trigger section contains metric context (namespace, metric, dimensions, etc.)
         trigger = alarm.get("Trigger", {}) if parsed_ok else {}
         metric_name = trigger.get("MetricName")
@@ -116,24 +254,41 @@ def handler(event: Dict[str, Any], context) -> Dict[str, Any]:
             dims = {d.get("name"): d.get("value") for d in trigger["Dimensions"] if isinstance(d, dict)}
 
         # 5) Construct the item to be written to DynamoDB.
-        item: Dict[str, Any] = {
+        batch[key] = {
             "AlarmName": alarm_name,                   # PK: groups all events for the same alarm
             "StateChangeTime": state_change_time,      # SK: chronological ordering within PK
             "NewStateValue": new_state,                # e.g., ALARM / OK / INSUFFICIENT_DATA
             "NewStateReason": reason,                  # human-readable explanation from CW
             "MetricNamespace": namespace or "N/A",     # CW metric namespace if available
             "MetricName": metric_name or "N/A",        # CW metric name if available
-            "Dimensions": _to_decimal(dims),           # flattened dimension map
-            "Raw": _to_decimal(alarm),                 # full payload for audits/debugging
+            "Dimensions": dims,                        # flattened dimension map
+            "Raw": alarm,                              # full payload for audits/debugging
         }
 
-        # 6) Write the item. We catch and log any ClientError so one bad record
-        #    doesn't fail the whole batch (SNS will retry on failure otherwise).
-        try:
-            table.put_item(Item=item)
-            written += 1
-            logger.info("Wrote alarm event: %s @ %s (%s)", alarm_name, state_change_time, new_state)
-        except ClientError as e:
-            logger.error("Failed to write item for alarm '%s': %s", alarm_name, e, exc_info=True)
+    # 6) Write the whole batch. Every chunk is attempted even if one fails; failed
+    #    keys are not remembered, and the invocation raises at the end (step 8)
+    #    so Lambda retries the SNS event. Records already written are skipped by
+    #    _seen_keys or overwritten in place, so the retry only adds what was lost.
+    items = list(batch.values())
+    with phase("dynamo"):
+        failed = _batch_write(items) if items else []
+    failed_keys = {(i["AlarmName"], i["StateChangeTime"]) for i in failed}
+    for key, item in batch.items():
+        if key in failed_keys:
+            logger.error("Failed to write item for alarm '%s' @ %s", key[0], key[1])
+            continue
+        _remember(key)
+        logger.info("Wrote alarm event: %s @ %s (%s)", key[0], key[1], item["NewStateValue"])
+
+    written = len(items) - len(failed)
+
+    # 7) Maintain daily counters for the transitions that were actually stored.
+    if rollup_table is not None and written:
+        with phase("rollups"):
+            _update_rollups([item for key, item in batch.items() if key not in failed_keys])
+
+    # 8) Fail the invocation so the async retries (and then the DLQ) keep the lost records.
+    if failed:
+        raise RuntimeError(f"{len(failed)} of {len(items)} alarm events could not be written")
 
-    return {"statusCode": 200, "body": f"ok (written={written})"}
+    return {"statusCode": 200, "body": f"ok (written={written}, duplicates={duplicates})"}
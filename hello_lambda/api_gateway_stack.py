@@ -1,54 +1,122 @@
 from aws_cdk import (
-    Stack, Duration,
-    aws_lambda as _lambda,
+    Stack, Duration, Size,
     aws_apigateway as apigw,
+    aws_iam as iam,
 )
 from constructs import Construct
 
+from hello_lambda.bundles import bundled_function
+from hello_lambda.shared_layer import shared_layer
+
+STAGE_NAME = "prod"
+# 回應超過這個大小且 client 帶 Accept-Encoding: gzip 時由 API Gateway 壓縮
+MIN_COMPRESSION_BYTES = 1024
+# stage cache 啟用時各 GET 路由的 TTL（秒）；寫入路由成功後整個 cache 會被清空（見 lambda/stage_cache.py）
+DEFAULT_CACHE_TTLS = {"/targets": 30, "/targets/{targetId}": 60}
+# 快取鍵：查詢參數 / 路徑參數，加上 If-None-Match（否則 304 會被快取後回給沒有帶 ETag 的 client）
+CACHE_KEYS = {
+    "/targets": ["method.request.querystring.active", "method.request.querystring.limit",
+                 "method.request.querystring.nextToken", "method.request.header.If-None-Match"],
+    "/targets/{targetId}": ["method.request.path.targetId", "method.request.header.If-None-Match"],
+}
+
 class ApiGatewayStack(Stack):
-    def __init__(self, scope: Construct, construct_id: str, *, table, **kwargs):
+    def __init__(self, scope: Construct, construct_id: str, *, table, router: bool = False,
+                 cache_ttls: dict = None, function_config: dict = None, **kwargs):
         super().__init__(scope, construct_id, **kwargs)
 
-        # 共用參數：設定 TABLE_NAME 供 Lambda 程式讀取
+        # 共用參數：設定 TABLE_NAME 供 Lambda 程式讀取；每支 function 只打包自己用到的模組（見 bundles.py）
         lambda_kwargs = {
-            "runtime": _lambda.Runtime.PYTHON_3_12,
-            "code": _lambda.Code.from_asset("hello_lambda/lambda"),
+            "config": function_config,
             "timeout": Duration.seconds(30),
             "environment": {"TABLE_NAME": table.table_name},
+            "layers": [shared_layer(self)],   # aws_clients（延遲建立 client）
         }
 
-        create_fn = _lambda.Function(self, "CreateTargetFn", handler="create_target.handler", **lambda_kwargs)
-        get_fn    = _lambda.Function(self, "GetTargetFn",    handler="get_target.handler",    **lambda_kwargs)
-        update_fn = _lambda.Function(self, "UpdateTargetFn", handler="update_target.handler", **lambda_kwargs)
-        delete_fn = _lambda.Function(self, "DeleteTargetFn", handler="delete_target.handler", **lambda_kwargs)
-        list_fn   = _lambda.Function(self, "ListTargetsFn",  handler="list_targets.handler",  **lambda_kwargs)
+        if router:
+            # router 模式：一支 Lambda 分派所有路由（較少 cold start，GET 單筆有 container 內快取）
+            router_fn = bundled_function(
+                self, "TargetsRouterFn", handler="targets_router.handler",
+                **dict(lambda_kwargs, environment={"TABLE_NAME": table.table_name, "TARGET_CACHE_TTL_SECONDS": "30"}),
+            )
+            table.grant_read_write_data(router_fn)
+            create_fn = get_fn = update_fn = delete_fn = list_fn = batch_fn = router_fn
+        else:
+            create_fn = bundled_function(self, "CreateTargetFn", handler="create_target.handler", **lambda_kwargs)
+            get_fn    = bundled_function(self, "GetTargetFn",    handler="get_target.handler",    **lambda_kwargs)
+            update_fn = bundled_function(self, "UpdateTargetFn", handler="update_target.handler", **lambda_kwargs)
+            delete_fn = bundled_function(self, "DeleteTargetFn", handler="delete_target.handler", **lambda_kwargs)
+            list_fn   = bundled_function(self, "ListTargetsFn",  handler="list_targets.handler",  **lambda_kwargs)
+            batch_fn  = bundled_function(self, "BatchTargetsFn", handler="batch_targets.handler", **lambda_kwargs)
+
+            # 給每支 Lambda 讀寫表的權限
+            for fn in [create_fn, get_fn, update_fn, delete_fn, list_fn, batch_fn]:
+                table.grant_read_write_data(fn)
 
-        # 給每支 Lambda 讀寫表的權限
-        for fn in [create_fn, get_fn, update_fn, delete_fn, list_fn]:
-            table.grant_read_write_data(fn)
+        # 可選：API Gateway stage cache（只快取 GET，其餘方法照常打到 Lambda）
+        cache_options = {}
+        if cache_ttls:
+            cache_options = dict(
+                cache_cluster_enabled=True,
+                cache_cluster_size="0.5",
+                method_options={
+                    f"{path}/GET": apigw.MethodDeploymentOptions(caching_enabled=True, cache_ttl=Duration.seconds(ttl))
+                    for path, ttl in cache_ttls.items()
+                },
+            )
 
         # 建 API Gateway 路由
         api = apigw.RestApi(
             self,
             "CrawlerTargetsApi",
+            min_compression_size=Size.bytes(MIN_COMPRESSION_BYTES),
             deploy_options=apigw.StageOptions(
+                stage_name=STAGE_NAME,
                 metrics_enabled=True,
                 logging_level=apigw.MethodLoggingLevel.INFO,
                 data_trace_enabled=False,
+                **cache_options,
             ),
         )
 
+        def cached_get(fn, path):
+            # 有快取時，快取鍵用到的參數必須宣告在 method 上
+            if not cache_ttls:
+                return apigw.LambdaIntegration(fn), {}
+            keys = CACHE_KEYS[path]
+            return (apigw.LambdaIntegration(fn, cache_key_parameters=keys),
+                    {"request_parameters": {k: k == "method.request.path.targetId" for k in keys}})
+
         # /targets
         targets = api.root.add_resource("targets")
         targets.add_method("POST", apigw.LambdaIntegration(create_fn))
-        targets.add_method("GET",  apigw.LambdaIntegration(list_fn))
+        integration, options = cached_get(list_fn, "/targets")
+        targets.add_method("GET", integration, **options)
+
+        # /targets:batch（批次匯入 / 更新 / 刪除，單一請求最多 1000 筆）
+        targets_batch = api.root.add_resource("targets:batch")
+        for method in ["POST", "PUT", "DELETE"]:
+            targets_batch.add_method(method, apigw.LambdaIntegration(batch_fn))
 
         # /targets/{targetId}
         target_id = targets.add_resource("{targetId}")
-        target_id.add_method("GET",    apigw.LambdaIntegration(get_fn))
+        integration, options = cached_get(get_fn, "/targets/{targetId}")
+        target_id.add_method("GET",    integration, **options)
         target_id.add_method("PUT",    apigw.LambdaIntegration(update_fn))
         target_id.add_method("DELETE", apigw.LambdaIntegration(delete_fn))
 
+        # 寫入路由成功後清空 stage cache
+        # （stage 名稱用常數：引用 api.deployment_stage 會讓 Lambda → Stage → Method → Lambda 形成循環相依）
+        if cache_ttls:
+            for fn in dict.fromkeys([create_fn, update_fn, delete_fn, batch_fn]):
+                fn.add_environment("API_CACHE_REST_API_ID", api.rest_api_id)
+                fn.add_environment("API_CACHE_STAGE", STAGE_NAME)
+                fn.add_to_role_policy(iam.PolicyStatement(
+                    actions=["apigateway:DELETE"],
+                    resources=[f"arn:aws:apigateway:{self.region}::/restapis/{api.rest_api_id}"
+                               f"/stages/{STAGE_NAME}/cache/data"],
+                ))
+
         # 可選：輸出 API URL（若你習慣在此輸出）
         # from aws_cdk import CfnOutput
         # CfnOutput(self, "ApiUrl", value=api.url)
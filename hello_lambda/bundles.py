@@ -0,0 +1,163 @@
+# hello_lambda/bundles.py
+# 每支 Lambda 的最小部署包與執行設定：
+#   - bundle_files：從 handler 模組開始，以 ast 靜態解析 import（包含函式內、try 裡的 import），
+#     只收同一個目錄裡實際用到的模組，加上模組執行時會讀的資料檔（DATA_FILES）；
+#     aws_clients / instrumentation 在 shared layer，boto3 由 runtime 提供，都不打包
+#   - handler_code：Code.from_asset(目錄, exclude=其他檔案)，asset hash 只看留下來的檔案，
+#     改某支 handler 不會讓其他 function 重新部署
+#   - function_settings：每支 function 的 architecture（x86_64 / arm64）與記憶體，
+#     由 context lambda_config 依 construct id 覆寫（"default" 套用到全部），lambda_arch 是只改架構的捷徑
+#   - report：synth 時（-c bundle_report=true）列出每支 function 的檔案數、大小，
+#     以及在新的 Python 行程中只放這個 bundle + shared layer 時 import handler 的時間（順便確認 bundle 沒漏檔）
+import ast
+import json
+import os
+import pathlib
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+
+from aws_cdk import aws_lambda as _lambda
+from constructs import Construct
+
+LAYER_DIR = pathlib.Path(__file__).resolve().parent / "layers" / "shared" / "python"
+# 模組 -> 執行時以檔名讀取的資料檔（與模組放在同一層）
+DATA_FILES = {"lambda_function": ["targets.json"]}
+ARCHITECTURES = {"x86_64": _lambda.Architecture.X86_64, "arm64": _lambda.Architecture.ARM_64}
+DEFAULT_ARCHITECTURE = "x86_64"
+LAMBDA_DEFAULT_MEMORY_MB = 128
+
+# construct path -> 打包資訊（report 用）
+_bundles = {}
+
+# 子行程：只有 bundle 與 shared layer 在 sys.path 上，量 import handler 模組的時間
+IMPORT_CHILD = r"""
+import importlib, sys, time
+t0 = time.perf_counter()
+importlib.import_module(sys.argv[1])
+print((time.perf_counter() - t0) * 1000)
+"""
+
+
+def imported_names(path):
+    """檔案中所有 import 的頂層模組名稱（相對 import 不會出現在這些平面目錄）"""
+    tree = ast.parse(pathlib.Path(path).read_text(encoding="utf-8"), filename=str(path))
+    names = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            names.update(alias.name.split(".")[0] for alias in node.names)
+        elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+            names.add(node.module.split(".")[0])
+    return names
+
+
+def bundle_files(source_dir, module):
+    """handler 模組需要的檔案（相對於 source_dir，排序後回傳）"""
+    source = pathlib.Path(source_dir)
+    seen, pending = set(), [module]
+    while pending:
+        name = pending.pop()
+        if name in seen or not (source / f"{name}.py").is_file():
+            continue
+        seen.add(name)
+        pending.extend(imported_names(source / f"{name}.py") - seen)
+    files = {f"{name}.py" for name in seen}
+    for name in seen:
+        files.update(f for f in DATA_FILES.get(name, []) if (source / f).is_file())
+    return sorted(files)
+
+
+def handler_code(source_dir, module):
+    keep = set(bundle_files(source_dir, module))
+    exclude = sorted(p.name for p in pathlib.Path(source_dir).iterdir() if p.name not in keep)
+    return _lambda.Code.from_asset(source_dir, exclude=exclude)
+
+
+def config_from_context(node):
+    """
+    context lambda_config：{"default": {...}, "<construct id>": {"architecture": "arm64", "memory": 512}}
+    （-c 帶進來的是 JSON 字串）；lambda_arch=arm64 等同 {"default": {"architecture": "arm64"}}
+    """
+    config = node.try_get_context("lambda_config") or {}
+    if isinstance(config, str):
+        config = json.loads(config)
+    arch = node.try_get_context("lambda_arch")
+    if arch:
+        config = dict(config, default=dict(config.get("default") or {}, architecture=arch))
+    return config
+
+
+def function_settings(config, construct_id, memory_size=None):
+    """回傳 (architecture 名稱, 記憶體 MB 或 None)；個別設定優先於 default，再來才是 stack 給的預設值"""
+    config = config or {}
+    merged = dict(config.get("default") or {}, **(config.get(construct_id) or {}))
+    arch = merged.get("architecture", DEFAULT_ARCHITECTURE)
+    if arch not in ARCHITECTURES:
+        raise ValueError(f"{construct_id}: architecture must be one of {sorted(ARCHITECTURES)}, got {arch!r}")
+    memory = merged.get("memory", memory_size)
+    return arch, int(memory) if memory is not None else None
+
+
+def bundled_function(scope: Construct, construct_id: str, *, handler: str, source: str = "hello_lambda/lambda",
+                     config: dict = None, memory_size: int = None, **kwargs) -> _lambda.Function:
+    """Python 3.12 的 _lambda.Function，code 只含 handler 用到的模組，architecture / 記憶體依 config"""
+    module = handler.split(".")[0]
+    arch, memory = function_settings(config, construct_id, memory_size)
+    fn = _lambda.Function(
+        scope, construct_id,
+        runtime=_lambda.Runtime.PYTHON_3_12,
+        handler=handler,
+        code=handler_code(source, module),
+        architecture=ARCHITECTURES[arch],
+        memory_size=memory,
+        **kwargs,
+    )
+    _bundles[fn.node.path] = {"function": construct_id, "source": source, "module": module,
+                              "architecture": arch, "memory": memory or LAMBDA_DEFAULT_MEMORY_MB}
+    return fn
+
+
+def import_ms(source_dir, module, repeat=3):
+    """把 bundle 複製到暫存目錄，在新行程中 import handler 模組，回傳 repeat 次的中位數（毫秒）"""
+    with tempfile.TemporaryDirectory() as tmp:
+        for name in bundle_files(source_dir, module):
+            shutil.copy(pathlib.Path(source_dir) / name, tmp)
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join([tmp, str(LAYER_DIR)]), PYTHONDONTWRITEBYTECODE="1",
+                   TABLE_NAME="CrawlerTargets", AWS_DEFAULT_REGION=os.getenv("AWS_DEFAULT_REGION", "us-east-2"))
+        samples = []
+        for _ in range(repeat):
+            out = subprocess.run([sys.executable, "-c", IMPORT_CHILD, module], env=env, cwd=tmp,
+                                 capture_output=True, text=True, check=True)
+            samples.append(float(out.stdout.strip().splitlines()[-1]))
+    return statistics.median(samples)
+
+
+def report(scope: Construct, measure=True):
+    """scope 之下所有 bundled_function 的 [{function, handler, architecture, memory, files, bytes, importMs}]"""
+    prefix = scope.node.path
+    rows = []
+    for path, info in _bundles.items():
+        if prefix and not (path == prefix or path.startswith(prefix + "/")):
+            continue
+        files = bundle_files(info["source"], info["module"])
+        rows.append({
+            "function": path,
+            "handler": info["module"],
+            "architecture": info["architecture"],
+            "memory": info["memory"],
+            "files": len(files),
+            "bytes": sum((pathlib.Path(info["source"]) / f).stat().st_size for f in files),
+            "importMs": round(import_ms(info["source"], info["module"]), 1) if measure else None,
+        })
+    return rows
+
+
+def format_report(rows):
+    lines = [f"{'function':<48}{'arch':>8}{'MB':>6}{'files':>7}{'KiB':>8}{'import ms':>11}"]
+    for r in rows:
+        ms = f"{r['importMs']:.1f}" if r["importMs"] is not None else "-"
+        lines.append(f"{r['function']:<48}{r['architecture']:>8}{r['memory']:>6}{r['files']:>7}"
+                     f"{r['bytes'] / 1024:>8.1f}{ms:>11}")
+    return "\n".join(lines)
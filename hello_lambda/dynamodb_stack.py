@@ -5,7 +5,7 @@ from aws_cdk import (
 from constructs import Construct
 
 class DynamoDBStack(Stack):
-    def __init__(self, scope: Construct, construct_id: str, **kwargs):
+    def __init__(self, scope: Construct, construct_id: str, *, active_index: bool = True, **kwargs):
         super().__init__(scope, construct_id, **kwargs)
 
         # 供 Crawler 與 CRUD API 使用的目標表
@@ -18,4 +18,28 @@ class DynamoDBStack(Stack):
             ),
             billing_mode=dynamodb.BillingMode.PAY_PER_REQUEST,
             table_name="CrawlerTargets",  # 固定名稱便於 Lambda 直接查
+            # alarm_mode=runtime 時由 stream 觸發，依目標新增 / 刪除管理 alarm
+            stream=dynamodb.StreamViewType.NEW_AND_OLD_IMAGES,
+        )
+
+        # Crawler 增量同步用：只查 updatedAt 之後有變動的目標
+        # （itemType = target#0..7，依 targetId 分 shard，避免所有寫入集中在同一個 GSI partition；見 target_items.py）
+        self.table.add_global_secondary_index(
+            index_name="UpdatedAtIndex",
+            partition_key=dynamodb.Attribute(name="itemType", type=dynamodb.AttributeType.STRING),
+            sort_key=dynamodb.Attribute(name="updatedAt", type=dynamodb.AttributeType.STRING),
+            projection_type=dynamodb.ProjectionType.ALL,
+        )
+
+        # GET /targets?active=... 用 Query 取代 Scan + Python 篩選（依 createdAt 排序分頁）
+        # CloudFormation 一次更新只能新增一個 GSI：已經存在的表要分兩次部署
+        # （先 -c active_index=false 只加 UpdatedAtIndex，再正常部署加上 ActiveIndex）；
+        # 沒有這個 index 時 list_targets 退回 Scan + FilterExpression
+        if not active_index:
+            return
+        self.table.add_global_secondary_index(
+            index_name="ActiveIndex",
+            partition_key=dynamodb.Attribute(name="activeStatus", type=dynamodb.AttributeType.STRING),
+            sort_key=dynamodb.Attribute(name="createdAt", type=dynamodb.AttributeType.STRING),
+            projection_type=dynamodb.ProjectionType.ALL,
         )
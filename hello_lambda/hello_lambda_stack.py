@@ -8,87 +8,219 @@ from aws_cdk import (
     aws_sns as sns,
     aws_sns_subscriptions as subs,
     aws_dynamodb as dynamodb,
+    aws_s3 as s3,
+    aws_apigateway as apigw,
+    aws_sqs as sqs,
+    aws_lambda_event_sources as lambda_events,
     CfnOutput,
     Duration,
     aws_codedeploy as codedeploy,
 )
 from aws_cdk.aws_cloudwatch_actions import SnsAction
 from constructs import Construct
+
+from hello_lambda.bundles import bundled_function
+from hello_lambda.shared_layer import shared_layer
 import json, pathlib
 
+# LatencyAnomalyScore 約等於「比平常慢幾個標準差」
+LATENCY_ANOMALY_THRESHOLD = 4
+# alarm_mode=runtime：所有探測中成功的比例低於此值時告警
+FLEET_AVAILABILITY_THRESHOLD = 0.95
+
+
+def _insights(query, label=None):
+    """CloudWatch Metrics Insights 查詢（SQL），以 metric math expression 放進 widget / alarm"""
+    return cloudwatch.MathExpression(expression=query, label=label or "", using_metrics={},
+                                     period=Duration.minutes(5))
+
+
 class HelloLambdaStack(Stack):
-    def __init__(self, scope: Construct, construct_id: str, *, table, **kwargs) -> None:
+    def __init__(self, scope: Construct, construct_id: str, *, table, fan_out: bool = False,
+                 numpy_layer_arn: str = None, alarm_mode: str = "static",
+                 function_config: dict = None, **kwargs) -> None:
         super().__init__(scope, construct_id, **kwargs)
 
+        # 預設值；每支 function 的 architecture / 記憶體可由 function_config 覆寫（見 bundles.py）
         memory_mb = 256
+        # 所有 Lambda 共用的 aws_clients（見 hello_lambda/layers/shared）
+        shared = shared_layer(self)
+        # 選用的 numpy layer：有的話 LatencyAnomalyScore 以矩陣運算整批計算，沒有則退回純 Python
+        # （numpy 含原生碼，layer 的架構必須與 crawler function 的 architecture 相同）
+        crawler_layers = [shared]
+        if numpy_layer_arn:
+            crawler_layers.append(_lambda.LayerVersion.from_layer_version_arn(self, "NumpyLayer", numpy_layer_arn))
 
-        # === 1) Crawler/Monitor Lambda（改：以 TABLE_NAME 讀 DynamoDB）===
-        monitor_function = _lambda.Function(
-            self, "WebsiteMonitorFunction",
-            runtime=_lambda.Runtime.PYTHON_3_12,
-            handler="lambda_function.handler",
-            code=_lambda.Code.from_asset("hello_lambda/lambda"),
-            timeout=Duration.seconds(60),
-            environment={
-                "TABLE_NAME": table.table_name,  # ✅ 讓 crawler 讀 DB
-                "TARGETS_FILE": "targets.json",  # 可選：保留本地 JSON 作為 fallback
-            },
-            memory_size=memory_mb,
+        # 每次 crawl 的探測結果（欄式批次檔，依小時分區，見 lambda/result_store.py），供歷史 / SLA 報表
+        results_bucket = s3.Bucket(
+            self, "ProbeResultsBucket",
+            encryption=s3.BucketEncryption.S3_MANAGED,
+            block_public_access=s3.BlockPublicAccess.BLOCK_ALL,
+            enforce_ssl=True,
+            lifecycle_rules=[s3.LifecycleRule(prefix="results/", expiration=Duration.days(400))],
         )
+        CfnOutput(self, "ProbeResultsBucketName", value=results_bucket.bucket_name)
 
-        # 允許 Lambda 寫入自訂 Metric 到 CloudWatch
-        monitor_function.add_to_role_policy(
-            iam.PolicyStatement(
-                actions=["cloudwatch:PutMetricData"],
-                resources=["*"]
-            )
+        # === 1) 排程（每分鐘一個 tick；每個目標依自己的間隔到期才探測，見 schedule.py）===
+        rule = events.Rule(
+            self, "WebsiteMonitorScheduleRule",
+            schedule=events.Schedule.rate(Duration.minutes(1))
         )
+        crawl_env = {
+            "TABLE_NAME": table.table_name,  # ✅ 讓 crawler 讀 DB
+            "TARGETS_FILE": "targets.json",  # 可選：保留本地 JSON 作為 fallback
+            "PROBE_MODE": "conditional",     # get / conditional / head
+            "BASE_INTERVAL_SECONDS": "300",  # 目標沒設 intervalSeconds 時的探測間隔
+            "METRICS_BACKEND": "emf",        # metric 以 EMF 寫進 log（api = PutMetricData）
+            "RESULTS_BUCKET": results_bucket.bucket_name,
+        }
 
-        # ✅ 允許 crawler 讀（或讀寫）DynamoDB
-        table.grant_read_data(monitor_function)
+        # === 2) Crawler Lambda ===
+        # deployed：(construct id 前綴, function, ProdAlias, 平均 duration 告警門檻 ms, 是否由每分鐘的 tick 觸發)，
+        # 每支都有自己的健康告警與 CodeDeploy 自動回滾（見 8)）
+        # tick 觸發的 function 是目標狀態（排程等）的唯一 owner，狀態在記憶體中：
+        # reserved concurrency 1 → 同一時間只有一個 container；前一個 tick 還沒跑完時被 throttle 的 tick，
+        # 1 分鐘內沒跑到就丟掉（下一個 tick 會補上），不會事後一次湧入
+        owner_settings = dict(reserved_concurrent_executions=1, max_event_age=Duration.minutes(1))
+        if not fan_out:
+            monitor_function = bundled_function(
+                self, "WebsiteMonitorFunction", config=function_config,
+                layers=crawler_layers,
+                handler="lambda_function.handler",
+                timeout=Duration.seconds(60),
+                environment=crawl_env,
+                memory_size=memory_mb,
+                **owner_settings,
+            )
 
-        # ✨ 別名（供 EventBridge & CodeDeploy）
-        alias = _lambda.Alias(
-            self, "CrawlerLambdaAlias",
-            alias_name="ProdAlias",
-            version=monitor_function.current_version
-        )
+            # 允許 Lambda 寫入自訂 Metric 到 CloudWatch
+            monitor_function.add_to_role_policy(
+                iam.PolicyStatement(
+                    actions=["cloudwatch:PutMetricData"],
+                    resources=["*"]
+                )
+            )
 
-        # === 2) 排程（每 5 分鐘觸發 alias）===
-        rule = events.Rule(
-            self, "WebsiteMonitorScheduleRule",
-            schedule=events.Schedule.rate(Duration.minutes(5))
-        )
-        rule.add_target(targets.LambdaFunction(alias))
+            # ✅ 允許 crawler 讀寫 DynamoDB（寫回每個目標的排程狀態 nextDueAt 等）
+            table.grant_read_write_data(monitor_function)
+            results_bucket.grant_put(monitor_function)
 
-        # === 3) 取得儀表板上要顯示的 URL 清單（可先從本地樣本抓，用於 Widget 維度）===
-        targets_path = pathlib.Path(__file__).resolve().parent / "lambda" / "targets.json"
-        if targets_path.exists():
-            urls = json.loads(targets_path.read_text(encoding="utf-8"))
+            # ✨ 別名（供 EventBridge & CodeDeploy）
+            alias = _lambda.Alias(
+                self, "CrawlerLambdaAlias",
+                alias_name="ProdAlias",
+                version=monitor_function.current_version
+            )
+            rule.add_target(targets.LambdaFunction(alias))
+            probe_function = monitor_function
+            deployed = [("Crawler", monitor_function, alias, 2000, True)]
         else:
-            urls = ["https://www.bbc.com/", "https://edition.cnn.com/", "https://www.news.com.au/", "https://idontexist12345.com/"]
+            # Fan-out 模式：dispatcher 把目標依 consistent hash 分 shard 丟進 SQS，worker 並行探測
+            crawl_dlq = sqs.Queue(self, "CrawlWorkDLQ", retention_period=Duration.days(4))
+            crawl_queue = sqs.Queue(
+                self, "CrawlWorkQueue",
+                visibility_timeout=Duration.seconds(360),   # >= worker timeout
+                dead_letter_queue=sqs.DeadLetterQueue(max_receive_count=2, queue=crawl_dlq),
+            )
+            # worker 的探測結果送回 dispatcher（目標狀態的唯一 owner），下一個 tick 讀回並寫回表
+            result_queue = sqs.Queue(
+                self, "CrawlResultQueue",
+                visibility_timeout=Duration.seconds(90),    # > dispatcher timeout：處理到一半失敗的批次會再被讀到
+                retention_period=Duration.hours(1),         # 讀不回來的結果就不要了，目標到期後會再被派送
+            )
+            dispatcher_fn = bundled_function(
+                self, "CrawlDispatcherFunction", config=function_config,
+                layers=crawler_layers,   # dispatcher 替 worker 送回的延遲評分（LatencyAnomalyScore）
+                handler="crawl_dispatcher.handler",
+                timeout=Duration.seconds(60),
+                environment=dict(crawl_env, WORK_QUEUE_URL=crawl_queue.queue_url,
+                                 RESULT_QUEUE_URL=result_queue.queue_url, TARGETS_PER_SHARD="50"),
+                memory_size=memory_mb,
+                **owner_settings,
+            )
+            table.grant_read_write_data(dispatcher_fn)
+            crawl_queue.grant_send_messages(dispatcher_fn)
+            result_queue.grant_consume_messages(dispatcher_fn)
+            dispatcher_fn.add_to_role_policy(iam.PolicyStatement(actions=["cloudwatch:PutMetricData"], resources=["*"]))
+
+            worker_fn = bundled_function(
+                self, "CrawlWorkerFunction", config=function_config,
+                layers=crawler_layers,
+                handler="crawl_worker.handler",
+                timeout=Duration.seconds(300),
+                environment=dict(crawl_env, RESULT_QUEUE_URL=result_queue.queue_url),
+                memory_size=memory_mb,
+            )
+            result_queue.grant_send_messages(worker_fn)
+            results_bucket.grant_put(worker_fn)
+            worker_fn.add_to_role_policy(iam.PolicyStatement(actions=["cloudwatch:PutMetricData"], resources=["*"]))
+
+            # EventBridge 與 SQS 都觸發 ProdAlias，CodeDeploy 才能分別對兩支做 canary / 回滾
+            dispatcher_alias = _lambda.Alias(self, "CrawlDispatcherAlias", alias_name="ProdAlias",
+                                             version=dispatcher_fn.current_version)
+            worker_alias = _lambda.Alias(self, "CrawlWorkerAlias", alias_name="ProdAlias",
+                                         version=worker_fn.current_version)
+            worker_alias.add_event_source(lambda_events.SqsEventSource(
+                crawl_queue, batch_size=1, report_batch_item_failures=True,
+            ))
+            rule.add_target(targets.LambdaFunction(dispatcher_alias))
+            CfnOutput(self, "CrawlWorkQueueUrl", value=crawl_queue.queue_url)
+            probe_function = worker_fn
+            # 一個 shard（約 TARGETS_PER_SHARD 個目標）平均應在 1 分鐘內探測完
+            deployed = [("CrawlDispatcher", dispatcher_fn, dispatcher_alias, 2000, True),
+                        ("CrawlWorker", worker_fn, worker_alias, 60000, False)]
+
+        # === 3) 取得儀表板上要顯示的 URL 清單（可先從本地樣本抓，用於 Widget 維度）===
+        # alarm_mode=runtime：不在 synth 時列舉目標，儀表板用 Metrics Insights 查詢、per-URL alarm 由 Lambda 管理
+        runtime_alarms = alarm_mode == "runtime"
+        urls = []
+        if not runtime_alarms:
+            targets_path = pathlib.Path(__file__).resolve().parent / "lambda" / "targets.json"
+            if targets_path.exists():
+                urls = json.loads(targets_path.read_text(encoding="utf-8"))
+            else:
+                urls = ["https://www.bbc.com/", "https://edition.cnn.com/", "https://www.news.com.au/", "https://idontexist12345.com/"]
 
         # === 4) CloudWatch Dashboard ===
         dashboard = cloudwatch.Dashboard(self, "WebsiteHealthDashboard", dashboard_name="WebsiteHealthDashboard")
 
-        latency_metrics = [
-            cloudwatch.Metric(namespace="WebsiteMonitor", metric_name="Latency", dimensions_map={"URL": url})
-            for url in urls
-        ]
-        dashboard.add_widgets(cloudwatch.GraphWidget(title="Website Latency (seconds)", left=latency_metrics, width=24))
+        if runtime_alarms:
+            # 每個 widget 是一個查詢，不隨目標數增加；SCHEMA(WebsiteMonitor, URL) 涵蓋所有 URL
+            fleet_availability = _insights("SELECT AVG(IsSuccess) FROM SCHEMA(WebsiteMonitor, URL)", "Fleet availability")
+            dashboard.add_widgets(
+                cloudwatch.GraphWidget(title="Top 10 slowest sites (avg latency, s)", width=12, left=[_insights(
+                    "SELECT AVG(Latency) FROM SCHEMA(WebsiteMonitor, URL) GROUP BY URL ORDER BY AVG() DESC LIMIT 10")]),
+                cloudwatch.GraphWidget(title="Top 10 latency anomalies (score)", width=12, left=[_insights(
+                    "SELECT MAX(LatencyAnomalyScore) FROM SCHEMA(WebsiteMonitor, URL) GROUP BY URL ORDER BY MAX() DESC LIMIT 10")]),
+            )
+            dashboard.add_widgets(
+                cloudwatch.GraphWidget(title="Fleet availability (share of successful probes)", width=12,
+                                       left=[fleet_availability]),
+                cloudwatch.GraphWidget(title="10 least available sites", width=12, left=[_insights(
+                    "SELECT AVG(IsSuccess) FROM SCHEMA(WebsiteMonitor, URL) GROUP BY URL ORDER BY AVG() ASC LIMIT 10")]),
+            )
+            dashboard.add_widgets(cloudwatch.GraphWidget(title="Top 10 content changes (ratio)", width=24, left=[_insights(
+                "SELECT MAX(ContentChangeRatio) FROM SCHEMA(WebsiteMonitor, URL) GROUP BY URL ORDER BY MAX() DESC LIMIT 10")]))
+        else:
+            latency_metrics = [
+                cloudwatch.Metric(namespace="WebsiteMonitor", metric_name="Latency", dimensions_map={"URL": url})
+                for url in urls
+            ]
+            dashboard.add_widgets(cloudwatch.GraphWidget(title="Website Latency (seconds)", left=latency_metrics, width=24))
 
-        is_success_metrics = [
-            cloudwatch.Metric(namespace="WebsiteMonitor", metric_name="IsSuccess", dimensions_map={"URL": url})
-            for url in urls
-        ]
-        dashboard.add_widgets(cloudwatch.GraphWidget(title="Website Availability (1=Success, 0=Fail)", left=is_success_metrics, width=24))
+            is_success_metrics = [
+                cloudwatch.Metric(namespace="WebsiteMonitor", metric_name="IsSuccess", dimensions_map={"URL": url})
+                for url in urls
+            ]
+            dashboard.add_widgets(cloudwatch.GraphWidget(title="Website Availability (1=Success, 0=Fail)", left=is_success_metrics, width=24))
 
         crawler_runtime_metric = cloudwatch.Metric(
             namespace="WebsiteMonitorCrawler", metric_name="RunTimeMs", statistic="Average", period=Duration.minutes(5)
         )
         dashboard.add_widgets(cloudwatch.GraphWidget(title="Crawler RunTime (ms)", left=[crawler_runtime_metric], width=24))
 
-        lambda_max_mem_metric = monitor_function.metric(metric_name="MaxMemoryUsed", statistic="Maximum", period=Duration.minutes(5))
+        # 負責探測的 function（單機模式的 crawler / fan-out 的 worker）
+        lambda_max_mem_metric = probe_function.metric(metric_name="MaxMemoryUsed", statistic="Maximum", period=Duration.minutes(5))
         dashboard.add_widgets(cloudwatch.GraphWidget(title="Lambda MaxMemoryUsed (MB)", left=[lambda_max_mem_metric], width=24))
 
         # === 5) SNS 通知 ===
@@ -115,9 +247,47 @@ class HelloLambdaStack(Stack):
         lambda_memory_alarm.add_alarm_action(SnsAction(alarm_topic))
 
         CfnOutput(self, "DashboardName", value=dashboard.dashboard_name)
-        CfnOutput(self, "LambdaFunctionName", value=monitor_function.function_name)
+        CfnOutput(self, "LambdaFunctionName", value=probe_function.function_name)
 
         # === 6) 針對每個 URL 建 Availability / Latency 告警 ===
+        # 延遲告警看 LatencyAnomalyScore（相對於該網站自己的延遲歷史），而不是所有網站共用的固定秒數
+        if runtime_alarms:
+            # 整體可用率的 alarm（一個 Metrics Insights 查詢涵蓋所有目標）
+            fleet_alarm = cloudwatch.Alarm(
+                self, "FleetAvailabilityLow",
+                metric=fleet_availability, threshold=FLEET_AVAILABILITY_THRESHOLD, evaluation_periods=2,
+                comparison_operator=cloudwatch.ComparisonOperator.LESS_THAN_THRESHOLD,
+                alarm_description=f"Less than {FLEET_AVAILABILITY_THRESHOLD:.0%} of website probes succeed!",
+                treat_missing_data=cloudwatch.TreatMissingData.IGNORE,
+            )
+            fleet_alarm.add_alarm_action(SnsAction(alarm_topic))
+
+            # per-URL alarm：CrawlerTargets 的 stream 觸發，目標新增 / 刪除時建立 / 移除
+            alarm_manager_fn = bundled_function(
+                self, "TargetAlarmManagerFunction", config=function_config,
+                layers=[shared],
+                handler="target_alarms.handler",
+                timeout=Duration.minutes(5),
+                environment={
+                    "TABLE_NAME": table.table_name,
+                    "ALARM_TOPIC_ARN": alarm_topic.topic_arn,
+                    "LATENCY_ANOMALY_THRESHOLD": str(LATENCY_ANOMALY_THRESHOLD),
+                },
+            )
+            alarm_manager_fn.add_to_role_policy(iam.PolicyStatement(
+                actions=["cloudwatch:PutMetricAlarm", "cloudwatch:DeleteAlarms"],
+                resources=[f"arn:aws:cloudwatch:{self.region}:{self.account}:alarm:WebsiteMonitor-*"],
+            ))
+            alarm_manager_fn.add_to_role_policy(iam.PolicyStatement(actions=["cloudwatch:DescribeAlarms"], resources=["*"]))
+            table.grant_read_data(alarm_manager_fn)
+            # crawler 每次探測都會寫回排程狀態，stream 很頻繁：批次處理，沒變 url / active 的紀錄直接略過
+            alarm_manager_fn.add_event_source(lambda_events.DynamoEventSource(
+                table, starting_position=_lambda.StartingPosition.LATEST,
+                batch_size=1000, max_batching_window=Duration.minutes(1),
+                bisect_batch_on_error=True, retry_attempts=5,
+            ))
+            CfnOutput(self, "TargetAlarmManagerName", value=alarm_manager_fn.function_name)
+
         for url in urls:
             is_success_metric = cloudwatch.Metric(
                 namespace="WebsiteMonitor", metric_name="IsSuccess", dimensions_map={"URL": url},
@@ -128,18 +298,23 @@ class HelloLambdaStack(Stack):
                 metric=is_success_metric, threshold=1, evaluation_periods=2,
                 comparison_operator=cloudwatch.ComparisonOperator.LESS_THAN_THRESHOLD,
                 alarm_description=f"Website {url} is unavailable!", actions_enabled=True,
+                # 失敗中的目標會拉長探測間隔，沒有資料的期間維持原本狀態
+                treat_missing_data=cloudwatch.TreatMissingData.IGNORE,
             )
             availability_alarm.add_alarm_action(SnsAction(alarm_topic))
 
-            latency_metric = cloudwatch.Metric(
-                namespace="WebsiteMonitor", metric_name="Latency", dimensions_map={"URL": url},
+            anomaly_metric = cloudwatch.Metric(
+                namespace="WebsiteMonitor", metric_name="LatencyAnomalyScore", dimensions_map={"URL": url},
                 statistic="Average", period=Duration.minutes(5)
             )
             latency_alarm = cloudwatch.Alarm(
                 self, f"LatencyAlarm_{url.replace('https://','').replace('.','_').replace('/','_')}",
-                metric=latency_metric, threshold=1.0, evaluation_periods=3,
+                metric=anomaly_metric, threshold=LATENCY_ANOMALY_THRESHOLD,
+                evaluation_periods=3, datapoints_to_alarm=2,
                 comparison_operator=cloudwatch.ComparisonOperator.GREATER_THAN_THRESHOLD,
-                alarm_description=f"Website {url} latency > 1.0s!", actions_enabled=True,
+                alarm_description=f"Website {url} latency is anomalous (score > {LATENCY_ANOMALY_THRESHOLD})!",
+                actions_enabled=True,
+                treat_missing_data=cloudwatch.TreatMissingData.IGNORE,
             )
             latency_alarm.add_alarm_action(SnsAction(alarm_topic))
 
@@ -152,48 +327,123 @@ class HelloLambdaStack(Stack):
             billing_mode=dynamodb.BillingMode.PAY_PER_REQUEST,
             table_name="WebHealthAlarmsTable",
         )
+        # 「最近 N 小時所有進入 ALARM 的事件」用：NewStateValue + 時間
+        alarm_table.add_global_secondary_index(
+            index_name="StateTimeIndex",
+            partition_key=dynamodb.Attribute(name="NewStateValue", type=dynamodb.AttributeType.STRING),
+            sort_key=dynamodb.Attribute(name="StateChangeTime", type=dynamodb.AttributeType.STRING),
+            projection_type=dynamodb.ProjectionType.ALL,
+        )
         CfnOutput(self, "AlarmTableName", value=alarm_table.table_name)
 
+        # 每個 alarm 每天的計數（MTTR / flap 次數儀表板直接讀這裡，不用掃歷史）
+        rollup_table = dynamodb.Table(
+            self,
+            "WebHealthAlarmRollups",
+            partition_key=dynamodb.Attribute(name="AlarmName", type=dynamodb.AttributeType.STRING),
+            sort_key=dynamodb.Attribute(name="Period", type=dynamodb.AttributeType.STRING),
+            billing_mode=dynamodb.BillingMode.PAY_PER_REQUEST,
+            table_name="WebHealthAlarmRollups",
+        )
+
         # Alarm Logger Lambda（SNS → Lambda → DynamoDB）
-        alarm_logger_fn = _lambda.Function(
-            self, "AlarmLoggerFunction",
-            runtime=_lambda.Runtime.PYTHON_3_12,
+        alarm_logger_fn = bundled_function(
+            self, "AlarmLoggerFunction", config=function_config,
+            layers=[shared],
             handler="alarm_logger.handler",
-            code=_lambda.Code.from_asset("hello_lambda/alarm_logger"),
+            source="hello_lambda/alarm_logger",
             timeout=Duration.seconds(30),
-            environment={"TABLE_NAME": alarm_table.table_name},
+            environment={"TABLE_NAME": alarm_table.table_name, "ROLLUP_TABLE_NAME": rollup_table.table_name},
+            # 寫入失敗時 handler 會 raise：SNS 的非同步呼叫重試 2 次，仍失敗的事件進 DLQ
+            retry_attempts=2,
+            dead_letter_queue_enabled=True,
         )
         alarm_table.grant_write_data(alarm_logger_fn)
+        rollup_table.grant_read_write_data(alarm_logger_fn)
         alarm_topic.add_subscription(subs.LambdaSubscription(alarm_logger_fn))
 
-        # === 8) Lambda 自身健康監控 + CodeDeploy 自動回滾 ===
-        lambda_invocations_alarm = cloudwatch.Alarm(
-            self, "CrawlerLambdaInvocationsAlarm",
-            metric=monitor_function.metric_invocations(), threshold=5, evaluation_periods=1,
-            comparison_operator=cloudwatch.ComparisonOperator.GREATER_THAN_THRESHOLD,
-            alarm_description="Crawler Lambda invoked too frequently."
+        # Alarm 歷史查詢 API（唯讀）
+        alarm_history_fn = bundled_function(
+            self, "AlarmHistoryFunction", config=function_config,
+            layers=[shared],
+            handler="alarm_history.handler",
+            source="hello_lambda/alarm_logger",
+            timeout=Duration.seconds(30),
+            environment={"TABLE_NAME": alarm_table.table_name, "ROLLUP_TABLE_NAME": rollup_table.table_name},
         )
-        lambda_duration_alarm = cloudwatch.Alarm(
-            self, "CrawlerLambdaDurationAlarm",
-            metric=monitor_function.metric_duration(), threshold=2000, evaluation_periods=1,
-            comparison_operator=cloudwatch.ComparisonOperator.GREATER_THAN_THRESHOLD,
-            alarm_description="Crawler Lambda average duration too high."
+        alarm_table.grant_read_data(alarm_history_fn)
+        rollup_table.grant_read_data(alarm_history_fn)
+
+        alarm_api = apigw.RestApi(
+            self, "AlarmHistoryApi",
+            deploy_options=apigw.StageOptions(metrics_enabled=True),
         )
-        lambda_errors_alarm = cloudwatch.Alarm(
-            self, "CrawlerLambdaErrorsAlarm",
-            metric=monitor_function.metric_errors(), threshold=1, evaluation_periods=1,
-            comparison_operator=cloudwatch.ComparisonOperator.GREATER_THAN_THRESHOLD,
-            alarm_description="Crawler Lambda has errors."
+        history_integration = apigw.LambdaIntegration(alarm_history_fn)
+        alarms = alarm_api.root.add_resource("alarms")
+        alarms.add_resource("transitions").add_method("GET", history_integration)   # ?state=ALARM&hours=N
+        alarm_name = alarms.add_resource("{alarmName}")
+        alarm_name.add_resource("history").add_method("GET", history_integration)   # ?from=t1&to=t2
+        alarm_name.add_resource("rollups").add_method("GET", history_integration)   # ?from=day&to=day
+        CfnOutput(self, "AlarmHistoryApiUrl", value=alarm_api.url)
+
+        # NDJSON 匯出（手動觸發：event = {"table": "targets" | "alarms", "gzip": true}）
+        export_bucket = s3.Bucket(
+            self, "ExportBucket",
+            encryption=s3.BucketEncryption.S3_MANAGED,
+            block_public_access=s3.BlockPublicAccess.BLOCK_ALL,
+            enforce_ssl=True,
         )
-        for a in [lambda_invocations_alarm, lambda_duration_alarm, lambda_errors_alarm]:
-            a.add_alarm_action(SnsAction(alarm_topic))
-
-        codedeploy.LambdaDeploymentGroup(
-            self, "CrawlerDeploymentGroup",
-            alias=alias,
-            alarms=[lambda_invocations_alarm, lambda_duration_alarm, lambda_errors_alarm, crawler_runtime_alarm, lambda_memory_alarm],
-            auto_rollback=codedeploy.AutoRollbackConfig(
-                failed_deployment=True, stopped_deployment=True, deployment_in_alarm=True
-            ),
-            deployment_config=codedeploy.LambdaDeploymentConfig.CANARY_10_PERCENT_5_MINUTES,
+        export_fn = bundled_function(
+            self, "ExportFunction", config=function_config,
+            layers=[shared],
+            handler="export_items.handler",
+            timeout=Duration.minutes(15),
+            memory_size=512,
+            environment={
+                "TARGETS_TABLE": table.table_name,
+                "ALARMS_TABLE": alarm_table.table_name,
+                "EXPORT_BUCKET": export_bucket.bucket_name,
+            },
         )
+        table.grant_read_data(export_fn)
+        alarm_table.grant_read_data(export_fn)
+        export_bucket.grant_put(export_fn)
+        CfnOutput(self, "ExportBucketName", value=export_bucket.bucket_name)
+
+        # === 8) Lambda 自身健康監控 + CodeDeploy 自動回滾（每支 crawler function 各一組）===
+        for prefix, fn, fn_alias, duration_ms, ticked in deployed:
+            health_alarms = []
+            if ticked:
+                health_alarms.append(cloudwatch.Alarm(
+                    self, f"{prefix}LambdaInvocationsAlarm",
+                    # 每分鐘一個 tick → 5 分鐘內正常是 5 次，保留一點餘裕
+                    metric=fn.metric_invocations(), threshold=10, evaluation_periods=1,
+                    comparison_operator=cloudwatch.ComparisonOperator.GREATER_THAN_THRESHOLD,
+                    alarm_description=f"{prefix} Lambda invoked too frequently."
+                ))
+            health_alarms.append(cloudwatch.Alarm(
+                self, f"{prefix}LambdaDurationAlarm",
+                metric=fn.metric_duration(), threshold=duration_ms, evaluation_periods=1,
+                comparison_operator=cloudwatch.ComparisonOperator.GREATER_THAN_THRESHOLD,
+                alarm_description=f"{prefix} Lambda average duration too high."
+            ))
+            health_alarms.append(cloudwatch.Alarm(
+                self, f"{prefix}LambdaErrorsAlarm",
+                metric=fn.metric_errors(), threshold=1, evaluation_periods=1,
+                comparison_operator=cloudwatch.ComparisonOperator.GREATER_THAN_THRESHOLD,
+                alarm_description=f"{prefix} Lambda has errors."
+            ))
+            for a in health_alarms:
+                a.add_alarm_action(SnsAction(alarm_topic))
+
+            codedeploy.LambdaDeploymentGroup(
+                self, f"{prefix}DeploymentGroup",
+                alias=fn_alias,
+                alarms=health_alarms + [crawler_runtime_alarm, lambda_memory_alarm],
+                auto_rollback=codedeploy.AutoRollbackConfig(
+                    failed_deployment=True, stopped_deployment=True, deployment_in_alarm=True
+                ),
+                # canary 期間新舊版本輪流處理 tick，各有一份記憶體中的排程 → 狀態 owner 一次切換
+                deployment_config=(codedeploy.LambdaDeploymentConfig.ALL_AT_ONCE if ticked
+                                   else codedeploy.LambdaDeploymentConfig.CANARY_10_PERCENT_5_MINUTES),
+            )
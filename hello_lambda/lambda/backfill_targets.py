@@ -0,0 +1,97 @@
+# backfill_targets.py
+# 補齊在 GSI 加入之前建立的 CrawlerTargets 項目（可重複執行，沒有缺欄位的項目不會被寫）：
+#   - activeStatus：ActiveIndex 的 PK；沒有這個欄位的項目不會出現在 GET /targets?active=...
+#   - itemType：UpdatedAtIndex 的 PK（target#0..7）；沒有或還是舊值 "target" 的改成分 shard 的值
+# 平行 segmented scan，只對需要的項目做條件式 UpdateItem：
+#   不改 updatedAt；掃描之後 active 被 API 改過的項目略過（API 的更新本身就會寫入這兩個欄位）。
+#
+# 部署 ActiveIndex 之後跑一次：
+#   python hello_lambda/lambda/backfill_targets.py --table CrawlerTargets
+import argparse
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+from botocore.exceptions import ClientError
+
+try:
+    import aws_clients
+except ImportError:   # 本地執行 CLI：shared layer 不在 /opt/python
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "layers", "shared", "python"))
+    import aws_clients
+from target_items import item_type
+
+PROJECTION = ["targetId", "active", "activeStatus", "itemType"]
+
+
+def missing_fields(item):
+    """項目缺少 / 過時的 GSI key（沒有則為空 dict）"""
+    active = bool(item.get("active", True))
+    fields = {}
+    if item.get("activeStatus") != ("true" if active else "false"):
+        fields["activeStatus"] = "true" if active else "false"
+    if item.get("itemType") != item_type(item["targetId"]):
+        fields["itemType"] = item_type(item["targetId"])
+    return fields
+
+
+def _update(table, item, fields):
+    names = {f"#f{i}": k for i, k in enumerate(fields)}
+    values = {f":v{i}": v for i, v in enumerate(fields.values())}
+    names["#a"] = "active"
+    if "active" in item:
+        condition = "attribute_exists(targetId) AND #a = :active"
+        values[":active"] = item["active"]
+    else:
+        condition = "attribute_exists(targetId) AND attribute_not_exists(#a)"
+    try:
+        table.update_item(
+            Key={"targetId": item["targetId"]},
+            UpdateExpression="SET " + ", ".join(f"#f{i} = :v{i}" for i in range(len(fields))),
+            ConditionExpression=condition,
+            ExpressionAttributeNames=names,
+            ExpressionAttributeValues=values,
+        )
+        return "updated"
+    except ClientError as e:
+        if e.response["Error"]["Code"] == "ConditionalCheckFailedException":
+            return "changed"   # 已被刪除或 active 剛被改過
+        raise
+
+
+def _backfill_segment(table, segment, total_segments):
+    names = {f"#p{i}": name for i, name in enumerate(PROJECTION)}
+    kwargs = {"ProjectionExpression": ", ".join(names), "ExpressionAttributeNames": names,
+              "Segment": segment, "TotalSegments": total_segments}
+    counts = {"scanned": 0, "updated": 0, "changed": 0}
+    while True:
+        resp = table.scan(**kwargs)
+        for item in resp.get("Items", []):
+            counts["scanned"] += 1
+            fields = missing_fields(item)
+            if fields:
+                counts[_update(table, item, fields)] += 1
+        if "LastEvaluatedKey" not in resp:
+            return counts
+        kwargs["ExclusiveStartKey"] = resp["LastEvaluatedKey"]
+
+
+def backfill(table, total_segments=4):
+    """回傳 {"scanned", "updated", "changed"} 筆數"""
+    with ThreadPoolExecutor(max_workers=total_segments) as pool:
+        segments = list(pool.map(lambda s: _backfill_segment(table, s, total_segments), range(total_segments)))
+    return {k: sum(c[k] for c in segments) for k in segments[0]}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Backfill activeStatus / itemType on existing CrawlerTargets items.")
+    parser.add_argument("--table", default="CrawlerTargets", help="DynamoDB table name")
+    parser.add_argument("--segments", type=int, default=4, help="parallel scan segments")
+    args = parser.parse_args(argv)
+    counts = backfill(aws_clients.table(args.table), total_segments=args.segments)
+    print(f"scanned {counts['scanned']} items, updated {counts['updated']}, "
+          f"skipped {counts['changed']} changed concurrently", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
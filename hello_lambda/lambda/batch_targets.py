@@ -0,0 +1,135 @@
+import os, json, time, random
+from instrumentation import elapsed_ms, instrumented, phase
+import aws_clients
+import stage_cache
+from concurrent.futures import ThreadPoolExecutor
+from botocore.exceptions import ClientError
+from target_items import UPDATABLE_FIELDS, json_default, new_item, update_kwargs
+
+TABLE_NAME = os.environ["TABLE_NAME"]
+table = aws_clients.table(TABLE_NAME)   # client 第一次呼叫時才建立
+
+MAX_ITEMS = 1000          # 單一請求最多幾筆
+BATCH_SIZE = 25           # BatchWriteItem 上限
+MAX_ATTEMPTS = 8          # UnprocessedItems 重試次數
+WRITE_CONCURRENCY = int(os.getenv("BATCH_WRITE_CONCURRENCY", "8"))
+UPDATE_CONCURRENCY = int(os.getenv("BATCH_UPDATE_CONCURRENCY", "16"))
+THROTTLE_CODES = {"ProvisionedThroughputExceededException", "ThrottlingException", "RequestLimitExceeded"}
+THROTTLED = "write throttled, retry later"
+
+def _key_of(request):
+    if "PutRequest" in request:
+        return request["PutRequest"]["Item"]["targetId"]
+    return request["DeleteRequest"]["Key"]["targetId"]
+
+def _write_chunk(requests):
+    """
+    送出一批（<=25）寫入；UnprocessedItems 以 exponential backoff 重試。
+    回傳最後仍失敗的 {targetId: (statusCode, error)}；整批呼叫失敗（ClientError）時這批全部算失敗，其他批不受影響
+    """
+    pending = requests
+    for attempt in range(MAX_ATTEMPTS):
+        try:
+            resp = table.meta.client.batch_write_item(RequestItems={TABLE_NAME: pending})
+        except ClientError as e:
+            code = e.response["Error"]["Code"]
+            print(f"⚠️ BatchWriteItem failed for {len(pending)} items: {code}")
+            failure = (503, THROTTLED) if code in THROTTLE_CODES else (500, code)
+            return {_key_of(r): failure for r in pending}
+        pending = resp.get("UnprocessedItems", {}).get(TABLE_NAME, [])
+        if not pending:
+            return {}
+        time.sleep(random.uniform(0, 0.05 * (2 ** attempt)))
+    return {_key_of(r): (503, THROTTLED) for r in pending}
+
+def batch_write(requests):
+    """requests 依 25 筆切批並行送出；回傳寫入失敗的 {targetId: (statusCode, error)}"""
+    chunks = [requests[i:i + BATCH_SIZE] for i in range(0, len(requests), BATCH_SIZE)]
+    failed = {}
+    with ThreadPoolExecutor(max_workers=WRITE_CONCURRENCY) as pool:
+        for f in pool.map(_write_chunk, chunks):
+            failed.update(f)
+    return failed
+
+def _create(body):
+    results, requests = [], []
+    for i, entry in enumerate(body.get("items") or []):
+        item = new_item(entry) if isinstance(entry, dict) else None
+        if not item:
+            results.append({"index": i, "statusCode": 400, "error": "url is required"})
+            continue
+        results.append({"index": i, "statusCode": 201, "item": item})
+        requests.append({"PutRequest": {"Item": item}})
+    failed = batch_write(requests)
+    for r in results:
+        if r["statusCode"] == 201 and r["item"]["targetId"] in failed:
+            status, error = failed[r["item"]["targetId"]]
+            r.update(statusCode=status, error=error)
+            del r["item"]
+    return results
+
+def _delete(body):
+    ids = [t for t in (body.get("targetIds") or []) if isinstance(t, str) and t]
+    # BatchWriteItem 不允許同一批有重複 key
+    unique = list(dict.fromkeys(ids))
+    failed = batch_write([{"DeleteRequest": {"Key": {"targetId": t}}} for t in unique])
+    return [{"index": i, "targetId": t, "statusCode": failed[t][0], "error": failed[t][1]} if t in failed
+            else {"index": i, "targetId": t, "statusCode": 204}
+            for i, t in enumerate(ids)]
+
+def _update_one(entry):
+    target_id = entry.get("targetId") if isinstance(entry, dict) else None
+    fields = {k: v for k, v in (entry or {}).items() if k in UPDATABLE_FIELDS} if target_id else {}
+    if not fields:
+        return {"targetId": target_id, "statusCode": 400, "error": "targetId and updatable fields are required"}
+    try:
+        resp = table.update_item(
+            Key={"targetId": target_id},
+            ConditionExpression="attribute_exists(targetId)",
+            ReturnValues="ALL_NEW",
+            **update_kwargs(target_id, fields),
+        )
+    except ClientError as e:
+        if e.response["Error"]["Code"] == "ConditionalCheckFailedException":
+            return {"targetId": target_id, "statusCode": 404, "error": "not found"}
+        return {"targetId": target_id, "statusCode": 500, "error": e.response["Error"]["Code"]}
+    return {"targetId": target_id, "statusCode": 200, "item": resp["Attributes"]}
+
+def _update(body):
+    # 條件式更新無法用 BatchWriteItem，改成並行的 UpdateItem
+    entries = body.get("items") or []
+    with ThreadPoolExecutor(max_workers=UPDATE_CONCURRENCY) as pool:
+        results = list(pool.map(_update_one, entries))
+    return [dict(r, index=i) for i, r in enumerate(results)]
+
+OPERATIONS = {"POST": _create, "PUT": _update, "DELETE": _delete}
+
+@instrumented("batch_targets")
+def handler(event, context):
+    op = OPERATIONS.get(event.get("httpMethod"))
+    if op is None:
+        return {"statusCode": 405, "body": json.dumps({"error": "method not allowed"})}
+    try:
+        with phase("parse"):
+            body = json.loads(event.get("body") or "{}")
+    except ValueError:
+        return {"statusCode": 400, "body": json.dumps({"error": "invalid JSON body"})}
+    if not isinstance(body, dict):
+        return {"statusCode": 400, "body": json.dumps({"error": "request body must be a JSON object"})}
+    entries = body.get("targetIds") if event["httpMethod"] == "DELETE" else body.get("items")
+    if not isinstance(entries, list) or not entries:
+        return {"statusCode": 400, "body": json.dumps({"error": "a non-empty items/targetIds list is required"})}
+    if len(entries) > MAX_ITEMS:
+        return {"statusCode": 400, "body": json.dumps({"error": f"at most {MAX_ITEMS} entries per request"})}
+
+    with phase("dynamo"):
+        results = op(body)
+    ok = sum(1 for r in results if r["statusCode"] < 300)
+    if ok:
+        with phase("cache"):
+            stage_cache.invalidate()
+    with phase("serialize"):
+        body = json.dumps({
+            "results": results, "succeeded": ok, "failed": len(results) - ok, "dynamoLatencyMs": elapsed_ms("dynamo"),
+        }, default=json_default)
+    return {"statusCode": 200, "body": body}
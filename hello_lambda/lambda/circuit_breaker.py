@@ -0,0 +1,55 @@
+# circuit_breaker.py
+# 每個目標的 circuit breaker：長時間連不上的目標不再每次等到 timeout，
+#   - closed：正常探測；連續失敗 BREAKER_FAILURE_THRESHOLD 次後轉 open
+#   - open：冷卻期間不連網路，直接記為失敗（仍送 IsSuccess=0，availability alarm 不受影響）
+#   - half_open：冷卻結束後只做一次短 timeout 的試探；成功回到 closed，失敗再 open 且冷卻時間加倍
+# 狀態存在目標上（breakerState / breakerUntil / breakerCooldown），與排程狀態一起寫回 CrawlerTargets。
+# 表裡只存 closed / open；open 且 breakerUntil 已過就是 half_open。
+import os
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("BREAKER_FAILURE_THRESHOLD", "3"))
+BREAKER_COOLDOWN_SECONDS = int(os.getenv("BREAKER_COOLDOWN_SECONDS", "900"))
+MAX_COOLDOWN_SECONDS = int(os.getenv("BREAKER_MAX_COOLDOWN_SECONDS", "14400"))
+# 試探用的 timeout：活著的網站幾秒內一定回得來，死掉的不必等滿 PROBE_TIMEOUT
+TRIAL_TIMEOUT = float(os.getenv("BREAKER_TRIAL_TIMEOUT", "3"))
+BREAKER_FIELDS = ["breakerState", "breakerUntil", "breakerCooldown"]
+# 同一個 URL 有多個目標時，以最「寬鬆」的狀態為準
+_PRIORITY = [CLOSED, HALF_OPEN, OPEN]
+
+
+def state(target, now):
+    if target.get("breakerState") != OPEN:
+        return CLOSED
+    return HALF_OPEN if now >= int(target.get("breakerUntil") or 0) else OPEN
+
+
+def url_states(targets, now):
+    """{url: 狀態}（保留順序）"""
+    out = {}
+    for t in targets:
+        s = state(t, now)
+        prev = out.get(t["url"])
+        out[t["url"]] = s if prev is None else min(prev, s, key=_PRIORITY.index)
+    return out
+
+
+def transition(target, success, failures, now, short_circuited=False):
+    """
+    依本次結果算出要寫回的 breaker 欄位（沒變則為空）。
+    failures 是更新後的 consecutiveFailures；short_circuited 表示本次沒有真的探測（open 期間）。
+    """
+    current = state(target, now)
+    if short_circuited:
+        return {}
+    if success:
+        if target.get("breakerState") in (None, CLOSED):
+            return {}
+        return {"breakerState": CLOSED, "breakerUntil": 0, "breakerCooldown": 0}
+    if current == HALF_OPEN:
+        cooldown = min(int(target.get("breakerCooldown") or BREAKER_COOLDOWN_SECONDS) * 2, MAX_COOLDOWN_SECONDS)
+    elif current == CLOSED and failures >= BREAKER_FAILURE_THRESHOLD:
+        cooldown = BREAKER_COOLDOWN_SECONDS
+    else:
+        return {}
+    return {"breakerState": OPEN, "breakerUntil": int(now + cooldown), "breakerCooldown": cooldown}
@@ -0,0 +1,143 @@
+# content_fingerprint.py
+# 頁面內容的指紋，用來量測「內容變了多少」而不用保存整頁：
+#   - 串流：http_probe 每讀一個 chunk 就 update()，不把 body 放進記憶體
+#   - body 切成 token（英數字與 UTF-8 多位元組字元），每 SHINGLE 個連續 token 為一個 shingle，
+#     shingle hash 以 rolling hash（buzhash）在視窗滑動時 O(1) 更新
+#   - SimHash：64 個 bit 各自統計「有幾個 shingle hash 在這個 bit 是 1」，過半則指紋該 bit 為 1；
+#     計數器用 bit-sliced 方式存（第 j 個整數是所有 64 個計數器的第 j 個 bit），每個 shingle 只要幾次整數運算
+# 指紋只有 64 bit（16 字元 hex），直接存在 CrawlerTargets 的 contentSimhash 欄位。
+import hashlib
+import re
+from collections import deque
+
+SHINGLE = 4
+BITS = 64
+MASK = (1 << BITS) - 1
+# 只看前 2 MB：大型檔案的變化看開頭就夠，也避免 CPU 時間隨 body 大小無上限成長
+MAX_BYTES = 2 * 1024 * 1024
+# 超長 token（例如 base64 圖片）只取前段，跨 chunk 的殘留也以此為上限
+MAX_TOKEN = 64
+FINGERPRINT_FIELD = "contentSimhash"
+
+_TOKEN = re.compile(rb"[0-9A-Za-z\x80-\xff]+")
+
+
+def _rotl(x, r):
+    r %= BITS
+    return ((x << r) | (x >> (BITS - r))) & MASK
+
+
+class SimHasher:
+    def __init__(self, shingle=SHINGLE, max_bytes=MAX_BYTES):
+        self.shingle = shingle
+        self.max_bytes = max_bytes
+        self.count = 0            # 已加入的 shingle 數
+        self._seen = 0
+        self._tail = b""          # 上一個 chunk 結尾還沒結束的 token
+        self._window = deque()    # 目前視窗內的 token hash
+        self._rolling = 0
+        self._planes = []         # bit-sliced 計數器
+        self._token_hashes = {}   # HTML 的 token 大量重複，hash 結果快取
+
+    @staticmethod
+    def _token_hash(token):
+        return int.from_bytes(hashlib.blake2b(token, digest_size=8).digest(), "big")
+
+    def _add(self, x):
+        # 64 個計數器同時 +1 bit：逐 plane 做加法進位，平均只要兩三次迭代
+        planes = self._planes
+        for i in range(len(planes)):
+            if not x:
+                return
+            p = planes[i]
+            planes[i] = p ^ x
+            x &= p
+        if x:
+            planes.append(x)
+
+    def _push(self, tokens):
+        # 熱迴圈：全部用區域變數，每個 token 只做幾次整數運算
+        shingle, window, rolling, count = self.shingle, self._window, self._rolling, self.count
+        cache, planes = self._token_hashes, self._planes
+        for token in tokens:
+            h = cache.get(token)
+            if h is None:
+                h = self._token_hash(token[:MAX_TOKEN])
+                cache[token] = h
+            # buzhash：整體左旋 1 位，移出視窗的 token 旋轉 shingle 位後 XOR 掉
+            rolling = (((rolling << 1) | (rolling >> (BITS - 1))) & MASK) ^ h
+            window.append(h)
+            if len(window) > shingle:
+                rolling ^= _rotl(window.popleft(), shingle)
+            if len(window) == shingle:
+                # 64 個計數器同時 +bit：逐 plane 做加法進位（_add 的展開版）
+                x = rolling
+                for i in range(len(planes)):
+                    p = planes[i]
+                    planes[i] = p ^ x
+                    x &= p
+                    if not x:
+                        break
+                else:
+                    planes.append(x)
+                count += 1
+        self._rolling, self.count = rolling, count
+
+    def update(self, chunk):
+        if self._seen >= self.max_bytes or not chunk:
+            return
+        chunk = chunk[:self.max_bytes - self._seen]
+        self._seen += len(chunk)
+        data = self._tail + chunk
+        tokens = _TOKEN.findall(data)
+        self._tail = b""
+        if tokens and _TOKEN.match(data, len(data) - 1):
+            self._tail = tokens.pop()[:MAX_TOKEN]   # 可能在下一個 chunk 繼續
+        self._push(tokens)
+
+    def digest(self):
+        """64-bit 指紋（int）；沒有任何 token 時回傳 None"""
+        if self._tail:
+            self._push([self._tail])
+            self._tail = b""
+        if self.count == 0:
+            if not self._window:
+                return None
+            # token 數不到一個 shingle：以目前視窗當唯一的 shingle
+            self._add(self._rolling)
+            self.count = 1
+        threshold = self.count / 2
+        value = 0
+        for bit in range(BITS):
+            n = 0
+            for j, plane in enumerate(self._planes):
+                n |= ((plane >> bit) & 1) << j
+            if n > threshold:
+                value |= 1 << bit
+        return value
+
+    def hexdigest(self):
+        value = self.digest()
+        return None if value is None else f"{value:016x}"
+
+
+def fingerprint(data):
+    """整段 bytes 的指紋（測試與非串流呼叫端用）"""
+    hasher = SimHasher()
+    hasher.update(data)
+    return hasher.hexdigest()
+
+
+def hamming(a, b):
+    return bin(int(a, 16) ^ int(b, 16)).count("1")
+
+
+def change_ratio(previous, current):
+    """
+    兩個指紋的差異程度 0..1；任一邊沒有指紋時回傳 None。
+    SimHash 的 Hamming 距離 / 64 約等於兩份內容特徵向量夾角 / π，
+    完全不相干的內容夾角為 90°（距離約 32），所以乘 2 讓「完全不同」對應到 1。
+    """
+    if not previous or not current:
+        return None
+    return min(1.0, 2 * hamming(previous, current) / BITS)
@@ -0,0 +1,208 @@
+# crawl_dispatcher.py
+# Fan-out 模式的排程 Lambda，也是所有目標狀態的唯一 owner（見 crawl_state.py）：
+#   讀取啟用中的目標 → 讀回 worker 送回結果佇列的探測結果，更新排程 / 指紋 / 延遲視窗 / breaker / 最新狀態，
+#   有變化的才寫回表 → 只取到期的（schedule.py）→ 依 targetId 的 consistent hash 分到 N 個 shard
+#   → 每個 shard 送一則訊息到工作佇列
+# consistent hash 讓 shard 數量變動時，大部分目標仍留在原本的 shard（worker 的連線池 / 快取較穩定）。
+# 不 import lambda_function（探測 / HTTP 相關模組）：目標直接由 TargetIndex 讀，狀態邏輯在 crawl_state。
+import bisect
+import hashlib
+import json
+import math
+import os
+import time
+import uuid
+from decimal import Decimal
+
+import aws_clients
+from instrumentation import instrumented, phase
+
+import crawl_state
+from circuit_breaker import BREAKER_FIELDS
+from latency_baseline import LatencyHistory
+from metrics_buffer import metric_buffer_from_env
+from schedule import Scheduler
+from target_index import TargetIndex
+from target_items import json_default
+from target_state import TargetStateWriter
+from work_queue import MAX_MESSAGE_BYTES, SqsWorkQueue
+
+TARGETS_PER_SHARD = int(os.getenv("TARGETS_PER_SHARD", "50"))
+MAX_SHARDS = int(os.getenv("MAX_SHARDS", "100"))
+VNODES = 64
+# 每個 tick 最多讀回幾則結果訊息（沒讀完的下個 tick 再讀）
+RESULTS_PER_TICK = int(os.getenv("DISPATCH_RESULTS_PER_TICK", "1000"))
+TABLE_NAME = os.getenv("TABLE_NAME")
+
+metrics = metric_buffer_from_env(lambda: aws_clients.client('cloudwatch'))
+_target_index = None
+_state_writer = None
+
+
+def load_target_items():
+    """
+    CrawlerTargets 裡啟用中的目標（warm start 只做增量查詢）。
+    讀取失敗時讓這個 tick 失敗，不退回 targets.json：sync 會把不在清單裡的目標連同狀態一起移除
+    """
+    global _target_index
+    if _target_index is None:
+        _target_index = TargetIndex(
+            aws_clients.table(TABLE_NAME),
+            total_segments=int(os.getenv("TARGETS_SCAN_SEGMENTS", "4")),
+            full_resync_seconds=int(os.getenv("TARGETS_FULL_RESYNC_SECONDS", "1800")),
+        )
+    return [dict(t) for t in _target_index.active_targets()]
+
+
+def get_state_writer():
+    global _state_writer
+    if _state_writer is None:
+        _state_writer = TargetStateWriter(aws_clients.table(TABLE_NAME))
+    return _state_writer
+
+
+def _hash(value):
+    return int.from_bytes(hashlib.md5(value.encode("utf-8")).digest()[:8], "big")
+
+
+class HashRing:
+    """每個 shard 在環上放 vnodes 個虛擬節點，目標落在順時針方向第一個節點的 shard"""
+
+    def __init__(self, shard_count, vnodes=VNODES):
+        points = sorted((_hash(f"shard-{s}#{v}"), s) for s in range(shard_count) for v in range(vnodes))
+        self._keys = [p[0] for p in points]
+        self._shards = [p[1] for p in points]
+
+    def shard_for(self, key):
+        i = bisect.bisect(self._keys, _hash(key)) % len(self._keys)
+        return self._shards[i]
+
+
+def shard_count_for(n_targets):
+    return max(1, min(MAX_SHARDS, math.ceil(n_targets / TARGETS_PER_SHARD)))
+
+
+def partition(targets, shard_count):
+    """回傳 [[target, ...], ...]，長度為 shard_count"""
+    ring = HashRing(shard_count)
+    shards = [[] for _ in range(shard_count)]
+    for t in targets:
+        shards[ring.shard_for(t["targetId"])].append(t)
+    return shards
+
+
+def _plain(v):
+    # DynamoDB 的數字是 Decimal（lastStatus 是 map，裡面也是），轉成 JSON 可序列化的值
+    if isinstance(v, Decimal):
+        return json_default(v)
+    if isinstance(v, dict):
+        return {k: _plain(x) for k, x in v.items()}
+    return v
+
+
+def _message_target(t):
+    # worker 只需要 breaker 狀態來決定要正常探測、試探或直接記為失敗，以及 conditional GET 的 validator；
+    # 其他狀態由 dispatcher 自己比較
+    out = {"targetId": t["targetId"], "url": t["url"]}
+    for k in BREAKER_FIELDS + [crawl_state.VALIDATOR_FIELD]:
+        if t.get(k) is not None:
+            out[k] = _plain(t[k])
+    return out
+
+
+def build_messages(targets, shard_count, run_id):
+    messages = []
+    for shard, members in enumerate(partition(targets, shard_count)):
+        if not members:
+            continue
+        # 單則訊息太大時再切成多個 part（仍屬同一個 shard）
+        parts, current, size = [], [], 0
+        for t in members:
+            t_size = len(json.dumps(t)) + 2
+            if current and size + t_size > MAX_MESSAGE_BYTES:
+                parts.append(current)
+                current, size = [], 0
+            current.append(t)
+            size += t_size
+        parts.append(current)
+        for part, chunk in enumerate(parts):
+            messages.append({"runId": run_id, "shard": shard, "part": part, "shardCount": shard_count,
+                             "targets": [_message_target(t) for t in chunk]})
+    return messages
+
+
+def aggregate_results(summaries):
+    """把多個 shard 的摘要合併成整次 run 的結果"""
+    total = {"shards": 0, "checked": 0, "skipped": 0, "shortCircuited": 0, "failed": 0, "maxRunTimeMs": 0}
+    for s in summaries:
+        total["shards"] += 1
+        total["checked"] += s["checked"]
+        total["skipped"] += s["skipped"]
+        total["shortCircuited"] += s.get("shortCircuited", 0)
+        total["failed"] += s["failed"]
+        total["maxRunTimeMs"] = max(total["maxRunTimeMs"], s["runTimeMs"])
+    return total
+
+
+def dispatch(queue, targets=None, shard_count=None, run_id=None):
+    targets = load_target_items() if targets is None else targets
+    shard_count = shard_count or shard_count_for(len(targets))
+    run_id = run_id or f"{time.strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:8]}"
+    messages = build_messages(targets, shard_count, run_id)
+    queue.send(messages)
+    return {"runId": run_id, "targets": len(targets), "shards": shard_count, "messages": len(messages)}
+
+
+def apply_results(queue, writer=None, limit=RESULTS_PER_TICK):
+    """
+    讀回 worker 送回的探測結果，以與單機模式相同的邏輯（crawl_state.record_results）更新記憶體中的目標狀態；
+    回傳這些結果訊息帶來的 shard 摘要
+    """
+    summaries = []
+    for batch in queue.receive_batches(limit):
+        for report in batch:
+            targets = [scheduler.targets[tid] for tid in report["targetIds"] if tid in scheduler.targets]
+            crawl_state.record_results(targets, report["results"], scheduler, latency_history, metrics, writer)
+            if "summary" in report:
+                summaries.append(report["summary"])
+        if writer is not None:
+            writer.flush()   # 這批的狀態寫回表之後才刪除訊息
+    return summaries
+
+
+_queue = None
+_result_queue = None
+# 目標狀態（warm start 沿用）：排程的 min-heap、內容指紋、breaker、最新狀態都以記憶體為準，
+# 由 worker 送回的結果更新；cold start 時從表裡（有變化時寫回的副本）還原
+scheduler = Scheduler(keep=crawl_state.OWNED_FIELDS)
+latency_history = LatencyHistory()
+
+@instrumented("crawl_dispatcher")
+def handler(event, context):
+    global _queue, _result_queue
+    if _queue is None:
+        _queue = SqsWorkQueue(aws_clients.client("sqs"), os.environ["WORK_QUEUE_URL"])
+    if _result_queue is None:
+        _result_queue = SqsWorkQueue(aws_clients.client("sqs"), os.environ["RESULT_QUEUE_URL"])
+    with phase("sync"):
+        scheduler.sync(load_target_items())
+        latency_history.retain(scheduler.targets)
+    with phase("record"):
+        run = aggregate_results(apply_results(_result_queue, get_state_writer()))
+    with phase("schedule"):
+        # 送出的目標先以目前間隔排入；結果回來時依實際結果重新排程，結果沒回來（worker 失敗）時就是下一次重試
+        due = scheduler.due(limit=int(os.getenv("DISPATCH_MAX_PER_TICK", "5000")))
+        for t in due:
+            scheduler.defer(t["targetId"])
+    with phase("send"):
+        summary = dispatch(_queue, targets=due)
+
+    # 這個 tick 讀回的 shard 中最慢的一個，對應單機模式的 RunTimeMs（CrawlerRunTimeHigh alarm 看這個）
+    if run["shards"]:
+        metrics.put('WebsiteMonitorCrawler', 'RunTimeMs', run["maxRunTimeMs"], 'Milliseconds')
+    metrics.put('WebsiteMonitorCrawler', 'SitesNotDue', len(scheduler) - len(due), 'Count')
+    with phase("flush"):
+        metrics.flush()
+    summary["applied"] = run
+    print(f"📤 Dispatched run {summary['runId']}: {summary['targets']} targets in {summary['shards']} shards")
+    return {"statusCode": 200, "body": json.dumps(summary)}
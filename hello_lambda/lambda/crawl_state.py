@@ -0,0 +1,116 @@
+# crawl_state.py
+# 探測結果 → 每個目標的狀態：排程（schedule.Scheduler）、內容指紋、HTTP validator、延遲視窗、circuit breaker、最新狀態（lastStatus）。
+# 狀態只有一個 owner，記憶體中的版本永遠是最新的，表裡的副本只在有變化（或 heartbeat）時寫回：
+#   - 單機模式：crawler（lambda_function）自己探測、自己記錄
+#   - fan-out 模式：dispatcher；worker 只探測，把精簡後的結果（compact_result）送回結果佇列，
+#     dispatcher 下一個 tick 讀回來再記錄，所以下一次派送的 breaker 狀態、與上一次比較的指紋 / 狀態都是最新的
+# 這裡不 import 探測 / HTTP 相關模組，dispatcher 載入時用不到它們。
+import circuit_breaker
+from circuit_breaker import BREAKER_FIELDS, OPEN
+from content_fingerprint import FINGERPRINT_FIELD, change_ratio
+from latency_baseline import HISTORY_FIELD, decode_window, encode_window
+from schedule import STATE_FIELDS
+from target_status import STATUS_FIELD, next_status
+
+# conditional GET 的 validator {"etag", "lastModified", "size"}（見 http_probe.probe）
+VALIDATOR_FIELD = "httpValidators"
+# owner 記憶體中的版本為準、sync 時不被表裡的副本覆蓋的欄位（Scheduler keep）
+OWNED_FIELDS = STATE_FIELDS + [FINGERPRINT_FIELD, VALIDATOR_FIELD, STATUS_FIELD] + BREAKER_FIELDS
+# 記錄結果需要的欄位（worker 只把這些送回 dispatcher）
+RESULT_FIELDS = ["url", "ts", "success", "status", "latency", "simhash", "validators", "skipped", "short_circuited"]
+
+
+def compact_result(result):
+    return {k: result[k] for k in RESULT_FIELDS if result.get(k) is not None}
+
+
+def breaker_change(target, result, failures, now):
+    """更新記憶體中目標的 breaker 狀態，回傳要寫回 CrawlerTargets 的欄位"""
+    fields = circuit_breaker.transition(target, result["success"], failures, now,
+                                        short_circuited=result.get("short_circuited", False))
+    if fields.get("breakerState") == OPEN:
+        print(f"⚡ Circuit opened for {target['url']} ({failures} consecutive failures, cooldown {fields['breakerCooldown']}s)")
+    target.update(fields)
+    return fields
+
+
+def content_change(target, result, metrics):
+    """
+    與目標上次的內容指紋比較，送出 ContentChangeRatio（0 = 沒變，1 = 完全不同）；
+    回傳要寫回 CrawlerTargets 的欄位（指紋沒變或沒有指紋時為空）
+    """
+    current = result.get("simhash")
+    if not current:
+        return {}
+    previous = target.get(FINGERPRINT_FIELD)
+    ratio = change_ratio(previous, current)
+    if ratio is not None:
+        metrics.put('WebsiteMonitor', 'ContentChangeRatio', ratio, 'None', {'URL': target["url"]})
+    return {} if previous == current else {FINGERPRINT_FIELD: current}
+
+
+def validator_change(target, result):
+    """這次拿到的 validator 與目標上存的不同時，回傳要寫回的欄位（頁面改變時才會發生）"""
+    current = result.get("validators")
+    if not current or current == target.get(VALIDATOR_FIELD):
+        return {}
+    return {VALIDATOR_FIELD: current}
+
+
+def score_latencies(targets, results, history, metrics):
+    """
+    以各目標自己的延遲歷史替本次成功探測的延遲評分（整批一次算完），送出 LatencyAnomalyScore；
+    回傳 {targetId: 要寫回 CrawlerTargets 的欄位}（更新後的延遲視窗）
+    """
+    by_url = {r["url"]: r for r in results}
+    scored = []
+    for t in targets:
+        r = by_url.get(t["url"])
+        if r is None or not r["success"] or r.get("latency") is None:
+            continue
+        if t.get(HISTORY_FIELD):
+            history.seed(t["targetId"], decode_window(t[HISTORY_FIELD]))
+        scored.append((t, r["latency"]))
+    scores = history.score([t["targetId"] for t, _ in scored], [v for _, v in scored])
+    fields = {}
+    for (t, _), score in zip(scored, scores):
+        if score is not None:
+            metrics.put('WebsiteMonitor', 'LatencyAnomalyScore', score, 'None', {'URL': t["url"]})
+        fields[t["targetId"]] = {HISTORY_FIELD: encode_window(history.samples(t["targetId"]))}
+    return fields
+
+
+def status_change(target, result, changed_fields, now):
+    """
+    更新記憶體中目標的 lastStatus；回傳要寫回的欄位，不需要寫回時為 None。
+    只有狀態改變、heartbeat 到期或 changed_fields 不為空時才寫。
+    """
+    status, due = next_status(target.get(STATUS_FIELD), result, now, force=bool(changed_fields))
+    target[STATUS_FIELD] = status
+    return dict(changed_fields, **{STATUS_FIELD: status}) if due else None
+
+
+def record_results(targets, results, scheduler, history, metrics, writer=None):
+    """
+    依探測結果更新排程、內容指紋、validator、延遲視窗、breaker 與最新狀態；
+    沒探測到（skipped，或派送後 URL 被改掉而沒有結果）的目標下個 tick 再試。
+    寫回 CrawlerTargets 的次數與「變化」成正比（見 target_status.py），排程狀態與延遲視窗在寫的時候一起帶上。
+    """
+    by_url = {r["url"]: r for r in results}
+    windows = score_latencies(targets, results, history, metrics)
+    for t in targets:
+        r = by_url.get(t["url"])
+        if r is None or r.get("skipped"):
+            scheduler.retry(t["targetId"])
+            continue
+        fields = content_change(t, r, metrics)
+        fields.update(validator_change(t, r))
+        t.update(fields)
+        now = scheduler.clock()
+        state = scheduler.record(t["targetId"], r["success"])
+        if state is None:
+            continue
+        fields.update(breaker_change(t, r, state["consecutiveFailures"], now))
+        fields = status_change(t, r, fields, now)
+        if writer is not None and fields is not None:
+            writer.put(t["targetId"], dict(state, **windows.get(t["targetId"], {}), **fields))
@@ -0,0 +1,83 @@
+# crawl_worker.py
+# Fan-out 模式的 worker Lambda（SQS 觸發）：每則訊息是一個 shard 的目標清單。
+# 用與單機模式相同的併發引擎探測，per-URL metric 不變；
+# shard 層級的統計送到 WebsiteMonitorCrawler（Sum 起來就是整次 run 的總數），
+# 摘要也隨結果送回 dispatcher，由它彙總成整次 run 的 RunTimeMs。
+# 訊息帶來的 circuit breaker 狀態決定要正常探測、短 timeout 試探或直接記為失敗。
+# worker 不持有目標狀態：探測結果（精簡版，見 crawl_state.compact_result）送回結果佇列，
+# 由 dispatcher 更新排程、指紋、延遲視窗、breaker 與最新狀態並寫回 CrawlerTargets。
+# 探測結果每個 shard 訊息存成一個欄式批次檔（result_store）。
+import json
+import os
+import time
+
+import aws_clients
+import lambda_function
+from crawl_state import compact_result
+from instrumentation import instrumented, phase
+from work_queue import SqsWorkQueue
+
+# 每則結果訊息最多幾個目標（精簡後的結果約 150 bytes，遠低於 SQS 256KB 上限）
+REPORT_TARGETS = 200
+_result_queue = None
+
+
+def process_shard(message, context):
+    """探測一個 shard 訊息的目標，回傳 (摘要, 送回 dispatcher 的結果訊息清單)"""
+    start = time.time()
+    with phase("probe"):
+        results = lambda_function.probe_targets(message["targets"], context, start)
+    with phase("store"):
+        lambda_function.store_results(results, f"{message['runId']}-s{message['shard']}-p{message.get('part', 0)}")
+    skipped = sum(1 for r in results if r.get("skipped"))
+    short_circuited = sum(1 for r in results if r.get("short_circuited"))
+    summary = {
+        "runId": message["runId"], "shard": message["shard"], "part": message.get("part", 0),
+        "checked": len(results) - skipped - short_circuited, "skipped": skipped, "shortCircuited": short_circuited,
+        "failed": sum(1 for r in results if not r["success"] and not r.get("skipped")),
+        "runTimeMs": int((time.time() - start) * 1000),
+    }
+    by_url = {r["url"]: compact_result(r) for r in results}
+    targets = message["targets"]
+    chunks = [targets[i:i + REPORT_TARGETS] for i in range(0, len(targets), REPORT_TARGETS)] or [[]]
+    reports = [{"targetIds": [t["targetId"] for t in chunk],
+                "results": list({t["url"]: by_url[t["url"]] for t in chunk}.values())} for chunk in chunks]
+    # 摘要只放在第一則，dispatcher 彙總時每個 shard 訊息只算一次
+    reports[0]["summary"] = summary
+    return summary, reports
+
+
+def _get_result_queue():
+    """探測結果送回 dispatcher 的佇列；沒設定 RESULT_QUEUE_URL（本地執行）時回傳 None"""
+    global _result_queue
+    if _result_queue is None and os.getenv("RESULT_QUEUE_URL"):
+        _result_queue = SqsWorkQueue(aws_clients.client("sqs"), os.environ["RESULT_QUEUE_URL"])
+    return _result_queue
+
+
+@instrumented("crawl_worker")
+def handler(event, context):
+    summaries, failures = [], []
+    result_queue = _get_result_queue()
+    for record in event.get("Records", []):
+        try:
+            summary, reports = process_shard(json.loads(record["body"]), context)
+            if result_queue is not None:
+                with phase("report"):
+                    result_queue.send(reports)
+            summaries.append(summary)
+        except Exception as e:
+            print(f"❌ Shard message {record.get('messageId')} failed: {e}")
+            failures.append({"itemIdentifier": record.get("messageId")})
+
+    metrics = lambda_function.metrics
+    for s in summaries:
+        metrics.put('WebsiteMonitorCrawler', 'ShardRunTimeMs', s["runTimeMs"], 'Milliseconds')
+        metrics.put('WebsiteMonitorCrawler', 'SitesChecked', s["checked"], 'Count')
+        metrics.put('WebsiteMonitorCrawler', 'SitesSkipped', s["skipped"], 'Count')
+        metrics.put('WebsiteMonitorCrawler', 'SitesShortCircuited', s["shortCircuited"], 'Count')
+    with phase("flush"):
+        metrics.flush()
+
+    # 部分失敗時只讓失敗的訊息回到佇列重試（ReportBatchItemFailures）
+    return {"batchItemFailures": failures, "shards": summaries}
@@ -1,25 +1,24 @@
-import os, json, uuid, time
-import boto3
+import os, json
+from instrumentation import elapsed_ms, instrumented, phase
+import aws_clients
+import stage_cache
+from target_items import new_item
 
 TABLE_NAME = os.environ["TABLE_NAME"]
-table = boto3.resource("dynamodb").Table(TABLE_NAME)
+table = aws_clients.table(TABLE_NAME)   # client 第一次呼叫時才建立
 
+@instrumented("create_target")
 def handler(event, context):
-    start = time.time()
-    body = json.loads(event.get("body") or "{}")
-    url = body.get("url")
-    if not url:
+    with phase("parse"):
+        body = json.loads(event.get("body") or "{}")
+        item = new_item(body)
+    if not item:
         return {"statusCode": 400, "body": json.dumps({"error": "url is required"})}
 
-    item = {
-        "targetId": str(uuid.uuid4()),
-        "url": url,
-        "active": bool(body.get("active", True)),
-        "createdAt": time.strftime("%Y-%m-%dT%H:%M:%S"),
-        "updatedAt": time.strftime("%Y-%m-%dT%H:%M:%S"),
-        "tags": body.get("tags") or [],
-        "notes": body.get("notes") or "",
-    }
-    table.put_item(Item=item)
-    latency = round((time.time() - start) * 1000, 2)
-    return {"statusCode": 201, "body": json.dumps({"item": item, "dynamoLatencyMs": latency})}
+    with phase("dynamo"):
+        table.put_item(Item=item)
+    with phase("cache"):
+        stage_cache.invalidate()
+    with phase("serialize"):
+        body = json.dumps({"item": item, "dynamoLatencyMs": elapsed_ms("dynamo")})
+    return {"statusCode": 201, "body": body}
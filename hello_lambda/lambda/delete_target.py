@@ -1,19 +1,22 @@
-import os, json, time
-import boto3
+import os, json
+from instrumentation import elapsed_ms, instrumented, phase
+import aws_clients
+import stage_cache
 from botocore.exceptions import ClientError
 
 TABLE_NAME = os.environ["TABLE_NAME"]
-table = boto3.resource("dynamodb").Table(TABLE_NAME)
+table = aws_clients.table(TABLE_NAME)   # client 第一次呼叫時才建立
 
+@instrumented("delete_target")
 def handler(event, context):
-    start = time.time()
     target_id = event["pathParameters"].get("targetId")
     try:
-        table.delete_item(Key={"targetId": target_id}, ConditionExpression="attribute_exists(targetId)")
+        with phase("dynamo"):
+            table.delete_item(Key={"targetId": target_id}, ConditionExpression="attribute_exists(targetId)")
     except ClientError as e:
         if e.response["Error"]["Code"] == "ConditionalCheckFailedException":
-            latency = round((time.time() - start) * 1000, 2)
-            return {"statusCode": 404, "body": json.dumps({"error": "not found", "dynamoLatencyMs": latency})}
+            return {"statusCode": 404, "body": json.dumps({"error": "not found", "dynamoLatencyMs": elapsed_ms("dynamo")})}
         raise
-    latency = round((time.time() - start) * 1000, 2)
-    return {"statusCode": 204, "body": json.dumps({"dynamoLatencyMs": latency})}
+    with phase("cache"):
+        stage_cache.invalidate()
+    return {"statusCode": 204, "body": json.dumps({"dynamoLatencyMs": elapsed_ms("dynamo")})}
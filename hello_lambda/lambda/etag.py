@@ -0,0 +1,50 @@
+# etag.py
+# targets API 的條件式 GET（輪詢的 dashboard / 自動化腳本用）：
+#   - ETag = 回應資料（item，或 items + count + nextToken）的 blake2b 摘要；
+#     dynamoLatencyMs 這類每次都不同的診斷欄位不算在內，否則 ETag 永遠對不上
+#   - crawler 寫回的 lastStatus 不會改 updatedAt，所以 ETag 以內容而不是 updatedAt 計算
+#   - 請求的 If-None-Match 相符時回 304（沒有 body）
+# 限制：ETag 要先讀完 DynamoDB、組好回應資料才算得出來，304 省下的只有傳輸量（body 與 API Gateway 壓縮），
+# 不省 RCU 與 Lambda 執行時間（benchmarks/bench_list_targets.py 最後一列）。
+# 要省後端，得有便宜的版本標記（例如整表的版本計數器），但 crawler 每次寫回 lastStatus 都得一起更新它，
+# 等於每次狀態寫入多一次寫，所以沒有採用；要減少後端讀取請用 API Gateway stage cache（api_cache=true）。
+# gzip 由 API Gateway 依 Accept-Encoding 處理（ApiGatewayStack 的 min_compression_size），Lambda 不必壓縮。
+import hashlib
+import json
+
+from target_items import json_default
+
+CACHE_CONTROL = "no-cache"   # client 可以快取，但每次都要帶 If-None-Match 重新驗證
+
+
+def etag(data):
+    raw = json.dumps(data, sort_keys=True, separators=(",", ":"), default=json_default).encode()
+    return '"' + hashlib.blake2b(raw, digest_size=16).hexdigest() + '"'
+
+
+def request_header(event, name):
+    """API Gateway 不保證 header 名稱的大小寫"""
+    name = name.lower()
+    for k, v in (event.get("headers") or {}).items():
+        if k.lower() == name:
+            return v
+    return None
+
+
+def matches(event, tag):
+    value = request_header(event, "If-None-Match")
+    if not value:
+        return False
+    candidates = [c.strip() for c in value.split(",")]
+    # If-None-Match 用弱比較：W/"x" 與 "x" 視為相同
+    return "*" in candidates or tag in (c[2:] if c.startswith("W/") else c for c in candidates)
+
+
+def respond(event, data, extra=None, status=200):
+    """data 相同時 ETag 相同；extra 是不影響 ETag 的欄位（接在 data 後面）"""
+    tag = etag(data)
+    headers = {"ETag": tag, "Cache-Control": CACHE_CONTROL}
+    if matches(event, tag):
+        return {"statusCode": 304, "headers": headers, "body": ""}
+    body = json.dumps(dict(data, **(extra or {})), default=json_default)
+    return {"statusCode": status, "headers": headers, "body": body}
@@ -0,0 +1,217 @@
+# export_items.py
+# 以串流方式把 DynamoDB 表匯出成 NDJSON（每行一筆 JSON），可選 gzip。
+# 管線：平行 segmented scan → 有界 queue → JSON 行 → (gzip) → sink
+# 記憶體用量只跟 queue 大小 / S3 part 大小有關，與表的大小無關。
+#
+# Lambda：event = {"table": "targets" | "alarms", "gzip": true}，輸出到 EXPORT_BUCKET
+# 本地：python hello_lambda/lambda/export_items.py --table CrawlerTargets --out targets.jsonl.gz --gzip
+import argparse
+import json
+import os
+import queue
+import sys
+import threading
+import time
+import zlib
+from decimal import Decimal
+
+try:
+    import aws_clients
+except ImportError:   # 本地執行 CLI：shared layer 不在 /opt/python
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "layers", "shared", "python"))
+    import aws_clients
+from instrumentation import instrumented
+
+PART_SIZE = 8 * 1024 * 1024     # S3 multipart 每個 part 的大小（最小 5MB）
+_DONE = object()
+
+
+def _json_default(v):
+    if isinstance(v, Decimal):
+        return int(v) if v == v.to_integral_value() else float(v)
+    if isinstance(v, (set, frozenset)):
+        return sorted(v)
+    if isinstance(v, (bytes, bytearray)):
+        return v.decode("utf-8", "replace")
+    raise TypeError(f"cannot serialize {type(v).__name__}")
+
+
+def scan_items(table, total_segments=4, max_pages_buffered=8):
+    """平行掃描所有 segment，逐筆 yield；最多只暫存 max_pages_buffered 頁"""
+    pages = queue.Queue(maxsize=max_pages_buffered)
+    stop = threading.Event()
+    errors = []
+
+    def worker(segment):
+        kwargs = {"Segment": segment, "TotalSegments": total_segments}
+        try:
+            while not stop.is_set():
+                resp = table.scan(**kwargs)
+                _put(resp.get("Items", []))
+                if "LastEvaluatedKey" not in resp:
+                    break
+                kwargs["ExclusiveStartKey"] = resp["LastEvaluatedKey"]
+        except Exception as e:
+            errors.append(e)
+        finally:
+            _put(_DONE)
+
+    def _put(obj):
+        while not stop.is_set():
+            try:
+                pages.put(obj, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    threads = [threading.Thread(target=worker, args=(s,), daemon=True) for s in range(total_segments)]
+    for t in threads:
+        t.start()
+    try:
+        remaining = total_segments
+        while remaining:
+            page = pages.get()
+            if page is _DONE:
+                remaining -= 1
+                continue
+            yield from page
+        if errors:
+            raise errors[0]
+    finally:
+        stop.set()   # 消費端提早結束時讓 worker 退出
+
+
+def to_ndjson(items):
+    for item in items:
+        yield (json.dumps(item, default=_json_default, ensure_ascii=False, separators=(",", ":")) + "\n").encode("utf-8")
+
+
+def gzip_chunks(chunks, level=6):
+    comp = zlib.compressobj(level, zlib.DEFLATED, 31)   # wbits=31 → gzip 格式
+    for chunk in chunks:
+        out = comp.compress(chunk)
+        if out:
+            yield out
+    yield comp.flush()
+
+
+class ExportStats:
+    def __init__(self):
+        self.items = 0
+        self.raw_bytes = 0
+        self.out_bytes = 0
+        self.start = time.perf_counter()
+
+    def count_lines(self, lines):
+        for line in lines:
+            self.items += 1
+            self.raw_bytes += len(line)
+            yield line
+
+    def report(self):
+        secs = max(time.perf_counter() - self.start, 1e-9)
+        return {
+            "items": self.items,
+            "rawBytes": self.raw_bytes,
+            "outputBytes": self.out_bytes,
+            "seconds": round(secs, 3),
+            "itemsPerSec": round(self.items / secs, 1),
+            "mbPerSec": round(self.raw_bytes / secs / 1e6, 2),
+        }
+
+
+def export(table, write, gzip=False, total_segments=4):
+    """把整張表寫進 write(bytes)，回傳吞吐統計"""
+    stats = ExportStats()
+    chunks = stats.count_lines(to_ndjson(scan_items(table, total_segments)))
+    if gzip:
+        chunks = gzip_chunks(chunks)
+    for chunk in chunks:
+        stats.out_bytes += len(chunk)
+        write(chunk)
+    return stats.report()
+
+
+class S3MultipartSink:
+    """累積到 PART_SIZE 就上傳一個 part；檔案很小時直接 put_object"""
+
+    def __init__(self, s3, bucket, key, content_type):
+        self.s3, self.bucket, self.key, self.content_type = s3, bucket, key, content_type
+        self.buf = bytearray()
+        self.parts = []
+        self.upload_id = None
+
+    def write(self, data):
+        self.buf += data
+        if len(self.buf) >= PART_SIZE:
+            self._upload_part()
+
+    def _upload_part(self):
+        if self.upload_id is None:
+            self.upload_id = self.s3.create_multipart_upload(
+                Bucket=self.bucket, Key=self.key, ContentType=self.content_type)["UploadId"]
+        n = len(self.parts) + 1
+        resp = self.s3.upload_part(Bucket=self.bucket, Key=self.key, UploadId=self.upload_id,
+                                   PartNumber=n, Body=bytes(self.buf))
+        self.parts.append({"PartNumber": n, "ETag": resp["ETag"]})
+        self.buf = bytearray()
+
+    def close(self):
+        if self.upload_id is None:
+            self.s3.put_object(Bucket=self.bucket, Key=self.key, Body=bytes(self.buf), ContentType=self.content_type)
+            return
+        if self.buf:
+            self._upload_part()
+        self.s3.complete_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self.upload_id,
+                                          MultipartUpload={"Parts": self.parts})
+
+    def abort(self):
+        if self.upload_id is not None:
+            self.s3.abort_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self.upload_id)
+
+
+@instrumented("export_items")
+def handler(event, context):
+    tables = {"targets": os.environ.get("TARGETS_TABLE"), "alarms": os.environ.get("ALARMS_TABLE")}
+    name = tables.get(event.get("table", "targets"))
+    if not name:
+        return {"statusCode": 400, "body": json.dumps({"error": "table must be 'targets' or 'alarms'"})}
+    gz = bool(event.get("gzip", True))
+    key = f"exports/{name}/{time.strftime('%Y%m%dT%H%M%S')}.jsonl" + (".gz" if gz else "")
+
+    sink = S3MultipartSink(aws_clients.client("s3"), os.environ["EXPORT_BUCKET"], key,
+                           "application/gzip" if gz else "application/x-ndjson")
+    try:
+        stats = export(aws_clients.table(name), sink.write, gzip=gz,
+                       total_segments=int(event.get("segments", 4)))
+        sink.close()
+    except Exception:
+        sink.abort()
+        raise
+    print(f"📦 Exported {stats['items']} items from {name} to s3://{sink.bucket}/{key}: "
+          f"{stats['itemsPerSec']} items/s, {stats['mbPerSec']} MB/s")
+    return {"statusCode": 200, "body": json.dumps(dict(stats, bucket=sink.bucket, key=key))}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Stream a DynamoDB table to NDJSON.")
+    parser.add_argument("--table", required=True, help="DynamoDB table name (e.g. CrawlerTargets, WebHealthAlarmsTable)")
+    parser.add_argument("--out", default="-", help="output file, '-' for stdout")
+    parser.add_argument("--gzip", action="store_true", help="gzip the output")
+    parser.add_argument("--segments", type=int, default=4, help="parallel scan segments")
+    args = parser.parse_args(argv)
+
+    table = aws_clients.table(args.table)
+    if args.out == "-":
+        stats = export(table, sys.stdout.buffer.write, gzip=args.gzip, total_segments=args.segments)
+        sys.stdout.buffer.flush()
+    else:
+        with open(args.out, "wb") as f:
+            stats = export(table, f.write, gzip=args.gzip, total_segments=args.segments)
+    print(f"exported {stats['items']} items in {stats['seconds']}s "
+          f"({stats['itemsPerSec']} items/s, {stats['mbPerSec']} MB/s, {stats['outputBytes']} bytes written)",
+          file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
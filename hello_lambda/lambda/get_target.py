@@ -1,15 +1,19 @@
-import os, json, time
-import boto3
+import os, json
+from instrumentation import elapsed_ms, instrumented, phase
+import aws_clients
+import etag
 
 TABLE_NAME = os.environ["TABLE_NAME"]
-table = boto3.resource("dynamodb").Table(TABLE_NAME)
+table = aws_clients.table(TABLE_NAME)   # client 第一次呼叫時才建立
 
+@instrumented("get_target")
 def handler(event, context):
-    start = time.time()
     target_id = event["pathParameters"].get("targetId")
-    resp = table.get_item(Key={"targetId": target_id})
+    with phase("dynamo"):
+        resp = table.get_item(Key={"targetId": target_id})
     item = resp.get("Item")
-    latency = round((time.time() - start) * 1000, 2)
+    latency = elapsed_ms("dynamo")
     if not item:
         return {"statusCode": 404, "body": json.dumps({"error": "not found", "dynamoLatencyMs": latency})}
-    return {"statusCode": 200, "body": json.dumps({"item": item, "dynamoLatencyMs": latency})}
+    with phase("serialize"):
+        return etag.respond(event, {"item": item}, {"dynamoLatencyMs": latency})
@@ -0,0 +1,251 @@
+# http_pool.py
+# 有連線池的 HTTP client（取代每次 urlopen 都重新 DNS + TCP + TLS）：
+#   - 每個 (scheme, host, port) 一個 keep-alive 連線池，探測完歸還給下一個同 host 的目標
+#   - TLS session 快取：新連線沿用上次的 session（session resumption），握手更快
+#   - 每次請求回報各階段耗時：dns / connect / tls / ttfb / transfer（秒）
+#   - CachingResolver：DNS 結果短暫快取；查不到的網域（NXDOMAIN 等）也快取，死掉的目標不必每次等 DNS 逾時
+# 在 module scope 建立 pool，warm Lambda 之間可以沿用。
+import http.client
+import select
+import socket
+import ssl
+import threading
+import time
+import urllib.error
+from urllib.parse import urljoin, urlsplit
+
+from ttl_cache import TTLCache
+
+REDIRECT_CODES = {301, 302, 303, 307, 308}
+MAX_REDIRECTS = 5
+# 這些錯誤代表 keep-alive 連線已被對方關掉，換新連線重送一次即可
+STALE_ERRORS = (http.client.RemoteDisconnected, http.client.BadStatusLine, ConnectionResetError,
+                BrokenPipeError, ConnectionAbortedError)
+
+
+class PooledResponse:
+    """包裝 http.client.HTTPResponse：讀完 body 後自動把連線還給 pool，並記錄 transfer 時間"""
+
+    def __init__(self, pool, key, conn, response, url, timings):
+        self._pool, self._key, self._conn, self._resp = pool, key, conn, response
+        self.url = url
+        self.status = response.status
+        self.reason = response.reason
+        self.headers = response.headers
+        self.timings = timings
+        self._body_start = time.perf_counter()
+        self._closed = False
+
+    def getcode(self):
+        return self.status
+
+    def read(self, amt=None):
+        data = self._resp.read(amt)
+        if not data or amt is None:
+            self.timings["transfer"] = time.perf_counter() - self._body_start
+        return data
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self.timings.setdefault("transfer", time.perf_counter() - self._body_start)
+        if not self._resp.isclosed() and self._resp.length == 0:
+            self._resp.read()   # HEAD / 304 沒有 body，標記為讀完
+        # 只有 body 已讀完、對方沒要求關閉的連線才能重用
+        if self._resp.isclosed() and not self._resp.will_close:
+            self._pool._release(self._key, self._conn)
+        else:
+            self._resp.close()
+            self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class CachingResolver:
+    """getaddrinfo 加上正向 / 負向快取；同一個 container 內所有目標共用"""
+
+    def __init__(self, ttl=60, negative_ttl=300, maxsize=4096, resolve=None):
+        self.positive = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.negative = TTLCache(maxsize=maxsize, ttl=negative_ttl)
+        self._resolve = resolve or HTTPPool._resolve
+
+    def __call__(self, host, port):
+        key = (host, port)
+        error = self.negative.get(key)
+        if error is not None:
+            raise socket.gaierror(*error.args)
+        addrs = self.positive.get(key)
+        if addrs is not None:
+            return addrs
+        try:
+            addrs = self._resolve(host, port)
+        except socket.gaierror as e:
+            # EAI_AGAIN 是暫時性錯誤（DNS server 沒回應），不快取
+            if e.errno != socket.EAI_AGAIN:
+                self.negative.put(key, e)
+            raise
+        self.positive.put(key, addrs)
+        return addrs
+
+
+class HTTPPool:
+    def __init__(self, max_idle_per_host=4, idle_timeout=50, resolver=None):
+        self.max_idle_per_host = max_idle_per_host
+        self.idle_timeout = idle_timeout
+        self.resolve = resolver or self._resolve
+        self.ssl_context = ssl.create_default_context()
+        self._lock = threading.Lock()
+        self._idle = {}        # key -> [(conn, released_at), ...]
+        self._sessions = {}    # host -> ssl.SSLSession
+        self.stats = {"created": 0, "reused": 0}
+
+    # --- 連線管理 ---
+    @staticmethod
+    def _resolve(host, port):
+        return socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)
+
+    @staticmethod
+    def _is_stale(conn):
+        # 閒置連線若可讀，代表對方已送 FIN（或送了不該有的資料），不能再用
+        sock = conn.sock
+        if sock is None:
+            return True
+        try:
+            readable, _, _ = select.select([sock], [], [], 0)
+        except (OSError, ValueError):
+            return True
+        return bool(readable)
+
+    def _acquire(self, key):
+        now = time.monotonic()
+        with self._lock:
+            idle = self._idle.get(key, [])
+            while idle:
+                conn, released = idle.pop()
+                if now - released < self.idle_timeout and not self._is_stale(conn):
+                    self.stats["reused"] += 1
+                    return conn
+                conn.close()
+        return None
+
+    def _release(self, key, conn):
+        with self._lock:
+            idle = self._idle.setdefault(key, [])
+            if len(idle) < self.max_idle_per_host:
+                idle.append((conn, time.monotonic()))
+                return
+        conn.close()
+
+    def _connect(self, scheme, host, port, timeout, timings):
+        t0 = time.perf_counter()
+        addrs = self.resolve(host, port)
+        t1 = time.perf_counter()
+        timings["dns"] = t1 - t0
+
+        sock, last_error = None, None
+        for family, socktype, proto, _, addr in addrs:
+            try:
+                sock = socket.socket(family, socktype, proto)
+                sock.settimeout(timeout)
+                sock.connect(addr)
+                break
+            except OSError as e:
+                last_error = e
+                if sock is not None:
+                    sock.close()
+                sock = None
+        if sock is None:
+            raise last_error or OSError(f"could not connect to {host}:{port}")
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        t2 = time.perf_counter()
+        timings["connect"] = t2 - t1
+
+        if scheme == "https":
+            with self._lock:
+                session = self._sessions.get(host)
+            try:
+                sock = self.ssl_context.wrap_socket(sock, server_hostname=host, session=session)
+            except Exception:
+                sock.close()
+                raise
+            if sock.session is not None:
+                with self._lock:
+                    self._sessions[host] = sock.session
+            conn = http.client.HTTPSConnection(host, port, timeout=timeout, context=self.ssl_context)
+        else:
+            conn = http.client.HTTPConnection(host, port, timeout=timeout)
+        timings["tls"] = time.perf_counter() - t2
+        conn.sock = sock
+        with self._lock:
+            self.stats["created"] += 1
+        return conn
+
+    # --- 請求 ---
+    def _send(self, method, url, headers, timeout):
+        parts = urlsplit(url)
+        scheme = parts.scheme.lower()
+        if scheme not in ("http", "https"):
+            raise ValueError(f"unsupported URL scheme: {url}")
+        host = parts.hostname
+        port = parts.port or (443 if scheme == "https" else 80)
+        key = (scheme, host, port)
+        path = parts.path or "/"
+        if parts.query:
+            path += "?" + parts.query
+
+        for attempt in range(2):
+            timings = {"dns": 0.0, "connect": 0.0, "tls": 0.0}
+            conn = self._acquire(key) if attempt == 0 else None
+            reused = conn is not None
+            if conn is None:
+                conn = self._connect(scheme, host, port, timeout, timings)
+            else:
+                conn.sock.settimeout(timeout)
+            t0 = time.perf_counter()
+            try:
+                conn.request(method, path, headers=headers)
+                resp = conn.getresponse()
+            except STALE_ERRORS:
+                conn.close()
+                if reused:
+                    continue   # 池裡的連線已失效，換新連線重送
+                raise
+            except Exception:
+                conn.close()
+                raise
+            timings["ttfb"] = time.perf_counter() - t0
+            timings["reused"] = reused
+            return PooledResponse(self, key, conn, resp, url, timings)
+        raise http.client.RemoteDisconnected("connection closed")  # pragma: no cover
+
+    def request(self, method, url, headers=None, timeout=10):
+        """
+        送出請求（自動跟隨 redirect），回傳 PooledResponse。
+        4xx/5xx 以 urllib.error.HTTPError 拋出（與 urlopen 行為一致）；304 直接回傳。
+        timings 為整條 redirect 鏈的累計耗時。
+        """
+        headers = dict(headers or {})
+        total = {"dns": 0.0, "connect": 0.0, "tls": 0.0, "ttfb": 0.0}
+        for _ in range(MAX_REDIRECTS + 1):
+            resp = self._send(method, url, headers, timeout)
+            for phase in total:
+                total[phase] += resp.timings[phase]
+            location = resp.headers.get("Location")
+            if resp.status in REDIRECT_CODES and location:
+                resp.read()
+                resp.close()
+                url = urljoin(url, location)
+                if resp.status == 303:
+                    method = "GET" if method != "HEAD" else method
+                continue
+            resp.timings.update(total)
+            if resp.status >= 400:
+                resp.close()   # 錯誤頁不讀 body，連線直接丟掉
+                raise urllib.error.HTTPError(url, resp.status, resp.reason, resp.headers, None)
+            return resp
+        raise urllib.error.HTTPError(url, resp.status, "too many redirects", resp.headers, None)
@@ -0,0 +1,136 @@
+# http_probe.py
+# 單次 HTTP 探測：
+#   - 分塊串流讀 body，同時計算大小、sha256 與內容指紋（SimHash，見 content_fingerprint），不把整頁放進記憶體
+#   - PROBE_MODE=head：只送 HEAD，大小取 Content-Length
+#   - PROBE_MODE=conditional（預設）：帶 If-None-Match / If-Modified-Since，
+#     304 表示頁面沒變，大小、hash 與指紋沿用快取
+#   - PROBE_MODE=get：每次都完整下載
+# validator 以 CrawlerTargets 項目上的 httpValidators（ETag / Last-Modified / 大小，見 crawl_state）為準，
+# 由狀態 owner 在有變化時寫回，cold start 與 fan-out 的每個 worker 都拿得到；
+# /tmp 的 JSON 檔（ValidatorCache）只是本機的 read-through 快取，另外記住 hash / 指紋，304 時沿用。
+# 連線走 http_pool（keep-alive + TLS session 重用），並回報各階段耗時。
+import hashlib
+import json
+import os
+import threading
+
+from content_fingerprint import SimHasher
+from http_pool import CachingResolver, HTTPPool
+
+CHUNK_SIZE = 64 * 1024
+USER_AGENT = "Mozilla/5.0"
+MODES = ("get", "conditional", "head")
+
+# 模組層級的連線池：同一次 run 內同 host 的目標、以及 warm invocation 之間都會重用連線（DNS 結果也是）
+default_pool = HTTPPool(resolver=CachingResolver())
+
+
+class ValidatorCache:
+    """每個 URL 的 ETag / Last-Modified / size / sha256 / simhash，存成 JSON 檔（預設 /tmp，warm container 內的本機快取）"""
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.entries = None
+        self.dirty = False
+
+    def _load(self):
+        if self.entries is None:
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    self.entries = json.load(f)
+            except (OSError, ValueError):
+                self.entries = {}
+
+    def get(self, url):
+        with self.lock:
+            self._load()
+            return self.entries.get(url)
+
+    def put(self, url, entry):
+        with self.lock:
+            self._load()
+            if self.entries.get(url) != entry:
+                self.entries[url] = entry
+                self.dirty = True
+
+    def save(self):
+        with self.lock:
+            if not self.dirty:
+                return
+            tmp = f"{self.path}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(self.entries, f)
+            os.replace(tmp, self.path)   # 原子替換，避免寫一半的檔案
+            self.dirty = False
+
+
+def read_body(response):
+    """分塊讀完 body，回傳 (bytes 數, sha256 hex, simhash hex)"""
+    digest = hashlib.sha256()
+    simhash = SimHasher()
+    size = 0
+    while True:
+        chunk = response.read(CHUNK_SIZE)
+        if not chunk:
+            break
+        size += len(chunk)
+        digest.update(chunk)
+        simhash.update(chunk)
+    return size, digest.hexdigest(), simhash.hexdigest()
+
+
+def _same_validators(a, b):
+    return (a.get("etag"), a.get("lastModified")) == (b.get("etag"), b.get("lastModified"))
+
+
+def probe(url, timeout=10, mode="conditional", cache=None, pool=None, validators=None):
+    """
+    回傳 {"status", "content_length", "sha256", "simhash", "not_modified", "validators", "timings"}。
+    validators 是目標項目上存的 {"etag", "lastModified", "size"}；本機快取沒有或不一樣時以它為準。
+    回傳的 validators 是下次要帶的值（伺服器沒給 ETag / Last-Modified 時為 None）。
+    timings 為 dns / connect / tls / ttfb / transfer 各階段秒數（reused=True 表示沿用 keep-alive 連線）。
+    網路錯誤與 4xx/5xx 照常拋出（由呼叫端轉成失敗結果）。
+    """
+    pool = pool or default_pool
+    headers = {"User-Agent": USER_AGENT, "Accept": "*/*"}
+    cached = None
+    if mode == "conditional":
+        cached = cache.get(url) if cache is not None else None
+        if validators and not (cached and _same_validators(cached, validators)):
+            # cold start、或由其他 container 探測過；表裡的數字是 Decimal
+            cached = dict(validators, size=int(validators.get("size") or 0))
+    if cached:
+        if cached.get("etag"):
+            headers["If-None-Match"] = cached["etag"]
+        if cached.get("lastModified"):
+            headers["If-Modified-Since"] = cached["lastModified"]
+
+    with pool.request("HEAD" if mode == "head" else "GET", url, headers=headers, timeout=timeout) as response:
+        status = response.status
+        timings = response.timings
+        if status == 304 and cached:
+            if cache is not None:
+                cache.put(url, cached)
+            return {"status": 304, "content_length": int(cached.get("size") or 0), "sha256": cached.get("sha256"),
+                    "simhash": cached.get("simhash"), "not_modified": True, "validators": _stored(cached),
+                    "timings": timings}
+        if mode == "head":
+            length = response.headers.get("Content-Length")
+            return {"status": status, "content_length": int(length) if length and length.isdigit() else 0,
+                    "sha256": None, "simhash": None, "not_modified": False, "validators": None, "timings": timings}
+        size, sha, simhash = read_body(response)
+        etag, last_modified = response.headers.get("ETag"), response.headers.get("Last-Modified")
+
+    entry = None
+    if etag or last_modified:
+        entry = {"etag": etag, "lastModified": last_modified, "size": size, "sha256": sha, "simhash": simhash}
+        if cache is not None:
+            cache.put(url, entry)
+    return {"status": status, "content_length": size, "sha256": sha, "simhash": simhash, "not_modified": False,
+            "validators": _stored(entry) if entry else None, "timings": timings}
+
+
+def _stored(entry):
+    """存在目標項目上的部分（hash / 指紋另有 contentSimhash，不重複存）"""
+    return {k: entry[k] for k in ("etag", "lastModified", "size") if entry.get(k) is not None}
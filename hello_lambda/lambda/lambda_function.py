@@ -1,18 +1,134 @@
 # --- at top: 保留你原本的 import，再加 json, os ---
-import urllib.request
 import time
-import boto3
+from instrumentation import instrumented, observe, phase
+import aws_clients
 import json, os   # ← 新增
+import logging
+import uuid
+from probe_engine import run_probes
+from metrics_buffer import metric_buffer_from_env
+from target_index import TargetIndex
+from http_probe import MODES, ValidatorCache, probe
+from schedule import Scheduler
+from latency_baseline import LatencyHistory
+from target_state import TargetStateWriter
+from result_store import LocalResultStore, S3ResultStore
+import circuit_breaker
+from circuit_breaker import HALF_OPEN, OPEN, TRIAL_TIMEOUT
+import crawl_state
 
-cloudwatch = boto3.client('cloudwatch')
+logger = logging.getLogger(__name__)
 
-def load_targets():
+# 所有 datapoint 先進緩衝區，handler 結束前一次批次送出
+# （METRICS_BACKEND=emf：改寫 EMF 到 stdout，不呼叫 PutMetricData）
+metrics = metric_buffer_from_env(lambda: aws_clients.client('cloudwatch'))
+
+# 併發設定（可用環境變數調整）
+CRAWL_CONCURRENCY = int(os.getenv("CRAWL_CONCURRENCY", "32"))
+CRAWL_PER_HOST = int(os.getenv("CRAWL_PER_HOST", "4"))
+# 在 Lambda timeout 前預留的時間（送 metric、組回應）
+DEADLINE_MARGIN_MS = int(os.getenv("CRAWL_DEADLINE_MARGIN_MS", "5000"))
+PROBE_TIMEOUT = 10
+# 探測模式：conditional（預設，304 幾乎零成本）/ get / head
+PROBE_MODE = os.getenv("PROBE_MODE", "conditional")
+if PROBE_MODE not in MODES:
+    PROBE_MODE = "conditional"
+PHASE_METRICS = [("DnsTime", "dns"), ("ConnectTime", "connect"), ("TlsTime", "tls"),
+                 ("TimeToFirstByte", "ttfb"), ("TransferTime", "transfer")]
+validator_cache = ValidatorCache(os.getenv("VALIDATOR_CACHE_FILE", "/tmp/validator_cache.json"))
+
+# 目標快取放在 module scope：warm start 只做增量更新，不用每次掃整張表
+TABLE_NAME = os.getenv("TABLE_NAME")
+_target_index = None
+_state_writer = None
+# 每次 run 的探測結果另存成欄式批次檔（見 result_store.py）；兩者都沒設定時不存
+RESULTS_BUCKET = os.getenv("RESULTS_BUCKET")
+RESULTS_DIR = os.getenv("RESULTS_DIR")
+_result_store = None
+# 每個目標的下次到期時間（min-heap），warm start 沿用；上次的內容指紋、circuit breaker 與最新狀態也以記憶體為準。
+# 表裡的副本只在有變化或 heartbeat（STATUS_HEARTBEAT_SECONDS，預設 30 分鐘）時寫回，
+# 所以 cold start 還原的 nextDueAt / consecutiveFailures / flapScore / latencyWindow 最多可能是 30 分鐘前的值
+# （已過期的 nextDueAt 由 Scheduler.sync 分散在一個間隔內）；同一時間只有一個 container 排程（reserved concurrency 1，見 stack）
+scheduler = Scheduler(keep=crawl_state.OWNED_FIELDS)
+# 每個目標最近的延遲（ring buffer），用來算 LatencyAnomalyScore；cold start 由表裡的 latencyWindow 還原
+latency_history = LatencyHistory()
+# 每個 tick 最多探測幾個到期目標，讓單次執行時間不隨目標數成長
+MAX_TARGETS_PER_TICK = int(os.getenv("CRAWL_MAX_PER_TICK", "500"))
+
+def _get_target_index():
+    global _target_index
+    if _target_index is None:
+        _target_index = TargetIndex(
+            aws_clients.table(TABLE_NAME),
+            total_segments=int(os.getenv("TARGETS_SCAN_SEGMENTS", "4")),
+            full_resync_seconds=int(os.getenv("TARGETS_FULL_RESYNC_SECONDS", "1800")),
+        )
+    return _target_index
+
+def get_state_writer():
+    """排程狀態寫回 CrawlerTargets；沒設定表（本地執行）時回傳 None"""
+    global _state_writer
+    if _state_writer is None and TABLE_NAME:
+        _state_writer = TargetStateWriter(aws_clients.table(TABLE_NAME))
+    return _state_writer
+
+def get_result_store():
+    global _result_store
+    if _result_store is None:
+        if RESULTS_BUCKET:
+            _result_store = S3ResultStore(aws_clients.client("s3"), RESULTS_BUCKET)
+        elif RESULTS_DIR:
+            _result_store = LocalResultStore(RESULTS_DIR)
+    return _result_store
+
+def store_results(results, run_id):
+    """寫入失敗只記 log，不影響本次探測"""
+    store = get_result_store()
+    if store is None:
+        return None
+    try:
+        return store.append(results, run_id)
+    except Exception as e:
+        print(f"⚠️ Failed to store probe results for run {run_id}: {e}")
+        return None
+
+def load_targets_file():
     file_name = os.getenv("TARGETS_FILE", "targets.json")
     path = os.path.join(os.path.dirname(__file__), file_name)
     with open(path, "r", encoding="utf-8") as f:
         return json.load(f)
 
-def check_website(url):
+def load_target_items():
+    """
+    優先從 CrawlerTargets 表讀啟用中的目標（[{"targetId", "url", 排程欄位...}, ...]）；
+    沒設定表或讀取失敗時退回 targets.json（以 URL 當 targetId）
+    """
+    if TABLE_NAME:
+        try:
+            return [dict(t) for t in _get_target_index().active_targets()]
+        except Exception:
+            logger.exception("Failed to load targets from %s, falling back to %s",
+                             TABLE_NAME, os.getenv("TARGETS_FILE", "targets.json"))
+    return [{"targetId": url, "url": url} for url in load_targets_file()]
+
+def load_targets():
+    """啟用中的 URL 清單（去重但保留順序）"""
+    return list(dict.fromkeys(t["url"] for t in load_target_items()))
+
+def crawl_deadline(context):
+    """依 Lambda 剩餘時間算出 monotonic deadline；本地執行（無 context）則不設限"""
+    if context is None or not hasattr(context, "get_remaining_time_in_millis"):
+        return None
+    remaining_ms = context.get_remaining_time_in_millis() - DEADLINE_MARGIN_MS
+    return time.monotonic() + max(remaining_ms, 0) / 1000
+
+def short_circuit(url):
+    """circuit breaker 開路中的目標：不連網路，直接記為失敗（仍送 IsSuccess=0，availability alarm 照常）"""
+    metrics.put('WebsiteMonitor', 'IsSuccess', 0, 'Count', {'URL': url})
+    return {"url": url, "ts": int(time.time()), "status": None, "latency": None, "content_length": 0, "success": False,
+            "short_circuited": True, "error": "⚡ Circuit open: target failed repeatedly, probe skipped until cooldown ends."}
+
+def check_website(url, timeout=PROBE_TIMEOUT, validators=None):
     start_time = time.time()
     status = 0
     content_length = 0
@@ -20,56 +136,121 @@ def check_website(url):
     error_message = ""
 
     try:
-        req = urllib.request.Request(url, headers={'User-Agent': 'Mozilla/5.0'})
-        with urllib.request.urlopen(req, timeout=10) as response:
-            status = response.getcode()
-            content = response.read()
-            content_length = len(content)
+        # 串流讀 body 只算大小與 hash；conditional 模式下未變更的頁面回 304
+        result = probe(url, timeout=timeout, mode=PROBE_MODE, cache=validator_cache, validators=validators)
+        status = result["status"]
+        content_length = result["content_length"]
 
         latency = time.time() - start_time
-        success = 200 <= status < 300
+        observe('probe_url', latency * 1000)
+        success = 200 <= status < 300 or result["not_modified"]
         if not success:
             error_message = "❌ Website request returned non-2xx status."
 
-        cloudwatch.put_metric_data(
-            Namespace='WebsiteMonitor',
-            MetricData=[
-                {'MetricName': 'Latency', 'Dimensions': [{'Name': 'URL', 'Value': url}], 'Value': latency, 'Unit': 'Seconds'},
-                {'MetricName': 'ResponseSize', 'Dimensions': [{'Name': 'URL', 'Value': url}], 'Value': content_length, 'Unit': 'Bytes'},
-                {'MetricName': 'StatusCode', 'Dimensions': [{'Name': 'URL', 'Value': url}], 'Value': status, 'Unit': 'None'},
-                {'MetricName': 'IsSuccess', 'Dimensions': [{'Name': 'URL', 'Value': url}], 'Value': int(success), 'Unit': 'Count'}
-            ]
-        )
-        return {"url": url, "status": status, "latency": round(latency, 2), "content_length": content_length, "success": success, "error": error_message}
+        dims = {'URL': url}
+        metrics.put('WebsiteMonitor', 'Latency', latency, 'Seconds', dims)
+        metrics.put('WebsiteMonitor', 'ResponseSize', content_length, 'Bytes', dims)
+        # conditional 模式下沒變的頁面送 304（不是 200）；判斷上 / 下線看 IsSuccess
+        metrics.put('WebsiteMonitor', 'StatusCode', status, 'None', dims)
+        metrics.put('WebsiteMonitor', 'IsSuccess', int(success), 'Count', dims)
+        # 各階段耗時：分辨是網路建線成本（DNS/TCP/TLS）還是伺服器本身慢（TTFB/傳輸）
+        timings = result["timings"]
+        for name, phase in PHASE_METRICS:
+            metrics.put('WebsiteMonitor', name, timings.get(phase, 0.0), 'Seconds', dims)
+        return {"url": url, "ts": int(start_time), "status": status, "latency": round(latency, 2), "content_length": content_length, "success": success, "error": error_message,
+                "not_modified": result["not_modified"], "sha256": result["sha256"], "simhash": result.get("simhash"),
+                "validators": result.get("validators"),
+                "timings": {k: round(v, 4) if isinstance(v, float) else v for k, v in timings.items()}}
 
     except Exception as e:
         latency = time.time() - start_time
-        cloudwatch.put_metric_data(
-            Namespace='WebsiteMonitor',
-            MetricData=[
-                {'MetricName': 'Latency', 'Dimensions': [{'Name': 'URL', 'Value': url}], 'Value': latency, 'Unit': 'Seconds'},
-                {'MetricName': 'IsSuccess', 'Dimensions': [{'Name': 'URL', 'Value': url}], 'Value': 0, 'Unit': 'Count'}
-            ]
-        )
-        return {"url": url, "status": None, "latency": round(latency, 2), "content_length": 0, "success": False, "error": f"❌ Request failed: {str(e)}"}
+        observe('probe_url', latency * 1000)
+        dims = {'URL': url}
+        metrics.put('WebsiteMonitor', 'Latency', latency, 'Seconds', dims)
+        metrics.put('WebsiteMonitor', 'IsSuccess', 0, 'Count', dims)
+        return {"url": url, "ts": int(start_time), "status": None, "latency": round(latency, 2), "content_length": 0, "success": False, "error": f"❌ Request failed: {str(e)}"}
 
+def crawl(urls, context, trial=(), validators=None):
+    """
+    併發探測 urls，回傳與 urls 對齊的結果；per-URL metric 已放進緩衝區（尚未 flush）。
+    trial 裡的 URL 是 circuit breaker 冷卻結束後的試探，用較短的 timeout。
+    validators：{url: 目標項目上存的 conditional GET validator}
+    """
+    validators = validators or {}
+
+    def check(url):
+        if url in trial:
+            return check_website(url, timeout=TRIAL_TIMEOUT, validators=validators.get(url))
+        return check_website(url, validators=validators.get(url))   # timeout 用 check_website 的預設
+
+    # deadline 到時未完成的站點標記為 skipped（不送 per-URL metric，避免誤報）
+    probed = run_probes(urls, check, max_workers=CRAWL_CONCURRENCY,
+                        per_host=CRAWL_PER_HOST, deadline=crawl_deadline(context))
+    results = []
+    for url, r in zip(urls, probed):
+        if r is None:
+            r = {"url": url, "status": None, "latency": None, "content_length": 0, "success": False,
+                 "skipped": True, "error": "⏱ Skipped: crawl deadline reached before the check finished."}
+        elif isinstance(r, Exception):
+            r = {"url": url, "status": None, "latency": None, "content_length": 0, "success": False,
+                 "error": f"❌ Request failed: {str(r)}"}
+        results.append(r)
+    validator_cache.save()
+    return results
+
+def probe_targets(targets, context, now=None):
+    """
+    依 circuit breaker 狀態探測 targets 的 URL（去重），回傳每個 URL 一筆結果：
+    open 的直接記為失敗、half_open 的做短 timeout 試探、其餘正常探測
+    """
+    states = circuit_breaker.url_states(targets, time.time() if now is None else now)
+    urls = [u for u, s in states.items() if s != OPEN]
+    trial = {u for u, s in states.items() if s == HALF_OPEN}
+    validators = {t["url"]: t[crawl_state.VALIDATOR_FIELD] for t in targets if t.get(crawl_state.VALIDATOR_FIELD)}
+    probed = dict(zip(urls, crawl(urls, context, trial, validators)))
+    return [probed[u] if u in probed else short_circuit(u) for u in states]
+
+def record_results(targets, results, writer=None):
+    """依探測結果更新本 process 持有的目標狀態（見 crawl_state.record_results）"""
+    crawl_state.record_results(targets, results, scheduler, latency_history, metrics, writer)
+
+@instrumented("crawler")
 def handler(event, context):
     overall_start = time.time()
 
-    urls = load_targets()               # ← 改：從 JSON 檔讀
-    results = [check_website(u) for u in urls]
+    # 每個 tick 只探測到期的目標（排程見 schedule.py）
+    with phase("sync"):
+        scheduler.sync(load_target_items())     # ← 改：從 DynamoDB 讀（JSON 檔為 fallback）
+        latency_history.retain(scheduler.targets)
+        due = scheduler.due(limit=MAX_TARGETS_PER_TICK)
+    with phase("probe"):
+        results = probe_targets(due, context, scheduler.clock())
+    skipped = sum(1 for r in results if r.get("skipped"))
+    short_circuited = sum(1 for r in results if r.get("short_circuited"))
+    writer = get_state_writer()
+    with phase("record"):
+        record_results(due, results, writer)
+        if writer is not None:
+            writer.flush()
+    with phase("store"):
+        store_results(results, f"{time.strftime('%Y%m%dT%H%M%S', time.gmtime(overall_start))}-{uuid.uuid4().hex[:8]}")
 
     # 發佈「本次爬蟲執行時間」與「檢查站點數」
     runtime_ms = int((time.time() - overall_start) * 1000)
-    cloudwatch.put_metric_data(
-        Namespace='WebsiteMonitorCrawler',
-        MetricData=[
-            {'MetricName': 'RunTimeMs', 'Value': runtime_ms, 'Unit': 'Milliseconds'},
-            {'MetricName': 'SitesChecked', 'Value': len(urls), 'Unit': 'Count'}
-        ]
-    )
+    metrics.put('WebsiteMonitorCrawler', 'RunTimeMs', runtime_ms, 'Milliseconds')
+    metrics.put('WebsiteMonitorCrawler', 'SitesChecked', len(results) - skipped - short_circuited, 'Count')
+    metrics.put('WebsiteMonitorCrawler', 'SitesSkipped', skipped, 'Count')
+    metrics.put('WebsiteMonitorCrawler', 'SitesShortCircuited', short_circuited, 'Count')
+    metrics.put('WebsiteMonitorCrawler', 'SitesNotDue', len(scheduler) - len(due), 'Count')
+    with phase("metrics"):
+        metrics.flush()
+
+    return format_response(results)
 
+def format_response(results):
     # 回應格式維持你原本
+    if not results:
+        return {"statusCode": 200, "body": "No targets due this tick.\n"}
     ok_any = any(r["success"] for r in results)
     body_lines = []
     for r in results:
@@ -0,0 +1,188 @@
+# latency_baseline.py
+# 以每個目標自己的延遲歷史判斷「這次是否異常地慢」，取代所有網站共用的固定 1 秒門檻：
+#   - 每個目標保留最近 WINDOW 次成功探測的延遲，存在固定大小的 ring buffer（一列一個目標）
+#   - 基準值 = 視窗內的 EWMA（越新的樣本權重越大），離散程度 = MAD（median absolute deviation）
+#   - LatencyAnomalyScore = (本次延遲 - EWMA) / (1.4826 × MAD)，只看變慢（負值記為 0）
+# 目標數達到 NUMPY_MIN_TARGETS 且有 numpy 時，整批目標一次以矩陣運算算完（此時才 import numpy，見 numpy_loader.py）；
+# 目標少或沒有 numpy（部署未加 numpy layer）時逐列以純 Python 計算，結果相同。
+# 視窗以 float16 + base64 存在 CrawlerTargets 的 latencyWindow 欄位（32 筆約 88 字元），cold start 時還原。
+import base64
+import statistics
+import struct
+import warnings
+
+import numpy_loader
+
+WINDOW = 32
+EWMA_ALPHA = 0.2
+MIN_SAMPLES = 5            # 樣本太少時不評分
+MAD_SCALE = 1.4826         # 常態分佈下 MAD × 1.4826 ≈ 標準差
+# MAD 可能為 0（延遲非常穩定），離散程度至少取 10ms 或基準值的 5%，避免微小抖動被放大成高分
+MIN_SPREAD_SECONDS = 0.01
+RELATIVE_SPREAD = 0.05
+MAX_SCORE = 100.0
+HISTORY_FIELD = "latencyWindow"
+# 純 Python 每個目標約 16µs、numpy 約 5µs：幾百個目標時差幾毫秒，不值得 import numpy 的 90ms / 15MB
+NUMPY_MIN_TARGETS = 2000
+
+
+def encode_window(samples):
+    return base64.b64encode(struct.pack(f"<{len(samples)}e", *samples)).decode("ascii")
+
+
+def decode_window(text):
+    try:
+        raw = base64.b64decode(text)
+        return list(struct.unpack(f"<{len(raw) // 2}e", raw[:len(raw) // 2 * 2]))
+    except (ValueError, TypeError, struct.error):
+        return []
+
+
+def _weights(window):
+    # 由舊到新：最新的樣本權重 1，往前每筆乘 (1 - alpha)
+    return [(1 - EWMA_ALPHA) ** (window - 1 - k) for k in range(window)]
+
+
+def _score_one(samples, value, weights):
+    """純 Python 版：samples 由舊到新"""
+    if len(samples) < MIN_SAMPLES:
+        return None
+    w = weights[-len(samples):]
+    ewma = sum(s * wk for s, wk in zip(samples, w)) / sum(w)
+    median = statistics.median(samples)
+    mad = statistics.median(abs(s - median) for s in samples)
+    spread = max(MAD_SCALE * mad, MIN_SPREAD_SECONDS, RELATIVE_SPREAD * ewma)
+    return min(max((value - ewma) / spread, 0.0), MAX_SCORE)
+
+
+class LatencyHistory:
+    """
+    每個目標最近 window 筆延遲（秒）的 ring buffer；score() 一次處理整批目標。
+    一開始每列是 Python list，目標數達到 numpy_min_targets 時才轉成 numpy 矩陣（轉換後不再轉回）。
+    """
+
+    def __init__(self, window=WINDOW, capacity=256, numpy_min_targets=None):
+        self.window = window
+        self.capacity = capacity
+        self.numpy_min_targets = NUMPY_MIN_TARGETS if numpy_min_targets is None else numpy_min_targets
+        self._rows = {}      # targetId -> 列號
+        self._free = []
+        self._weights = _weights(window)
+        self._np = None      # 轉成矩陣之後才是 numpy 模組
+        self._samples = []
+
+    def __len__(self):
+        return len(self._rows)
+
+    def __contains__(self, target_id):
+        return target_id in self._rows
+
+    def _use_numpy(self):
+        """把每列的 list 搬進 (列數, window) 的 float32 矩陣；沒有 numpy 時維持純 Python"""
+        np = numpy_loader.load()
+        if np is None:
+            return
+        samples = np.full((max(self.capacity, len(self._samples)), self.window), np.nan, dtype=np.float32)
+        pos = np.zeros(len(samples), dtype=np.intp)    # 下一筆要寫入的位置（也就是最舊的一筆）
+        for row, buf in enumerate(self._samples):
+            samples[row, :len(buf)] = buf
+            pos[row] = len(buf) % self.window
+        self._np, self._samples, self._pos = np, samples, pos
+        self._offsets = np.arange(self.window)
+        self._np_weights = np.array(self._weights)
+
+    def _row(self, target_id):
+        row = self._rows.get(target_id)
+        if row is not None:
+            return row
+        np = self._np
+        if self._free:
+            row = self._free.pop()
+        elif np is not None:
+            row = len(self._rows)
+            if row == len(self._samples):   # 容量不足時加倍
+                grow = np.full((len(self._samples), self.window), np.nan, dtype=np.float32)
+                self._samples = np.vstack([self._samples, grow])
+                self._pos = np.concatenate([self._pos, np.zeros(len(grow), dtype=np.intp)])
+        else:
+            row = len(self._samples)
+            self._samples.append([])
+        self._rows[target_id] = row
+        return row
+
+    def forget(self, target_id):
+        row = self._rows.pop(target_id, None)
+        if row is None:
+            return
+        if self._np is not None:
+            self._samples[row] = self._np.nan
+            self._pos[row] = 0
+        else:
+            self._samples[row] = []
+        self._free.append(row)
+
+    def retain(self, target_ids):
+        """移除不在 target_ids 裡的目標（已刪除或停用）"""
+        for tid in set(self._rows) - set(target_ids):
+            self.forget(tid)
+
+    def samples(self, target_id):
+        """由舊到新的延遲清單"""
+        row = self._rows.get(target_id)
+        if row is None:
+            return []
+        if self._np is None:
+            return list(self._samples[row])
+        ordered = self._samples[row, (self._pos[row] + self._offsets) % self.window]
+        return [float(v) for v in ordered[~self._np.isnan(ordered)]]
+
+    def seed(self, target_id, samples):
+        """以表裡存的視窗還原（記憶體中已有此目標時不覆蓋）"""
+        if target_id in self._rows or not samples:
+            return
+        values = list(samples)[-self.window:]
+        self._append([self._row(target_id)] * len(values), values)
+
+    def _append(self, rows, values):
+        for row, value in zip(rows, values):
+            if self._np is not None:
+                self._samples[row, self._pos[row]] = value
+                self._pos[row] = (self._pos[row] + 1) % self.window
+            else:
+                buf = self._samples[row]
+                buf.append(value)
+                del buf[:-self.window]
+
+    def score(self, target_ids, latencies):
+        """
+        以各目標目前的視窗為基準替本次延遲評分，再把本次延遲加入視窗。
+        回傳與 target_ids 對齊的分數（樣本不足時為 None）；同一批內 target_ids 不可重複。
+        """
+        if not target_ids:
+            return []
+        if self._np is None and max(len(self._rows), len(target_ids)) >= self.numpy_min_targets:
+            self._use_numpy()
+        rows = [self._row(t) for t in target_ids]
+        np = self._np
+        if np is None:
+            scores = [_score_one(self._samples[r], v, self._weights) for r, v in zip(rows, latencies)]
+            self._append(rows, latencies)
+            return scores
+
+        rows = np.asarray(rows, dtype=np.intp)
+        x = np.asarray(latencies, dtype=np.float64)
+        ordered = self._samples[rows[:, None], (self._pos[rows][:, None] + self._offsets) % self.window]
+        valid = ~np.isnan(ordered)
+        counts = valid.sum(axis=1)
+        with warnings.catch_warnings(), np.errstate(invalid="ignore", divide="ignore"):
+            warnings.simplefilter("ignore", RuntimeWarning)   # 全是 NaN 的列（新目標）
+            weights = np.where(valid, self._np_weights, 0.0)
+            ewma = np.nansum(ordered * self._np_weights, axis=1) / weights.sum(axis=1)
+            median = np.nanmedian(ordered, axis=1)
+            mad = np.nanmedian(np.abs(ordered - median[:, None]), axis=1)
+            spread = np.maximum(MAD_SCALE * mad, np.maximum(MIN_SPREAD_SECONDS, RELATIVE_SPREAD * ewma))
+            scores = np.clip((x - ewma) / spread, 0.0, MAX_SCORE)
+
+        self._samples[rows, self._pos[rows]] = x
+        self._pos[rows] = (self._pos[rows] + 1) % self.window
+        return [float(s) if n >= MIN_SAMPLES else None for s, n in zip(scores, counts)]
@@ -1,22 +1,80 @@
-import os, json, time
-import boto3
+import os, json, base64, logging
+from instrumentation import elapsed_ms, instrumented, phase
+import aws_clients
+from botocore.exceptions import ClientError
+import etag
+from target_items import json_default
+
+logger = logging.getLogger(__name__)
 
 TABLE_NAME = os.environ["TABLE_NAME"]
-table = boto3.resource("dynamodb").Table(TABLE_NAME)
+table = aws_clients.table(TABLE_NAME)   # client 第一次呼叫時才建立
+
+ACTIVE_INDEX = "ActiveIndex"   # PK: activeStatus ("true"/"false"), SK: createdAt
+# ActiveIndex 還不存在（分階段部署）或還在建立 / backfill 中時，Query 會回 ValidationException：
+# 改用 Scan + FilterExpression（沒有 active 欄位的舊項目視為啟用中，與 crawler 相同）
+# 條件一律寫成字串：import boto3.dynamodb.conditions 要花 300ms 以上的 cold start
+SCAN_FILTERS = {"true": "attribute_not_exists(#a) OR #a = :a", "false": "#a = :a"}
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 200
+
+def encode_token(last_key, active_filter):
+    # 不透明的分頁 token：把 LastEvaluatedKey 與篩選條件一起 base64 編碼
+    raw = json.dumps({"k": last_key, "a": active_filter}, separators=(",", ":"), default=json_default)
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+def decode_token(token, active_filter):
+    try:
+        data = json.loads(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)))
+    except ValueError:
+        raise ValueError("invalid nextToken")
+    if not isinstance(data, dict) or not isinstance(data.get("k"), dict) or data.get("a") != active_filter:
+        raise ValueError("invalid nextToken")
+    return data["k"]
+
+def query_active(active_filter, kwargs):
+    try:
+        return table.query(IndexName=ACTIVE_INDEX, KeyConditionExpression="activeStatus = :s",
+                           ExpressionAttributeValues={":s": active_filter}, **kwargs)
+    except ClientError as e:
+        if e.response["Error"]["Code"] != "ValidationException":
+            raise
+        logger.warning("%s is not queryable yet, falling back to a filtered scan: %s",
+                       ACTIVE_INDEX, e.response["Error"].get("Message"))
+    return table.scan(FilterExpression=SCAN_FILTERS[active_filter], ExpressionAttributeNames={"#a": "active"},
+                      ExpressionAttributeValues={":a": active_filter == "true"}, **kwargs)
 
+@instrumented("list_targets")
 def handler(event, context):
-    start = time.time()
     qs = event.get("queryStringParameters") or {}
     active_filter = qs.get("active")
-    items, resp = [], table.scan()
-    items.extend(resp.get("Items", []))
-    while "LastEvaluatedKey" in resp:
-        resp = table.scan(ExclusiveStartKey=resp["LastEvaluatedKey"])
-        items.extend(resp.get("Items", []))
-
     if active_filter is not None:
-        val = active_filter.lower() == "true"
-        items = [i for i in items if bool(i.get("active", True)) == val]
+        active_filter = "true" if active_filter.lower() == "true" else "false"
+
+    try:
+        limit = int(qs.get("limit") or DEFAULT_LIMIT)
+    except ValueError:
+        return {"statusCode": 400, "body": json.dumps({"error": "limit must be an integer"})}
+    limit = max(1, min(limit, MAX_LIMIT))
+
+    kwargs = {"Limit": limit}
+    if qs.get("nextToken"):
+        try:
+            with phase("parse"):
+                kwargs["ExclusiveStartKey"] = decode_token(qs["nextToken"], active_filter)
+        except ValueError as e:
+            return {"statusCode": 400, "body": json.dumps({"error": str(e)})}
+
+    # 有 active 篩選 → Query ActiveIndex；沒有 → 分頁 Scan（一次只讀一頁）
+    with phase("dynamo"):
+        if active_filter is not None:
+            resp = query_active(active_filter, kwargs)
+        else:
+            resp = table.scan(**kwargs)
+    items = resp.get("Items", [])
 
-    latency = round((time.time() - start) * 1000, 2)
-    return {"statusCode": 200, "body": json.dumps({"items": items, "count": len(items), "dynamoLatencyMs": latency})}
+    with phase("serialize"):
+        data = {"items": items, "count": len(items)}
+        if "LastEvaluatedKey" in resp:
+            data["nextToken"] = encode_token(resp["LastEvaluatedKey"], active_filter)
+        return etag.respond(event, data, {"dynamoLatencyMs": elapsed_ms("dynamo")})
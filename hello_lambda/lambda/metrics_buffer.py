@@ -0,0 +1,177 @@
+# metrics_buffer.py
+# CloudWatch metric 緩衝區：
+#   - put() 只是把 datapoint 放進記憶體（不做任何網路呼叫），探測迴圈不會被 metric 拖慢
+#   - 依 namespace 分組，湊滿 API 上限（1000 datapoints / 1MB）就丟到背景 thread 送出
+#   - flush() 並行送出剩下的批次並等待完成
+#   - 被 throttle 的呼叫以 exponential backoff + jitter 重試
+#   - client 在第一次送出時才建立（client_factory），import / cold start 時不建 client、不載入 botocore
+# METRICS_BACKEND=emf 時改用 EmfMetricBuffer：把 metric 以 Embedded Metric Format 寫到 stdout，
+# 由 CloudWatch Logs 轉成 metric，探測路徑上完全沒有 API 呼叫（namespace / 名稱 / 維度不變）。
+import json
+import logging
+import os
+import sys
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from datetime import datetime, timezone
+
+logger = logging.getLogger(__name__)
+
+MAX_DATUMS_PER_CALL = 1000
+MAX_BYTES_PER_CALL = 1_000_000
+THROTTLE_CODES = {"Throttling", "ThrottlingException", "RequestLimitExceeded", "TooManyRequestsException"}
+# EMF 限制：每份文件最多 100 個 metric，每個 metric 最多 100 個值
+EMF_MAX_METRICS = 100
+EMF_MAX_VALUES = 100
+
+
+def _datum_size(datum):
+    """估計單一 datum 在 PutMetricData（query protocol）請求中的大小，寧可高估"""
+    size = 80 + len(datum["MetricName"]) + len(str(datum.get("Value", ""))) + len(datum.get("Unit", ""))
+    for d in datum.get("Dimensions", []):
+        size += 100 + len(d["Name"]) + len(d["Value"])
+    return size
+
+
+class MetricBuffer:
+    def __init__(self, client=None, max_workers=4, max_retries=5, base_delay=0.2, sleep=time.sleep,
+                 client_factory=None):
+        self._client = client
+        self._client_factory = client_factory
+        self._client_lock = threading.Lock()
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.sleep = sleep
+        self._lock = threading.Lock()
+        self._batches = {}   # namespace -> (datums, bytes)
+        self._futures = []
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="metrics")
+        self.calls = 0
+        self.failed = 0
+
+    @property
+    def client(self):
+        if self._client is None:
+            with self._client_lock:   # 多個背景 thread 可能同時第一次送出
+                if self._client is None:
+                    self._client = self._client_factory()
+        return self._client
+
+    def put(self, namespace, name, value, unit="None", dimensions=None):
+        datum = {"MetricName": name, "Value": value, "Unit": unit, "Timestamp": datetime.now(timezone.utc)}
+        if dimensions:
+            datum["Dimensions"] = [{"Name": k, "Value": v} for k, v in dimensions.items()]
+        self.add(namespace, datum)
+
+    def add(self, namespace, datum):
+        size = _datum_size(datum)
+        with self._lock:
+            datums, total = self._batches.get(namespace, ([], 0))
+            if datums and (len(datums) >= MAX_DATUMS_PER_CALL or total + size > MAX_BYTES_PER_CALL):
+                # 這批滿了：交給背景 thread 送，呼叫端不等待
+                self._futures.append(self._pool.submit(self._send, namespace, datums))
+                datums, total = [], 0
+            datums.append(datum)
+            self._batches[namespace] = (datums, total + size)
+
+    def flush(self):
+        """送出所有緩衝中的 datapoint，等待所有批次（含背景中的）完成，回傳本輪呼叫統計"""
+        with self._lock:
+            for namespace, (datums, _) in self._batches.items():
+                if datums:
+                    self._futures.append(self._pool.submit(self._send, namespace, datums))
+            self._batches = {}
+            futures, self._futures = self._futures, []
+        wait(futures)
+        with self._lock:
+            stats = {"calls": self.calls, "failed": self.failed}
+            self.calls = self.failed = 0
+        return stats
+
+    def _send(self, namespace, datums):
+        from botocore.exceptions import ClientError
+        for attempt in range(self.max_retries + 1):
+            try:
+                self.client.put_metric_data(Namespace=namespace, MetricData=datums)
+                with self._lock:
+                    self.calls += 1
+                return
+            except ClientError as e:
+                code = e.response.get("Error", {}).get("Code")
+                if code not in THROTTLE_CODES or attempt == self.max_retries:
+                    logger.error("PutMetricData failed for %s (%d datapoints): %s", namespace, len(datums), e)
+                    break
+                # full jitter backoff
+                self.sleep(random.uniform(0, self.base_delay * (2 ** attempt)))
+            except Exception as e:
+                logger.error("PutMetricData failed for %s (%d datapoints): %s", namespace, len(datums), e)
+                break
+        with self._lock:
+            self.failed += len(datums)
+
+
+class EmfMetricBuffer:
+    """
+    與 MetricBuffer 相同介面，但輸出 EMF JSON 行。
+    同一個 (namespace, 維度組合) 的 datapoint 合成一份文件：
+    每個 metric 名稱一個欄位，同名的多個值放成陣列（CloudWatch 會逐一計入統計）。
+    """
+
+    def __init__(self, write=None, clock=time.time):
+        self.write = write or sys.stdout.write
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._groups = {}   # (namespace, ((k, v), ...)) -> {"ts": ms, "values": {name: [values]}, "units": {name: unit}}
+
+    def put(self, namespace, name, value, unit="None", dimensions=None):
+        key = (namespace, tuple(sorted((dimensions or {}).items())))
+        with self._lock:
+            group = self._groups.get(key)
+            if group is None:
+                group = self._groups[key] = {"ts": int(self.clock() * 1000), "values": {}, "units": {}}
+            group["values"].setdefault(name, []).append(value)
+            group["units"][name] = unit
+
+    def add(self, namespace, datum):
+        dims = {d["Name"]: d["Value"] for d in datum.get("Dimensions", [])}
+        self.put(namespace, datum["MetricName"], datum["Value"], datum.get("Unit", "None"), dims)
+
+    def flush(self):
+        """把緩衝中的 datapoint 寫成 EMF 行；回傳 {"calls": 0, "failed": 0, "documents": 文件數}"""
+        with self._lock:
+            groups, self._groups = self._groups, {}
+        lines = [json.dumps(doc, separators=(",", ":"))
+                 for (namespace, dims), group in groups.items()
+                 for doc in _emf_documents(namespace, dict(dims), group)]
+        if lines:
+            self.write("\n".join(lines) + "\n")
+        return {"calls": 0, "failed": 0, "documents": len(lines)}
+
+
+def _emf_documents(namespace, dims, group):
+    """依 EMF 上限把一個維度組合切成一或多份文件"""
+    pending = {name: list(values) for name, values in group["values"].items()}
+    while pending:
+        doc = dict(dims)
+        definitions = []
+        for name in list(pending)[:EMF_MAX_METRICS]:
+            values = pending[name][:EMF_MAX_VALUES]
+            pending[name] = pending[name][EMF_MAX_VALUES:]
+            if not pending[name]:
+                del pending[name]
+            doc[name] = values[0] if len(values) == 1 else values
+            definitions.append({"Name": name, "Unit": group["units"][name]})
+        doc["_aws"] = {
+            "Timestamp": group["ts"],
+            "CloudWatchMetrics": [{"Namespace": namespace, "Dimensions": [list(dims)], "Metrics": definitions}],
+        }
+        yield doc
+
+
+def metric_buffer_from_env(client_factory):
+    """METRICS_BACKEND=emf → EmfMetricBuffer（不需要 client）；其他 → MetricBuffer（第一次送出時才呼叫 client_factory）"""
+    if os.getenv("METRICS_BACKEND", "api").lower() == "emf":
+        return EmfMetricBuffer()
+    return MetricBuffer(client_factory=client_factory)
@@ -0,0 +1,17 @@
+# numpy_loader.py
+# numpy 是選用的（見 README），import 一次約 90ms、peak RSS 多 15MB：
+# 不在模組載入時 import，只有真的用到（大批次延遲評分、讀取結果批次檔做報表）時才載入，
+# 一般的 crawler tick 不付這個成本。
+_numpy = None   # None：還沒試過；False：沒有安裝
+
+
+def load():
+    """回傳 numpy 模組，沒有安裝時回傳 None（結果會記住，不會每次都重試 import）"""
+    global _numpy
+    if _numpy is None:
+        try:
+            import numpy
+        except ImportError:
+            numpy = False
+        _numpy = numpy
+    return _numpy or None
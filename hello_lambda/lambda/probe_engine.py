@@ -0,0 +1,68 @@
+# probe_engine.py
+# 併發探測引擎：
+#   - 全域併發上限（有界 thread pool）
+#   - 每個 host 的併發上限（避免同一站被我們一次打太多連線）
+#   - 全域 deadline：時間到就回傳已完成的部分結果，未完成者為 None
+# 整體執行時間 ≈ 最慢的一個探測，而不是所有探測的總和。
+import time
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from urllib.parse import urlsplit
+
+
+def host_of(url):
+    return (urlsplit(url).hostname or url).lower()
+
+
+def run_probes(urls, probe, max_workers=32, per_host=4, deadline=None):
+    """
+    對每個 url 執行 probe(url)，回傳與 urls 對齊的結果 list。
+    deadline 為 time.monotonic() 的絕對時間；逾時仍未完成的 url 結果為 None，
+    probe 拋出的例外會原樣放在對應位置。
+    """
+    results = [None] * len(urls)
+    if not urls:
+        return results
+
+    # 依 host 分組排隊，每個 host 同時最多 per_host 個在跑
+    pending = defaultdict(deque)
+    for i, url in enumerate(urls):
+        pending[host_of(url)].append(i)
+    running_per_host = defaultdict(int)
+    in_flight = {}
+
+    pool = ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="probe")
+
+    def submit_ready(host):
+        queue = pending[host]
+        while queue and running_per_host[host] < per_host:
+            i = queue.popleft()
+            running_per_host[host] += 1
+            in_flight[pool.submit(probe, urls[i])] = (i, host)
+
+    try:
+        for host in list(pending):
+            submit_ready(host)
+
+        while in_flight:
+            timeout = None
+            if deadline is not None:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+            done, _ = wait(list(in_flight), timeout=timeout, return_when=FIRST_COMPLETED)
+            if not done:
+                break  # 到 deadline 了
+            for fut in done:
+                i, host = in_flight.pop(fut)
+                running_per_host[host] -= 1
+                try:
+                    results[i] = fut.result()
+                except Exception as e:
+                    results[i] = e
+                submit_ready(host)
+    finally:
+        # 不等還在跑的探測；排隊中的直接取消
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    return results
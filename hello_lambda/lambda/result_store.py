@@ -0,0 +1,353 @@
+# result_store.py
+# 每次 crawl 的探測結果存成欄式（columnar）批次檔，依小時分區，供歷史延遲 / SLA 報表使用，
+# 不必再對 CloudWatch 做大量 GetMetricData。
+#
+# 檔案格式（.prc，little-endian）：
+#   b"PRC1" | header 長度 (uint32) | JSON header（rows、各區段位移）補齊到 8 bytes | 各欄資料 | URL 字典
+#   每一欄是連續的固定寬度陣列（與 array 模組 / numpy 相同的記憶體配置），每欄起點對齊 8 bytes，
+#   讀取時 mmap 整個檔案，直接把欄位當陣列看（不複製、不解析每一列）。
+#   URL 字典（urlId → URL，zlib 壓縮的 JSON）放在最後，只有需要把 urlId 轉回 URL 時才解開。
+# 分區：<prefix>dt=YYYY-MM-DD/hour=HH/<runId>.prc（UTC），依檔案裡最早一列的 ts 分區；
+#   一次 run 不超過 Lambda 的 15 分鐘上限，所以一個檔案的列最多跨到下一個小時，讀取時往前多看一個小時的分區
+#   - LocalResultStore：本地目錄（測試 / 本地分析）
+#   - S3ResultStore：部署時寫到 RESULTS_BUCKET；讀取時先把範圍內的檔案下載到本地快取再 mmap
+# 報表：python hello_lambda/lambda/result_store.py report --root DIR --from 2026-10-01 --to 2026-10-15
+import abc
+import argparse
+import array
+import hashlib
+import json
+import mmap
+import os
+import struct
+import sys
+import time
+import zlib
+from datetime import datetime, timedelta, timezone
+
+import numpy_loader   # numpy 是選用的，只有讀取 / 報表時才載入；沒有時報表逐列以純 Python 彙總
+
+MAGIC = b"PRC1"
+SUFFIX = ".prc"
+# (欄位, array typecode)；由寬到窄排列，每欄自然對齊
+COLUMNS = [
+    ("urlId", "Q"), ("ts", "I"), ("latencyMs", "f"), ("size", "I"),
+    ("dnsMs", "f"), ("connectMs", "f"), ("tlsMs", "f"), ("ttfbMs", "f"), ("transferMs", "f"),
+    ("status", "H"), ("flags", "B"),
+]
+PHASES = [("dnsMs", "dns"), ("connectMs", "connect"), ("tlsMs", "tls"), ("ttfbMs", "ttfb"), ("transferMs", "transfer")]
+FLAG_SUCCESS = 1
+FLAG_NOT_MODIFIED = 2
+FLAG_SKIPPED = 4
+MAX_UINT32 = 2 ** 32 - 1
+
+if sys.byteorder != "little":   # Lambda（x86_64 / arm64）都是 little-endian
+    raise ImportError("result_store requires a little-endian platform")
+
+
+def url_id(url):
+    return int.from_bytes(hashlib.blake2b(url.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def partition(ts):
+    return time.strftime("dt=%Y-%m-%d/hour=%H", time.gmtime(ts))
+
+
+def _pad(n):
+    return -n % 8
+
+
+# --- 寫入 ---------------------------------------------------------------------
+def encode_results(results, ts):
+    """把 crawl() 的結果轉成一個 .prc 檔的 bytes；ts 為沒有自己時間戳記的結果（例如 skipped）所用"""
+    cols = {name: array.array(code) for name, code in COLUMNS}
+    urls = {}
+    for r in results:
+        uid = url_id(r["url"])
+        urls[f"{uid:016x}"] = r["url"]
+        timings = r.get("timings") or {}
+        cols["urlId"].append(uid)
+        cols["ts"].append(int(r.get("ts") or ts))
+        cols["latencyMs"].append((r.get("latency") or 0) * 1000)
+        cols["size"].append(min(int(r.get("content_length") or 0), MAX_UINT32))
+        for name, phase in PHASES:
+            value = timings.get(phase)
+            cols[name].append(value * 1000 if isinstance(value, (int, float)) else 0.0)
+        cols["status"].append(int(r.get("status") or 0))
+        cols["flags"].append((FLAG_SUCCESS if r.get("success") else 0)
+                             | (FLAG_NOT_MODIFIED if r.get("not_modified") else 0)
+                             | (FLAG_SKIPPED if r.get("skipped") else 0))
+
+    layout, offset = [], 0
+    for name, code in COLUMNS:
+        nbytes = len(cols[name]) * cols[name].itemsize
+        layout.append([name, code, offset, nbytes])
+        offset += nbytes + _pad(nbytes)
+    url_section = zlib.compress(json.dumps(urls, separators=(",", ":")).encode())
+    header = json.dumps({"rows": len(results), "columns": layout, "urls": [offset, len(url_section)]},
+                        separators=(",", ":")).encode()
+    header += b" " * _pad(len(MAGIC) + 4 + len(header))
+    parts = [MAGIC, struct.pack("<I", len(header)), header]
+    for name, _ in COLUMNS:
+        data = cols[name].tobytes()
+        parts.append(data + b"\0" * _pad(len(data)))
+    parts.append(url_section)
+    return b"".join(parts)
+
+
+class ResultStore(abc.ABC):
+    def __init__(self, prefix="results/"):
+        self.prefix = prefix
+
+    def key(self, ts, run_id):
+        return f"{self.prefix}{partition(ts)}/{run_id}{SUFFIX}"
+
+    def append(self, results, run_id, ts=None):
+        """寫一個批次檔，回傳 key（沒有結果時不寫，回傳 None）"""
+        if not results:
+            return None
+        ts = time.time() if ts is None else ts
+        first = min(int(r.get("ts") or ts) for r in results)   # 寫入時間可能已經是下一個小時
+        key = self.key(first, run_id)
+        self.put(key, encode_results(results, ts))
+        return key
+
+    @abc.abstractmethod
+    def put(self, key, data):
+        """寫入一個批次檔"""
+
+    @abc.abstractmethod
+    def paths(self, start, end):
+        """可能含有 [start, end) 範圍內的列、可 mmap 的本地檔案路徑（報表再依 ts 過濾）"""
+
+    def _hour_prefixes(self, start, end):
+        hour = datetime.fromtimestamp(start, timezone.utc).replace(minute=0, second=0, microsecond=0)
+        hour -= timedelta(hours=1)   # 前一個小時開始的 run 可能有列落在 start 之後
+        while hour.timestamp() < end:
+            yield f"{self.prefix}{hour.strftime('dt=%Y-%m-%d/hour=%H')}/"
+            hour += timedelta(hours=1)
+
+
+class LocalResultStore(ResultStore):
+    def __init__(self, root, prefix="results/"):
+        super().__init__(prefix)
+        self.root = root
+
+    def put(self, key, data):
+        path = os.path.join(self.root, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)   # 讀取端不會看到寫一半的檔案
+
+    def paths(self, start, end):
+        out = []
+        for prefix in self._hour_prefixes(start, end):
+            directory = os.path.join(self.root, prefix)
+            if os.path.isdir(directory):
+                out.extend(os.path.join(directory, n) for n in sorted(os.listdir(directory)) if n.endswith(SUFFIX))
+        return out
+
+
+class S3ResultStore(ResultStore):
+    def __init__(self, client, bucket, prefix="results/", cache_dir="/tmp/result_store"):
+        super().__init__(prefix)
+        self.client = client
+        self.bucket = bucket
+        self.cache_dir = cache_dir
+
+    def put(self, key, data):
+        self.client.put_object(Bucket=self.bucket, Key=key, Body=data, ContentType="application/octet-stream")
+
+    def paths(self, start, end):
+        """下載範圍內尚未快取的檔案（批次檔寫入後不再修改，快取過的直接沿用）"""
+        out = []
+        paginator = self.client.get_paginator("list_objects_v2")
+        for prefix in self._hour_prefixes(start, end):
+            for page in paginator.paginate(Bucket=self.bucket, Prefix=prefix):
+                for obj in page.get("Contents", []):
+                    path = os.path.join(self.cache_dir, obj["Key"])
+                    if not os.path.exists(path) or os.path.getsize(path) != obj["Size"]:
+                        os.makedirs(os.path.dirname(path), exist_ok=True)
+                        self.client.download_file(self.bucket, obj["Key"], path)
+                    out.append(path)
+        return out
+
+
+# --- 讀取 ---------------------------------------------------------------------
+class ResultBatch:
+    """mmap 一個 .prc 檔；column() 回傳零複製的 memoryview（有 numpy 時為 ndarray）"""
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mm[:4] != MAGIC:
+            self._mm.close()
+            raise ValueError(f"{path} is not a probe result batch")
+        (header_len,) = struct.unpack_from("<I", self._mm, 4)
+        header = json.loads(self._mm[8:8 + header_len])
+        self._data = 8 + header_len
+        self.rows = header["rows"]
+        self._url_section = header["urls"]
+        self._urls = None
+        self._layout = {name: (code, offset, nbytes) for name, code, offset, nbytes in header["columns"]}
+        self._views = []
+
+    @property
+    def urls(self):
+        """{urlId: URL}（第一次用到時才解壓）"""
+        if self._urls is None:
+            offset, nbytes = self._url_section
+            start = self._data + offset
+            raw = json.loads(zlib.decompress(self._mm[start:start + nbytes]))
+            self._urls = {int(k, 16): v for k, v in raw.items()}
+        return self._urls
+
+    def column(self, name):
+        code, offset, nbytes = self._layout[name]
+        start = self._data + offset
+        np = numpy_loader.load()
+        if np is not None:
+            return np.frombuffer(self._mm, dtype=np.dtype(code), count=self.rows, offset=start)
+        view = memoryview(self._mm)[start:start + nbytes].cast(code)
+        self._views.append(view)
+        return view
+
+    def close(self):
+        for view in self._views:
+            view.release()
+        self._views = []
+        try:
+            self._mm.close()
+        except BufferError:
+            pass   # 還有 numpy 陣列參照這塊記憶體；陣列釋放後 mmap 由 GC 關閉
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _percentile(ordered, q):
+    if not ordered:
+        return None
+    return ordered[min(len(ordered) - 1, int(round(q / 100 * (len(ordered) - 1))))]
+
+
+def _resolve_urls(paths, ids):
+    """由最新的檔案往回找，直到所有 urlId 都有對應的 URL"""
+    names, missing = {}, set(ids)
+    for path in reversed(paths):
+        if not missing:
+            break
+        with ResultBatch(path) as batch:
+            found = missing & batch.urls.keys()
+            names.update((uid, batch.urls[uid]) for uid in found)
+            missing -= found
+    return names
+
+
+def _report_python(paths, start, end):
+    stats = {}
+    for path in paths:
+        with ResultBatch(path) as batch:
+            for uid, ts, flags, latency, ttfb in zip(batch.column("urlId"), batch.column("ts"), batch.column("flags"),
+                                                     batch.column("latencyMs"), batch.column("ttfbMs")):
+                if not start <= ts < end or flags & FLAG_SKIPPED:
+                    continue
+                s = stats.setdefault(uid, [0, 0, [], 0.0])
+                s[0] += 1
+                if flags & FLAG_SUCCESS:
+                    s[1] += 1
+                    s[2].append(latency)
+                    s[3] += ttfb
+    urls = _resolve_urls(paths, stats)
+    rows = []
+    for uid, (probes, ok, latencies, ttfb_sum) in stats.items():
+        latencies.sort()
+        rows.append(_row(urls.get(uid), probes, ok, _percentile(latencies, 50), _percentile(latencies, 95),
+                         sum(latencies) / ok if ok else None, ttfb_sum / ok if ok else None))
+    return rows
+
+
+def _report_numpy(paths, start, end):
+    parts = []
+    for path in paths:
+        with ResultBatch(path) as batch:
+            ts, flags = batch.column("ts"), batch.column("flags")
+            keep = (ts >= start) & (ts < end) & ((flags & FLAG_SKIPPED) == 0)
+            # 布林索引會複製出新陣列，之後就不再參照 mmap
+            parts.append((batch.column("urlId")[keep], (flags[keep] & FLAG_SUCCESS) > 0,
+                          batch.column("latencyMs")[keep], batch.column("ttfbMs")[keep]))
+    if not parts:
+        return []
+    np = numpy_loader.load()
+    uid, ok, latency, ttfb = (np.concatenate(c) for c in zip(*parts))
+    ids, group = np.unique(uid, return_inverse=True)
+    probes = np.bincount(group, minlength=len(ids))
+    ok_count = np.bincount(group, weights=ok, minlength=len(ids))
+    lat_sum = np.bincount(group[ok], weights=latency[ok], minlength=len(ids))
+    ttfb_sum = np.bincount(group[ok], weights=ttfb[ok], minlength=len(ids))
+    # 百分位數：成功的樣本依 (群組, 延遲) 排序後，直接取每個群組內的位置
+    order = np.lexsort((latency[ok], group[ok]))
+    sorted_lat = latency[ok][order]
+    n_ok = ok_count.astype(np.int64)
+    first = np.concatenate([[0], np.cumsum(n_ok)[:-1]])
+    urls = _resolve_urls(paths, (int(v) for v in ids))
+    rows = []
+    for i, uid_value in enumerate(ids):
+        n = int(n_ok[i])
+        pct = {}
+        for q in (50, 95):
+            pct[q] = float(sorted_lat[first[i] + min(n - 1, int(round(q / 100 * (n - 1))))]) if n else None
+        rows.append(_row(urls.get(int(uid_value)), int(probes[i]), n, pct[50], pct[95],
+                         float(lat_sum[i] / n) if n else None, float(ttfb_sum[i] / n) if n else None))
+    return rows
+
+
+def _row(url, probes, ok, p50, p95, avg, ttfb):
+    def r(v):
+        return None if v is None else round(float(v), 1)
+    return {"url": url, "probes": probes, "successes": ok, "availability": round(ok / probes, 5) if probes else None,
+            "p50LatencyMs": r(p50), "p95LatencyMs": r(p95), "avgLatencyMs": r(avg), "avgTtfbMs": r(ttfb)}
+
+
+def sla_report(store, start, end):
+    """[start, end)（epoch 秒）內每個 URL 的探測數、可用率與延遲統計，依可用率由低到高排序"""
+    paths = store.paths(start, end)
+    rows = (_report_numpy if numpy_loader.load() is not None else _report_python)(paths, start, end)
+    rows.sort(key=lambda row: (row["availability"] if row["availability"] is not None else 2, row["url"] or ""))
+    total = sum(row["probes"] for row in rows)
+    ok = sum(row["successes"] for row in rows)
+    return {"from": start, "to": end, "files": len(paths), "probes": total,
+            "availability": round(ok / total, 5) if total else None, "targets": rows}
+
+
+def _epoch(text):
+    return datetime.fromisoformat(text).replace(tzinfo=timezone.utc).timestamp()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="SLA report from stored probe result batches.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    report = sub.add_parser("report")
+    report.add_argument("--root", help="local directory with results/dt=.../hour=... partitions")
+    report.add_argument("--bucket", help="S3 bucket (files are cached under --cache-dir)")
+    report.add_argument("--cache-dir", default=os.path.join(os.path.expanduser("~"), ".cache", "result_store"))
+    report.add_argument("--from", dest="start", required=True, help="UTC date/time, e.g. 2026-10-01")
+    report.add_argument("--to", dest="end", required=True, help="UTC date/time (exclusive)")
+    args = parser.parse_args(argv)
+
+    if args.bucket:
+        import boto3
+        store = S3ResultStore(boto3.client("s3"), args.bucket, cache_dir=args.cache_dir)
+    else:
+        store = LocalResultStore(args.root or ".")
+    json.dump(sla_report(store, _epoch(args.start), _epoch(args.end)), sys.stdout, indent=2)
+    sys.stdout.write("\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+# schedule.py
+# 每個目標自己的探測排程（取代「全部目標每 5 分鐘掃一次」）：
+#   - 間隔可由目標的 intervalSeconds 設定（預設 BASE_INTERVAL_SECONDS）
+#   - 狀態來回跳動（flapping）的目標：間隔快速加倍，避免一直產生 alarm 轉換
+#   - 長時間連不上的目標：間隔緩慢拉長（每次失敗 x1.25），上限 MAX_INTERVAL_SECONDS，恢復後馬上回到原本間隔
+#   - 加上 ±JITTER 的隨機偏移，避免同一批目標永遠同時到期
+# Scheduler 以 min-heap 存「下次到期時間」，每個 tick 只取出到期的目標。
+# 排程狀態（nextDueAt 等）寫回 CrawlerTargets，cold start 時從表裡還原。
+# 記憶體中的排程是唯一的 owner：stack 把 crawler / dispatcher 的 reserved concurrency 設為 1、部署不做 canary，
+# 同一時間只有一個 container 在排程。表裡的 nextDueAt 只在有變化或 heartbeat 時寫回，可能落後；
+# 還原時已過期的目標分散在各自的一個間隔內到期，不會在 cold start 後全部同時探測。
+import heapq
+import os
+import random
+import time
+
+BASE_INTERVAL_SECONDS = int(os.getenv("BASE_INTERVAL_SECONDS", "300"))
+MIN_INTERVAL_SECONDS = 60
+MAX_INTERVAL_SECONDS = int(os.getenv("MAX_INTERVAL_SECONDS", "3600"))
+JITTER = 0.1
+DEAD_BACKOFF = 1.25        # 連續失敗時每次乘上的倍率
+FLAP_DECAY = 0.5           # flapScore 每次探測衰減一半；狀態改變則 +1
+FLAP_THRESHOLD = 1.5       # 最近兩次探測都改變狀態才算 flapping（單次恢復不算）
+# 寫回 CrawlerTargets 的排程欄位
+STATE_FIELDS = ["nextDueAt", "currentInterval", "consecutiveFailures", "flapScore", "lastSuccess"]
+
+
+def base_interval(target):
+    try:
+        value = int(target.get("intervalSeconds") or BASE_INTERVAL_SECONDS)
+    except (TypeError, ValueError):
+        value = BASE_INTERVAL_SECONDS
+    return max(MIN_INTERVAL_SECONDS, min(value, MAX_INTERVAL_SECONDS))
+
+
+def next_state(target, success, now, rng=random.random):
+    """依本次結果算出新的排程狀態（dict，欄位見 STATE_FIELDS）"""
+    base = base_interval(target)
+    last = target.get("lastSuccess")
+    changed = last is not None and bool(last) != success
+    flap = float(target.get("flapScore") or 0) * FLAP_DECAY + (1 if changed else 0)
+    failures = 0 if success else int(target.get("consecutiveFailures") or 0) + 1
+
+    if flap >= FLAP_THRESHOLD:
+        interval = base * 2 ** flap    # 持續來回跳動時 flapScore 趨近 2 → 約 4 倍間隔
+    elif failures > 1:
+        interval = base * DEAD_BACKOFF ** (failures - 1)
+    else:
+        interval = base
+    interval = min(interval, MAX_INTERVAL_SECONDS)
+    jittered = interval * (1 + JITTER * (2 * rng() - 1))
+    return {
+        "nextDueAt": int(now + jittered),
+        "currentInterval": int(interval),
+        "consecutiveFailures": failures,
+        "flapScore": round(flap, 3),
+        "lastSuccess": success,
+    }
+
+
+class Scheduler:
+    """min-heap of (nextDueAt, targetId)；已移除或重新排程的舊 entry 以 lazy deletion 略過"""
+
+    def __init__(self, clock=time.time, rng=random.random, keep=STATE_FIELDS):
+        self.clock = clock
+        self.rng = rng
+        self.keep = set(keep)   # sync 時以記憶體為準、不被表裡舊值覆蓋的欄位
+        self.targets = {}     # targetId -> target（含排程狀態）
+        self._heap = []
+
+    def __len__(self):
+        return len(self.targets)
+
+    def sync(self, targets):
+        """
+        以目前啟用中的目標更新排程；新目標依表裡的 nextDueAt 排入：
+        沒有則立即到期，已過期（表裡的副本落後）則在目前間隔內隨機到期
+        """
+        now = self.clock()
+        seen = set()
+        for t in targets:
+            tid = t["targetId"]
+            seen.add(tid)
+            current = self.targets.get(tid)
+            if current is None:
+                current = dict(t)
+                self.targets[tid] = current
+                self._push(tid, self._restored_due(current, now))
+            else:
+                # url / intervalSeconds 可能被 API 改過；排程狀態以記憶體中的為準
+                current.update({k: v for k, v in t.items() if k not in self.keep})
+        for tid in set(self.targets) - seen:
+            del self.targets[tid]
+
+    def _restored_due(self, target, now):
+        due = target.get("nextDueAt")
+        if due is None:
+            return int(now)
+        if due < now:
+            interval = int(target.get("currentInterval") or base_interval(target))
+            return int(now + self.rng() * interval)
+        return min(int(due), now + MAX_INTERVAL_SECONDS)
+
+    def _push(self, tid, due):
+        self.targets[tid]["nextDueAt"] = due
+        heapq.heappush(self._heap, (due, tid))
+
+    def due(self, limit=None):
+        """取出所有已到期的目標（最早到期的優先），最多 limit 個"""
+        now = self.clock()
+        out = []
+        while self._heap and self._heap[0][0] <= now and (limit is None or len(out) < limit):
+            due, tid = heapq.heappop(self._heap)
+            target = self.targets.get(tid)
+            if target is None or target.get("nextDueAt") != due:
+                continue   # 已刪除或已重新排程
+            target["nextDueAt"] = None   # 探測中；record / retry 時重新排入
+            out.append(target)
+        return out
+
+    def record(self, target_id, success):
+        """記錄探測結果並排入下一次；回傳要寫回表的狀態（目標已移除則回傳 None）"""
+        target = self.targets.get(target_id)
+        if target is None:
+            return None
+        state = next_state(target, success, self.clock(), self.rng)
+        target.update(state)
+        self._push(target_id, state["nextDueAt"])
+        return state
+
+    def retry(self, target_id):
+        """本次沒探測到（deadline 到了）：下個 tick 再試，狀態不變"""
+        if target_id in self.targets:
+            self._push(target_id, int(self.clock()))
+
+    def defer(self, target_id):
+        """已交給其他 worker 探測：先以目前間隔排入下一次（fan-out dispatcher 用）"""
+        target = self.targets.get(target_id)
+        if target is not None:
+            interval = int(target.get("currentInterval") or base_interval(target))
+            self._push(target_id, int(self.clock() + interval))
+
+    def next_due_in(self):
+        """距離下一個目標到期的秒數（沒有目標時回傳 None）"""
+        while self._heap:
+            due, tid = self._heap[0]
+            target = self.targets.get(tid)
+            if target is not None and target.get("nextDueAt") == due:
+                return max(0, due - self.clock())
+            heapq.heappop(self._heap)
+        return None
@@ -0,0 +1,23 @@
+# stage_cache.py
+# API Gateway stage cache 的失效（ApiGatewayStack cache_ttls 啟用時）：
+#   GET /targets 與 GET /targets/{targetId} 的回應由 API Gateway 快取，寫入路由成功後整個 stage cache 清空。
+#   API Gateway 沒有「只清一筆」的 API；寫入遠比輪詢少，整個清空的成本可以接受。
+# crawler 寫回的 lastStatus 不經過這裡，最多落後一個 cache TTL（與 router 的 container 內快取相同）。
+import os
+
+import aws_clients
+
+REST_API_ID = os.getenv("API_CACHE_REST_API_ID")
+STAGE_NAME = os.getenv("API_CACHE_STAGE")
+
+
+def invalidate():
+    """沒有啟用 stage cache 時不做事；失敗只記 log（寫入本身已成功，快取最多過 TTL 後自然過期）"""
+    if not REST_API_ID or not STAGE_NAME:
+        return False
+    try:
+        aws_clients.client("apigateway").flush_stage_cache(restApiId=REST_API_ID, stageName=STAGE_NAME)
+        return True
+    except Exception as e:
+        print(f"⚠️ Failed to flush API stage cache {REST_API_ID}/{STAGE_NAME}: {e}")
+        return False
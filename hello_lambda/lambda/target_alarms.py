@@ -0,0 +1,118 @@
+# target_alarms.py
+# 執行期管理每個目標的 CloudWatch alarm（cdk deploy -c alarm_mode=runtime）：
+#   CrawlerTargets 的 DynamoDB Stream → 本 Lambda
+#   - 新增 / 重新啟用 / 改 URL：PutMetricAlarm（同名覆蓋，重送也沒關係）
+#   - 刪除 / 停用：DeleteAlarms
+#   - 只有 crawler 寫回的排程狀態變動（url / active 沒變）：略過
+# 手動呼叫 {"reconcile": true}：依表裡啟用中的目標補建缺少或 URL 不符的 alarm、刪掉多餘的（首次部署或修復用）。
+# alarm 以 targetId 命名，同一個 URL 被兩個目標監控也不會互相覆蓋。
+import os
+
+import aws_clients
+from aws_clients import deserialize
+from instrumentation import instrumented
+from target_index import TargetIndex
+
+ALARM_PREFIX = "WebsiteMonitor-"
+ALARM_TOPIC_ARN = os.getenv("ALARM_TOPIC_ARN")
+LATENCY_ANOMALY_THRESHOLD = float(os.getenv("LATENCY_ANOMALY_THRESHOLD", "4"))
+TABLE_NAME = os.getenv("TABLE_NAME")
+DELETE_BATCH = 100      # DeleteAlarms 一次最多 100 個
+
+
+def alarm_names(target_id):
+    return [f"{ALARM_PREFIX}{target_id}-Availability", f"{ALARM_PREFIX}{target_id}-LatencyAnomaly"]
+
+
+def alarm_specs(target_id, url):
+    """與 alarm_mode=static 時 stack 建的兩個 alarm 相同設定"""
+    availability, latency = alarm_names(target_id)
+    actions = {"AlarmActions": [ALARM_TOPIC_ARN]} if ALARM_TOPIC_ARN else {}
+    common = dict(Namespace="WebsiteMonitor", Dimensions=[{"Name": "URL", "Value": url}], Period=300,
+                  TreatMissingData="ignore", ActionsEnabled=True, **actions)
+    return [
+        dict(common, AlarmName=availability, MetricName="IsSuccess",
+             Statistic="Minimum", Threshold=1, EvaluationPeriods=2,
+             ComparisonOperator="LessThanThreshold", AlarmDescription=f"Website {url} is unavailable!"),
+        dict(common, AlarmName=latency, MetricName="LatencyAnomalyScore",
+             Statistic="Average", Threshold=LATENCY_ANOMALY_THRESHOLD, EvaluationPeriods=3, DatapointsToAlarm=2,
+             ComparisonOperator="GreaterThanThreshold",
+             AlarmDescription=f"Website {url} latency is anomalous (score > {LATENCY_ANOMALY_THRESHOLD:g})!"),
+    ]
+
+
+def _monitored_url(image):
+    """需要 alarm 的目標回傳其 URL，否則 None"""
+    if image and image.get("url") and image.get("active", True):
+        return image["url"]
+    return None
+
+
+def plan(records):
+    """把 stream 紀錄合併成每個目標最後要做的事：{targetId: url（建立 / 更新）或 None（刪除）}"""
+    actions = {}
+    for record in records:
+        data = record.get("dynamodb", {})
+        old = {k: deserialize(v) for k, v in (data.get("OldImage") or {}).items()}
+        new = {k: deserialize(v) for k, v in (data.get("NewImage") or {}).items()}
+        target_id = (new or old).get("targetId")
+        if target_id is None:
+            continue
+        before, after = _monitored_url(old), _monitored_url(new)
+        if before == after:
+            continue
+        actions[target_id] = after
+    return actions
+
+
+def apply(cw, actions):
+    """執行 plan() 的結果，回傳 {"updated": 建立 / 更新的目標數, "deleted": 刪除的 alarm 數}"""
+    put, delete = 0, []
+    for target_id, url in actions.items():
+        if url is None:
+            delete.extend(alarm_names(target_id))
+            continue
+        for spec in alarm_specs(target_id, url):
+            cw.put_metric_alarm(**spec)
+        put += 1
+    for i in range(0, len(delete), DELETE_BATCH):
+        cw.delete_alarms(AlarmNames=delete[i:i + DELETE_BATCH])
+    return {"updated": put, "deleted": len(delete)}
+
+
+def existing_alarms(cw):
+    """{alarm 名稱: URL 維度}"""
+    out = {}
+    for page in cw.get_paginator("describe_alarms").paginate(AlarmNamePrefix=ALARM_PREFIX, AlarmTypes=["MetricAlarm"]):
+        for alarm in page.get("MetricAlarms", []):
+            dims = {d["Name"]: d["Value"] for d in alarm.get("Dimensions", [])}
+            out[alarm["AlarmName"]] = dims.get("URL")
+    return out
+
+
+def reconcile(cw, targets):
+    existing = existing_alarms(cw)
+    actions, wanted = {}, set()
+    for t in targets:
+        names = alarm_names(t["targetId"])
+        wanted.update(names)
+        if any(existing.get(n) != t["url"] for n in names):
+            actions[t["targetId"]] = t["url"]
+    stale = sorted(n for n in existing if n not in wanted)
+    result = apply(cw, actions)
+    for i in range(0, len(stale), DELETE_BATCH):
+        cw.delete_alarms(AlarmNames=stale[i:i + DELETE_BATCH])
+    result["deleted"] += len(stale)
+    return result
+
+
+@instrumented("target_alarms")
+def handler(event, context):
+    cw = aws_clients.client("cloudwatch")
+    if event.get("reconcile"):
+        targets = TargetIndex(aws_clients.table(TABLE_NAME)).active_targets()
+        result = reconcile(cw, targets)
+    else:
+        result = apply(cw, plan(event.get("Records", [])))
+    print(f"🔔 Target alarms: {result}")
+    return result
@@ -0,0 +1,89 @@
+# target_index.py
+# Crawler 的目標快取（放在 module scope，warm start 會沿用）：
+#   - cold start / 定期完整同步：平行 segmented scan 整張 CrawlerTargets 表
+#   - 其餘時候：只 Query UpdatedAtIndex 拿「上次同步後有改過」的項目做增量更新
+#     （PK 分成 UPDATED_AT_SHARDS 個 shard，每個 shard 並行 Query 一次）
+# 刪除不會出現在增量結果中：被刪掉的目標最多再被探測 full_resync_seconds（預設 30 分鐘），
+# 直到下一次完整同步；狀態寫回有 attribute_exists 條件，不會把它重新建立。
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from target_items import UPDATED_AT_SHARDS
+
+UPDATED_AT_INDEX = "UpdatedAtIndex"
+TIME_FORMAT = "%Y-%m-%dT%H:%M:%S"   # 與 create_target / update_target 的 updatedAt 相同
+# crawler 需要的欄位（url 是 DynamoDB 保留字，一律用 ExpressionAttributeNames）
+# intervalSeconds 之後是 schedule.py 的排程狀態（cold start 時還原 min-heap）
+PROJECTION = ["targetId", "url", "active", "updatedAt", "intervalSeconds",
+              "nextDueAt", "currentInterval", "consecutiveFailures", "flapScore", "lastSuccess",
+              "contentSimhash", "latencyWindow", "breakerState", "breakerUntil", "breakerCooldown",
+              "lastStatus", "httpValidators"]
+# 容忍不同 Lambda 之間的時鐘誤差：增量查詢往回多看一段時間
+SKEW_SECONDS = 60
+
+
+def _projection_kwargs():
+    names = {f"#p{i}": name for i, name in enumerate(PROJECTION)}
+    return {"ProjectionExpression": ", ".join(names), "ExpressionAttributeNames": names}
+
+
+class TargetIndex:
+    def __init__(self, table, total_segments=4, full_resync_seconds=1800, clock=time.time):
+        self.table = table
+        self.total_segments = total_segments
+        self.full_resync_seconds = full_resync_seconds
+        self.clock = clock
+        self._items = {}          # targetId -> item
+        self._last_full = None
+        self._watermark = None    # 下一次增量查詢的起點（epoch 秒）
+
+    def active_targets(self):
+        """回傳目前啟用中的目標（依 targetId 排序，讓每次輸出穩定）"""
+        self.refresh()
+        return [self._items[k] for k in sorted(self._items)
+                if self._items[k].get("active", True) and self._items[k].get("url")]
+
+    def refresh(self):
+        now = self.clock()
+        if self._last_full is None or now - self._last_full >= self.full_resync_seconds:
+            self._full_sync()
+            self._last_full = now
+        else:
+            self._incremental_sync()
+        self._watermark = now - SKEW_SECONDS
+
+    def _full_sync(self):
+        with ThreadPoolExecutor(max_workers=self.total_segments) as pool:
+            segments = list(pool.map(self._scan_segment, range(self.total_segments)))
+        self._items = {item["targetId"]: item for seg in segments for item in seg}
+
+    def _scan_segment(self, segment):
+        kwargs = dict(_projection_kwargs(), Segment=segment, TotalSegments=self.total_segments)
+        items = []
+        while True:
+            resp = self.table.scan(**kwargs)
+            items.extend(resp.get("Items", []))
+            if "LastEvaluatedKey" not in resp:
+                return items
+            kwargs["ExclusiveStartKey"] = resp["LastEvaluatedKey"]
+
+    def _incremental_sync(self):
+        since = time.strftime(TIME_FORMAT, time.localtime(self._watermark))
+        with ThreadPoolExecutor(max_workers=min(self.total_segments, UPDATED_AT_SHARDS)) as pool:
+            shards = list(pool.map(lambda shard: self._query_shard(f"target#{shard}", since), range(UPDATED_AT_SHARDS)))
+        for items in shards:
+            for item in items:
+                self._items[item["targetId"]] = item
+
+    def _query_shard(self, item_type, since):
+        kwargs = _projection_kwargs()
+        kwargs["ExpressionAttributeNames"].update({"#k": "itemType", "#u": "updatedAt"})
+        kwargs.update(IndexName=UPDATED_AT_INDEX, KeyConditionExpression="#k = :k AND #u >= :u",
+                      ExpressionAttributeValues={":k": item_type, ":u": since})
+        items = []
+        while True:
+            resp = self.table.query(**kwargs)
+            items.extend(resp.get("Items", []))
+            if "LastEvaluatedKey" not in resp:
+                return items
+            kwargs["ExclusiveStartKey"] = resp["LastEvaluatedKey"]
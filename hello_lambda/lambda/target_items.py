@@ -0,0 +1,82 @@
+# target_items.py
+# CrawlerTargets 項目的共用組裝邏輯（單筆與批次 CRUD 共用，確保 GSI 欄位一致）
+import time, uuid, zlib
+from decimal import Decimal
+
+UPDATABLE_FIELDS = ["url", "active", "tags", "notes", "intervalSeconds"]
+MIN_INTERVAL_SECONDS, MAX_INTERVAL_SECONDS = 60, 86400
+# UpdatedAtIndex 的 PK（itemType）依 targetId 分成幾個 shard，寫入不會全部落在同一個 GSI partition；
+# crawler 的增量同步對每個 shard 各 Query 一次（見 target_index.py）
+UPDATED_AT_SHARDS = 8
+
+def item_type(target_id):
+    """UpdatedAtIndex 的 PK：target#0 ~ target#{UPDATED_AT_SHARDS - 1}"""
+    return f"target#{zlib.crc32(target_id.encode('utf-8')) % UPDATED_AT_SHARDS}"
+
+def clean_fields(fields):
+    """intervalSeconds 轉成整數並限制範圍；無法轉換時丟掉該欄位"""
+    fields = dict(fields)
+    if "intervalSeconds" in fields:
+        try:
+            fields["intervalSeconds"] = max(MIN_INTERVAL_SECONDS, min(int(fields["intervalSeconds"]), MAX_INTERVAL_SECONDS))
+        except (TypeError, ValueError):
+            del fields["intervalSeconds"]
+    return fields
+
+def now_str():
+    return time.strftime("%Y-%m-%dT%H:%M:%S")
+
+def new_item(body):
+    """由 POST body 建立新項目；body 缺 url 時回傳 None"""
+    url = body.get("url")
+    if not url:
+        return None
+    active = bool(body.get("active", True))
+    now = now_str()
+    target_id = str(uuid.uuid4())
+    item = {
+        "targetId": target_id,
+        "url": url,
+        "active": active,
+        "activeStatus": "true" if active else "false",  # ActiveIndex 的 PK（GSI key 不能是 bool）
+        "createdAt": now,
+        "updatedAt": now,
+        "tags": body.get("tags") or [],
+        "notes": body.get("notes") or "",
+        "itemType": item_type(target_id),  # UpdatedAtIndex 的 PK（crawler 用來做增量同步）
+    }
+    # 選填：這個目標自己的探測間隔（秒），沒填就用 crawler 的預設值
+    item.update(clean_fields({k: body[k] for k in ["intervalSeconds"] if k in body}))
+    return item
+
+def update_kwargs(target_id, fields):
+    """把允許更新的欄位組成 update_item 的 UpdateExpression 參數"""
+    fields = clean_fields(fields)
+    expr_names, expr_values, sets = {}, {}, []
+    for i, (k, v) in enumerate(fields.items(), start=1):
+        expr_names[f"#f{i}"] = k
+        expr_values[f":v{i}"] = v
+        sets.append(f"#f{i} = :v{i}")
+    # active 變動時同步 activeStatus（ActiveIndex 的 PK）
+    if "active" in fields:
+        expr_names["#a"] = "activeStatus"
+        expr_values[":active"] = "true" if bool(fields["active"]) else "false"
+        sets.append("#a = :active")
+    # updatedAt（連同 itemType 一起寫，舊資料更新後也會進 UpdatedAtIndex）
+    expr_names["#u"] = "updatedAt"
+    expr_values[":now"] = now_str()
+    sets.append("#u = :now")
+    expr_names["#t"] = "itemType"
+    expr_values[":target"] = item_type(target_id)
+    sets.append("#t = :target")
+    return {
+        "UpdateExpression": "SET " + ", ".join(sets),
+        "ExpressionAttributeNames": expr_names,
+        "ExpressionAttributeValues": expr_values,
+    }
+
+def json_default(v):
+    """DynamoDB 的數字是 Decimal（例如 intervalSeconds、crawler 寫回的排程狀態）"""
+    if isinstance(v, Decimal):
+        return int(v) if v == v.to_integral_value() else float(v)
+    raise TypeError(f"cannot serialize {type(v).__name__}")
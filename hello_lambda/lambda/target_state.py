@@ -0,0 +1,60 @@
+# target_state.py
+# 把 crawler 產生的每個目標狀態（排程欄位等）寫回 CrawlerTargets：
+#   - 同一個目標在 flush 前多次 put 只寫最後一次（coalescing）
+#   - 並行 UpdateItem，只 SET 指定欄位；不更新 updatedAt，
+#     否則每次探測都會讓 UpdatedAtIndex 的增量同步把所有目標當成「有變更」
+#   - 條件 attribute_exists(targetId)：目標在探測期間被刪掉時不會被重新建立
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+
+from botocore.exceptions import ClientError
+
+
+def _to_dynamo(value):
+    # boto3 不接受 float
+    if isinstance(value, float):
+        return Decimal(str(value))
+    return value
+
+
+class TargetStateWriter:
+    def __init__(self, table, max_workers=8):
+        self.table = table
+        self.max_workers = max_workers
+        self._pending = {}     # targetId -> {field: value}
+
+    def put(self, target_id, fields):
+        self._pending.setdefault(target_id, {}).update(fields)
+
+    def __len__(self):
+        return len(self._pending)
+
+    def _write(self, item):
+        target_id, fields = item
+        names = {f"#f{i}": k for i, k in enumerate(fields)}
+        values = {f":v{i}": _to_dynamo(v) for i, v in enumerate(fields.values())}
+        try:
+            self.table.update_item(
+                Key={"targetId": target_id},
+                UpdateExpression="SET " + ", ".join(f"#f{i} = :v{i}" for i in range(len(fields))),
+                ConditionExpression="attribute_exists(targetId)",
+                ExpressionAttributeNames=names,
+                ExpressionAttributeValues=values,
+            )
+            return "written"
+        except ClientError as e:
+            if e.response["Error"]["Code"] == "ConditionalCheckFailedException":
+                return "gone"
+            print(f"⚠️ Failed to write state for {target_id}: {e.response['Error']['Code']}")
+            return "failed"
+
+    def flush(self):
+        """寫出所有待寫狀態，回傳 {"written", "gone", "failed"} 筆數"""
+        pending, self._pending = self._pending, {}
+        counts = {"written": 0, "gone": 0, "failed": 0}
+        if not pending:
+            return counts
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(pending))) as pool:
+            for outcome in pool.map(self._write, pending.items()):
+                counts[outcome] += 1
+        return counts
@@ -0,0 +1,48 @@
+# target_status.py
+# 每個目標的「最新狀態」摘要（lastStatus），由 crawler 寫在 CrawlerTargets 的項目上：
+#   GET /targets/{id} 與 list 直接帶回，不必再對每個 URL 查 CloudWatch。
+#   {"success", "status", "latencyMs", "streak"（連續相同結果的次數）, "since"（這個結果從何時開始）,
+#    "checkedAt"（最近一次探測）, "writtenAt"（最近一次寫回表）}
+# 寫入成本與「變化」成正比：只有成功 / 失敗或 HTTP 狀態碼改變時才寫回，
+# conditional GET 的 304 代表「與上次的 2xx 相同」，記成上次的狀態碼（200 ↔ 304 來回不算改變），
+# 狀態沒變的目標每 STATUS_HEARTBEAT_SECONDS 才寫一次（heartbeat，順便帶上排程狀態與延遲視窗）。
+# 所以表裡的 checkedAt / latencyMs（以及一起寫回的排程狀態、延遲視窗）最多落後一個 heartbeat；success / status 則一定是最新的。
+# previous 必須是 owner（單機 crawler / fan-out dispatcher）記憶體中的版本，不能是表裡的舊副本，否則 streak / since 會重算、heartbeat 每次都到期。
+import os
+
+STATUS_FIELD = "lastStatus"
+STATUS_HEARTBEAT_SECONDS = int(os.getenv("STATUS_HEARTBEAT_SECONDS", "1800"))
+
+
+def _status_code(previous, result):
+    """304（not modified）沿用上次成功時的狀態碼；沒有的話記為 200"""
+    status = result.get("status")
+    if result["success"] and (status == 304 or result.get("not_modified")):
+        return previous.get("status") if previous.get("success") and previous.get("status") else 200
+    return status
+
+
+def next_status(previous, result, now, force=False):
+    """
+    依本次結果算出新的 lastStatus，回傳 (record, 是否需要寫回)。
+    previous 是目標目前的 lastStatus（沒有則為 None）；force 表示其他欄位有變、這次一定會寫。
+    """
+    previous = previous or {}
+    success = bool(result["success"])
+    checked = int(result.get("ts") or now)
+    status = _status_code(previous, result)
+    same = previous.get("success") == success and previous.get("status") == status
+    latency = result.get("latency")
+    record = {
+        "success": success,
+        "status": status,
+        "latencyMs": int(round(latency * 1000)) if latency is not None else None,
+        "streak": int(previous.get("streak") or 0) + 1 if previous.get("success") == success else 1,
+        "since": int(previous.get("since") or checked) if same else checked,
+        "checkedAt": checked,
+        "writtenAt": int(previous.get("writtenAt") or 0),
+    }
+    due = force or not same or now - record["writtenAt"] >= STATUS_HEARTBEAT_SECONDS
+    if due:
+        record["writtenAt"] = int(now)
+    return record, due
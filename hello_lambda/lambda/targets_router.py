@@ -0,0 +1,62 @@
+# targets_router.py
+# 單一 Lambda 處理所有 /targets 路由（ApiGatewayStack router 模式）：
+#   一支函式 → 只有一次 cold start、共用同一個 DynamoDB 連線池，冷門路由也跟著熱門路由保持 warm。
+# GET /targets/{targetId} 經過 LRU + TTL 快取；同一個 container 內的寫入會立即讓快取失效。
+# 各路由的邏輯仍在原本的 handler 模組（create_target、get_target ...），這裡只負責分派；
+# 它們的 phase 在 Server-Timing 裡以路由的 handler 名稱為前綴（例如 get_target.dynamo）。
+import os, json
+from instrumentation import instrumented
+import batch_targets, create_target, delete_target, get_target, list_targets, update_target
+import etag
+from ttl_cache import TTLCache
+
+cache = TTLCache(maxsize=int(os.getenv("TARGET_CACHE_SIZE", "1024")),
+                 ttl=float(os.getenv("TARGET_CACHE_TTL_SECONDS", "30")))
+
+def _target_id(event):
+    return (event.get("pathParameters") or {}).get("targetId")
+
+def _get(event, context):
+    target_id = _target_id(event)
+    item = cache.get(target_id)
+    if item is not None:
+        resp = etag.respond(event, {"item": item}, {"dynamoLatencyMs": 0})
+        return dict(resp, headers=dict(resp["headers"], **{"X-Cache": "HIT"}))
+    resp = get_target.handler(event, context)
+    if resp["statusCode"] == 200:
+        cache.put(target_id, json.loads(resp["body"])["item"])
+    return dict(resp, headers=dict(resp.get("headers") or {}, **{"X-Cache": "MISS"}))
+
+def _write_one(handler):
+    def route(event, context):
+        try:
+            return handler(event, context)
+        finally:
+            cache.invalidate(_target_id(event))
+    return route
+
+def _batch(event, context):
+    try:
+        return batch_targets.handler(event, context)
+    finally:
+        cache.clear()   # 批次可能動到上千筆，直接清空
+
+ROUTES = {
+    ("POST", "/targets"): create_target.handler,
+    ("GET", "/targets"): list_targets.handler,
+    ("GET", "/targets/{targetId}"): _get,
+    ("PUT", "/targets/{targetId}"): _write_one(update_target.handler),
+    ("DELETE", "/targets/{targetId}"): _write_one(delete_target.handler),
+    ("POST", "/targets:batch"): _batch,
+    ("PUT", "/targets:batch"): _batch,
+    ("DELETE", "/targets:batch"): _batch,
+}
+
+@instrumented("targets_router")
+def handler(event, context):
+    route = ROUTES.get((event.get("httpMethod"), event.get("resource")))
+    if route is None:
+        known = any(resource == event.get("resource") for _, resource in ROUTES)
+        return {"statusCode": 405 if known else 404,
+                "body": json.dumps({"error": "method not allowed" if known else "unknown route"})}
+    return route(event, context)
@@ -0,0 +1,81 @@
+# work_queue.py
+# Fan-out 用的工作佇列抽象：
+#   - SqsWorkQueue：部署時使用（dispatcher 送訊息，worker 由 SQS event source 觸發；
+#     worker 的探測結果走另一個佇列，dispatcher 每個 tick 以 receive_batches 讀回）
+#   - InMemoryWorkQueue：測試 / 本地執行用，行為相同但全部在同一個 process 內
+import abc
+import json
+import uuid
+from collections import deque
+
+SQS_BATCH_SIZE = 10               # SendMessageBatch 上限
+MAX_MESSAGE_BYTES = 240 * 1024    # SQS 單則上限 256KB，保留一點餘裕
+
+
+class WorkQueue(abc.ABC):
+    @abc.abstractmethod
+    def send(self, messages):
+        """送出多則 dict 訊息，回傳送出的數量"""
+
+    @abc.abstractmethod
+    def receive_batches(self, limit):
+        """
+        逐批 yield 最多 limit 則 dict 訊息，佇列空了就停；
+        每批在呼叫端處理完、要下一批時才刪除（處理到一半失敗的那批會再被收到）
+        """
+
+
+class SqsWorkQueue(WorkQueue):
+    def __init__(self, client, queue_url):
+        self.client = client
+        self.queue_url = queue_url
+
+    def send(self, messages):
+        sent = 0
+        for i in range(0, len(messages), SQS_BATCH_SIZE):
+            entries = [{"Id": str(n), "MessageBody": json.dumps(m)}
+                       for n, m in enumerate(messages[i:i + SQS_BATCH_SIZE])]
+            resp = self.client.send_message_batch(QueueUrl=self.queue_url, Entries=entries)
+            if resp.get("Failed"):
+                raise RuntimeError(f"SendMessageBatch failed for {len(resp['Failed'])} messages: {resp['Failed']}")
+            sent += len(entries)
+        return sent
+
+    def receive_batches(self, limit):
+        received = 0
+        while received < limit:
+            resp = self.client.receive_message(QueueUrl=self.queue_url, WaitTimeSeconds=0,
+                                               MaxNumberOfMessages=min(SQS_BATCH_SIZE, limit - received))
+            messages = resp.get("Messages", [])
+            if not messages:
+                return
+            received += len(messages)
+            yield [json.loads(m["Body"]) for m in messages]
+            self.client.delete_message_batch(QueueUrl=self.queue_url, Entries=[
+                {"Id": str(n), "ReceiptHandle": m["ReceiptHandle"]} for n, m in enumerate(messages)])
+
+
+class InMemoryWorkQueue(WorkQueue):
+    def __init__(self):
+        self.messages = deque()
+
+    def send(self, messages):
+        for m in messages:
+            # 與 SQS 相同：訊息以 JSON 字串傳遞
+            self.messages.append({"messageId": str(uuid.uuid4()), "body": json.dumps(m)})
+        return len(messages)
+
+    def receive_batches(self, limit):
+        received = 0
+        while self.messages and received < limit:
+            batch = [self.messages[i] for i in range(min(SQS_BATCH_SIZE, limit - received, len(self.messages)))]
+            received += len(batch)
+            yield [json.loads(m["body"]) for m in batch]
+            for _ in batch:
+                self.messages.popleft()
+
+    def drain_events(self, batch_size=1):
+        """取出全部訊息，包成 SQS event（{"Records": [...]}）逐批 yield"""
+        while self.messages:
+            batch = [self.messages.popleft() for _ in range(min(batch_size, len(self.messages)))]
+            yield {"Records": batch}
@@ -0,0 +1,182 @@
+# aws_clients.py
+# 所有 Lambda 共用的 AWS client（以 Lambda layer 部署，位於 /opt/python）：
+#   - client(service)：第一次用到時才 import boto3 並建立 low-level client，同一個 container 內共用
+#   - table(name)：與 boto3 Table resource 相同用法（get/put/update/delete_item、query、scan、meta.client），
+#     但底層是 low-level client + 輕量的型別轉換，不載入 resource 模型
+# boto3 的 resource 層在 cold start 時要載入 resource 定義並建立動態類別，比 client 慢很多。
+import threading
+from decimal import Decimal
+
+_lock = threading.Lock()
+_clients = {}
+# 並行的 UpdateItem / BatchWriteItem（見 batch_targets、target_state）需要比預設 10 條多的連線
+MAX_POOL_CONNECTIONS = 50
+
+
+def client(service):
+    c = _clients.get(service)
+    if c is None:
+        with _lock:
+            c = _clients.get(service)
+            if c is None:
+                import boto3
+                from botocore.config import Config
+                c = boto3.client(service, config=Config(
+                    max_pool_connections=MAX_POOL_CONNECTIONS, retries={"mode": "standard"}))
+                _clients[service] = c
+    return c
+
+
+# --- DynamoDB 型別轉換（與 boto3 TypeSerializer / TypeDeserializer 相同規則）---
+def serialize(value):
+    if isinstance(value, bool):
+        return {"BOOL": value}
+    if value is None:
+        return {"NULL": True}
+    if isinstance(value, str):
+        return {"S": value}
+    if isinstance(value, (int, Decimal)):
+        return {"N": str(value)}
+    if isinstance(value, float):
+        raise TypeError("Float types are not supported. Use Decimal types instead.")
+    if isinstance(value, (bytes, bytearray)):
+        return {"B": bytes(value)}
+    if isinstance(value, dict):
+        return {"M": {k: serialize(v) for k, v in value.items()}}
+    if isinstance(value, (list, tuple)):
+        return {"L": [serialize(v) for v in value]}
+    if isinstance(value, (set, frozenset)) and value:
+        if all(isinstance(v, str) for v in value):
+            return {"SS": list(value)}
+        if all(isinstance(v, (int, Decimal)) and not isinstance(v, bool) for v in value):
+            return {"NS": [str(v) for v in value]}
+        if all(isinstance(v, (bytes, bytearray)) for v in value):
+            return {"BS": [bytes(v) for v in value]}
+    raise TypeError(f"Unsupported type {type(value).__name__} for value {value!r}")
+
+
+def deserialize(av):
+    (kind, value), = av.items()
+    if kind == "S" or kind == "B" or kind == "BOOL":
+        return value
+    if kind == "N":
+        return Decimal(value)
+    if kind == "NULL":
+        return None
+    if kind == "M":
+        return {k: deserialize(v) for k, v in value.items()}
+    if kind == "L":
+        return [deserialize(v) for v in value]
+    if kind == "SS" or kind == "BS":
+        return set(value)
+    if kind == "NS":
+        return {Decimal(v) for v in value}
+    raise TypeError(f"Unknown DynamoDB type {kind}")
+
+
+def _item(d):
+    return {k: serialize(v) for k, v in d.items()}
+
+
+def _plain(d):
+    return {k: deserialize(v) for k, v in d.items()}
+
+
+CONDITION_PARAMS = (("KeyConditionExpression", True), ("FilterExpression", False), ("ConditionExpression", False))
+ITEM_PARAMS = ("Item", "Key", "ExclusiveStartKey", "ExpressionAttributeValues")
+
+
+def _request(table_name, params):
+    """把 resource 風格的參數（Python 值、conditions 物件）轉成 low-level client 參數"""
+    params = dict(params, TableName=table_name)
+    builder = None
+    for name, is_key in CONDITION_PARAMS:
+        cond = params.get(name)
+        if cond is None or isinstance(cond, str):
+            continue
+        if builder is None:
+            from boto3.dynamodb.conditions import ConditionExpressionBuilder
+            builder = ConditionExpressionBuilder()   # 同一個請求共用，placeholder 編號不重複
+        built = builder.build_expression(cond, is_key_condition=is_key)
+        params[name] = built.condition_expression
+        if built.attribute_name_placeholders:
+            params["ExpressionAttributeNames"] = dict(params.get("ExpressionAttributeNames") or {},
+                                                      **built.attribute_name_placeholders)
+        if built.attribute_value_placeholders:
+            params["ExpressionAttributeValues"] = dict(params.get("ExpressionAttributeValues") or {},
+                                                       **built.attribute_value_placeholders)
+    for name in ITEM_PARAMS:
+        if params.get(name) is not None:
+            params[name] = _item(params[name])
+    return params
+
+
+def _response(resp):
+    for name in ("Item", "Attributes", "LastEvaluatedKey"):
+        if name in resp:
+            resp[name] = _plain(resp[name])
+    if "Items" in resp:
+        resp["Items"] = [_plain(i) for i in resp["Items"]]
+    return resp
+
+
+class DocumentClient:
+    """table.meta.client：batch_write_item 接受 / 回傳 Python 值（與 resource 的 meta.client 相同）"""
+
+    def __init__(self, factory):
+        self._factory = factory
+
+    def batch_write_item(self, RequestItems, **kwargs):
+        requests = {name: [_write_request(r, _item) for r in reqs] for name, reqs in RequestItems.items()}
+        resp = self._factory().batch_write_item(RequestItems=requests, **kwargs)
+        unprocessed = resp.get("UnprocessedItems") or {}
+        resp["UnprocessedItems"] = {name: [_write_request(r, _plain) for r in reqs] for name, reqs in unprocessed.items()}
+        return resp
+
+    def __getattr__(self, name):
+        return getattr(self._factory(), name)
+
+
+def _write_request(request, convert):
+    if "PutRequest" in request:
+        return {"PutRequest": {"Item": convert(request["PutRequest"]["Item"])}}
+    return {"DeleteRequest": {"Key": convert(request["DeleteRequest"]["Key"])}}
+
+
+class _Meta:
+    def __init__(self, document_client):
+        self.client = document_client
+
+
+class Table:
+    """boto3 Table resource 的常用子集；client 在第一次呼叫時才建立"""
+
+    def __init__(self, name, factory=None):
+        self.name = self.table_name = name
+        self._factory = factory or (lambda: client("dynamodb"))
+        self.meta = _Meta(DocumentClient(self._factory))
+
+    def _call(self, operation, params):
+        return _response(getattr(self._factory(), operation)(**_request(self.name, params)))
+
+    def get_item(self, **params):
+        return self._call("get_item", params)
+
+    def put_item(self, **params):
+        return self._call("put_item", params)
+
+    def update_item(self, **params):
+        return self._call("update_item", params)
+
+    def delete_item(self, **params):
+        return self._call("delete_item", params)
+
+    def query(self, **params):
+        return self._call("query", params)
+
+    def scan(self, **params):
+        return self._call("scan", params)
+
+
+def table(name):
+    return Table(name)
@@ -0,0 +1,224 @@
+# instrumentation.py
+# 所有 handler 共用的效能量測（以 Lambda layer 部署，位於 /opt/python）：
+#   - @instrumented(name)：包住 handler，每次 invocation 一個 trace；結束時
+#       * API Gateway 的回應加上 Server-Timing header（各 phase 與 total，cold start 另有 init）
+#       * 本次 invocation 的延遲直方圖寫成一行 EMF（namespace WebsiteMonitorHandlers，維度 Handler）
+#       * PROFILE_SAMPLE_RATE=N 時約每 N 次 invocation 以 cProfile 跑一次（PROFILE_MEMORY=1 另開 tracemalloc），
+#         前 PROFILE_TOP_N 名熱點寫到 log
+#   - phase(name)：巢狀 phase 計時（time.perf_counter），巢狀的名稱以 "." 串接，例如 get_target.dynamo；
+#     同一個 phase 進入多次時 Server-Timing 顯示累計，直方圖則每次一筆
+#   - observe(name, ms)：把一個值放進本次 invocation 的直方圖（探測 thread 裡也可以呼叫）
+# 直方圖以 log 分桶（每 2 倍 4 桶，誤差約 ±9%），EMF 裡每個樣本以所在桶的代表值出現，
+# CloudWatch 的 p50 / p99 以此計算。
+# init = 本模組被 import 到 handler 被定義之間的時間（handler 模組的 import 成本），只在 container 第一次 invocation 回報。
+# handler 被另一個已 instrumented 的 handler 呼叫時（router 模式）只算成外層的一個 phase。
+import cProfile
+import functools
+import io
+import json
+import math
+import os
+import pstats
+import random
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+NAMESPACE = "WebsiteMonitorHandlers"
+EMF_ENABLED = os.getenv("INSTRUMENTATION_EMF", "1") != "0"
+PROFILE_SAMPLE_RATE = int(os.getenv("PROFILE_SAMPLE_RATE", "0"))   # 0 = 不取樣
+PROFILE_TOP_N = int(os.getenv("PROFILE_TOP_N", "15"))
+PROFILE_MEMORY = os.getenv("PROFILE_MEMORY") == "1"
+BUCKETS_PER_DOUBLING = 4
+EMF_MAX_VALUES = 100       # EMF：每份文件每個 metric 最多 100 個值
+EMF_MAX_METRICS = 100
+
+_IMPORTED_AT = time.perf_counter()
+_local = threading.local()    # 每個 thread 自己的 phase stack
+_current = None               # 目前 invocation 的 Trace（Lambda 一次只處理一個 invocation）
+
+
+def write(text):
+    sys.stdout.write(text + "\n")
+
+
+class Histogram:
+    def __init__(self):
+        self.buckets = {}    # 桶號 -> 樣本數（0 以下的值放在 None）
+        self.count = 0
+
+    def add(self, value):
+        index = math.floor(math.log2(value) * BUCKETS_PER_DOUBLING) if value > 0 else None
+        self.buckets[index] = self.buckets.get(index, 0) + 1
+        self.count += 1
+
+    @staticmethod
+    def representative(index):
+        """桶的幾何中點，取 3 位有效數字"""
+        if index is None:
+            return 0.0
+        return float(f"{2 ** ((index + 0.5) / BUCKETS_PER_DOUBLING):.3g}")
+
+    def values(self):
+        """[(代表值, 樣本數)]，由小到大"""
+        return [(self.representative(i), n)
+                for i, n in sorted(self.buckets.items(), key=lambda kv: -math.inf if kv[0] is None else kv[0])]
+
+    def percentile(self, q):
+        if not self.count:
+            return None
+        rank = q / 100 * self.count
+        seen = 0
+        for value, n in self.values():
+            seen += n
+            if seen >= rank:
+                return value
+        return value
+
+
+class Trace:
+    def __init__(self, name, clock=time.perf_counter):
+        self.name = name
+        self.clock = clock
+        self.start = clock()
+        self.phases = {}        # phase 名稱 -> 累計毫秒（依第一次出現的順序）
+        self.histograms = {}
+        self._lock = threading.Lock()
+
+    def elapsed(self):
+        return (self.clock() - self.start) * 1000
+
+    def add_phase(self, name, ms):
+        with self._lock:
+            self.phases[name] = self.phases.get(name, 0.0) + ms
+        self.observe(name, ms)
+
+    def observe(self, name, ms):
+        with self._lock:
+            hist = self.histograms.get(name)
+            if hist is None:
+                hist = self.histograms[name] = Histogram()
+            hist.add(ms)
+
+    def server_timing(self, total_ms):
+        entries = [f"{name};dur={ms:.1f}" for name, ms in self.phases.items()]
+        entries.append(f"total;dur={total_ms:.1f}")
+        return ", ".join(entries)
+
+    def emf_documents(self, timestamp_ms):
+        pending = {name: [v for v, n in hist.values() for _ in range(n)] for name, hist in self.histograms.items()}
+        while pending:
+            names = list(pending)[:EMF_MAX_METRICS]
+            doc = {"_aws": {"Timestamp": timestamp_ms, "CloudWatchMetrics": [{
+                "Namespace": NAMESPACE, "Dimensions": [["Handler"]],
+                "Metrics": [{"Name": n, "Unit": "Milliseconds"} for n in names]}]},
+                "Handler": self.name}
+            for n in names:
+                values, pending[n] = pending[n][:EMF_MAX_VALUES], pending[n][EMF_MAX_VALUES:]
+                doc[n] = values
+                if not pending[n]:
+                    del pending[n]
+            yield doc
+
+
+def _stack():
+    stack = getattr(_local, "stack", None)
+    if stack is None:
+        stack = _local.stack = []
+    return stack
+
+
+@contextmanager
+def phase(name):
+    trace = _current
+    stack = _stack()
+    full = ".".join(stack + [name])
+    stack.append(name)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        stack.pop()
+        if trace is not None:
+            trace.add_phase(full, (time.perf_counter() - start) * 1000)
+
+
+def elapsed_ms(name):
+    """目前 invocation 中 phase name（相對於目前所在的 phase）的累計毫秒，取到小數 2 位"""
+    trace = _current
+    if trace is None:
+        return 0.0
+    return round(trace.phases.get(".".join(_stack() + [name]), 0.0), 2)
+
+
+def observe(name, ms):
+    trace = _current
+    if trace is not None:
+        trace.observe(name, ms)
+
+
+def _start_profiler():
+    if PROFILE_SAMPLE_RATE <= 0 or random.random() * PROFILE_SAMPLE_RATE >= 1:
+        return None
+    if PROFILE_MEMORY:
+        tracemalloc.start()
+    profiler = cProfile.Profile()
+    profiler.enable()
+    return profiler
+
+
+def _report_profile(name, profiler):
+    profiler.disable()
+    out = io.StringIO()
+    pstats.Stats(profiler, stream=out).sort_stats("cumulative").print_stats(PROFILE_TOP_N)
+    lines = [f"🔬 Profile of {name}: top {PROFILE_TOP_N} by cumulative time", out.getvalue().strip()]
+    if tracemalloc.is_tracing():
+        snapshot = tracemalloc.take_snapshot()
+        tracemalloc.stop()
+        lines.append(f"🔬 Memory of {name}: top {PROFILE_TOP_N} allocation sites")
+        lines.extend(str(stat) for stat in snapshot.statistics("lineno")[:PROFILE_TOP_N])
+    write("\n".join(lines))
+
+
+def _is_api_event(event):
+    return isinstance(event, dict) and ("httpMethod" in event or "requestContext" in event)
+
+
+def instrumented(name):
+    init_ms = (time.perf_counter() - _IMPORTED_AT) * 1000
+    cold = [True]
+
+    def decorate(fn):
+        @functools.wraps(fn)
+        def handler(event, context):
+            global _current
+            if _current is not None:
+                with phase(name):
+                    return fn(event, context)
+
+            trace = _current = Trace(name)
+            if cold:
+                cold.clear()
+                trace.add_phase("init", init_ms)
+            profiler = _start_profiler()
+            try:
+                response = fn(event, context)
+            finally:
+                _current = None
+                total = trace.elapsed()
+                trace.observe("total", total)
+                if profiler is not None:
+                    _report_profile(name, profiler)
+                if EMF_ENABLED:
+                    now = int(time.time() * 1000)
+                    write("\n".join(json.dumps(doc, separators=(",", ":")) for doc in trace.emf_documents(now)))
+            if _is_api_event(event) and isinstance(response, dict) and "statusCode" in response:
+                headers = dict(response.get("headers") or {}, **{"Server-Timing": trace.server_timing(total)})
+                response = dict(response, headers=headers)
+            return response
+
+        return handler
+
+    return decorate
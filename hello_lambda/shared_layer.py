@@ -0,0 +1,17 @@
+from aws_cdk import aws_lambda as _lambda
+from constructs import Construct
+
+def shared_layer(scope: Construct, construct_id: str = "SharedLayer") -> _lambda.LayerVersion:
+    """
+    所有 Lambda 共用的 Python 模組（hello_lambda/layers/shared/python → /opt/python）
+    aws_clients：延遲建立的 boto3 client 與輕量的 DynamoDB Table 包裝
+    instrumentation：phase 計時、延遲直方圖（EMF）、Server-Timing header、取樣 profiler
+    """
+    return _lambda.LayerVersion(
+        scope, construct_id,
+        code=_lambda.Code.from_asset("hello_lambda/layers/shared"),
+        compatible_runtimes=[_lambda.Runtime.PYTHON_3_12],
+        # 純 Python，x86_64 / arm64 的 function 都能用
+        compatible_architectures=[_lambda.Architecture.X86_64, _lambda.Architecture.ARM_64],
+        description="Shared helpers: lazily created AWS clients, handler instrumentation",
+    )
@@ -1,9 +1,12 @@
 # stages/crawler_app_stage.py
+import sys
+
 from aws_cdk import Stage, Environment
 from constructs import Construct
 
+from hello_lambda import bundles
 from hello_lambda.dynamodb_stack import DynamoDBStack
-from hello_lambda.api_gateway_stack import ApiGatewayStack
+from hello_lambda.api_gateway_stack import DEFAULT_CACHE_TTLS, ApiGatewayStack
 from hello_lambda.hello_lambda_stack import HelloLambdaStack
 
 class CrawlerAppStage(Stage):
@@ -12,19 +15,33 @@ class CrawlerAppStage(Stage):
     在此 Stage 內，我們依序部署：
       1) DynamoDB 資料表
       2) API Gateway + CRUD Lambdas（接資料表）
-      3) Crawler Lambda（每 5 分鐘跑，從資料表讀 targets）
+      3) Crawler Lambda（EventBridge 每分鐘一個 tick，從資料表讀 targets，每個目標依自己的間隔到期才探測；
+         fan-out 模式下是 dispatcher + SQS worker）
     """
     def __init__(self, scope: Construct, construct_id: str, **kwargs):
         super().__init__(scope, construct_id, **kwargs)
 
+        # cdk deploy -c lambda_arch=arm64 / -c lambda_config='{"CrawlWorkerFunction": {"memory": 512}}'：
+        # 每支 function 的 architecture 與記憶體（以 construct id 指定，"default" 套用到全部；見 hello_lambda/bundles.py）
+        function_config = bundles.config_from_context(self.node)
+
         # 1) 先建資料表（其餘堆疊會用到）
-        self.ddb = DynamoDBStack(self, "CrawlerDynamoDB")
+        # cdk deploy -c active_index=false：先不建 ActiveIndex（既有的表一次只能新增一個 GSI，見 DynamoDBStack）
+        self.ddb = DynamoDBStack(
+            self, "CrawlerDynamoDB",
+            active_index=str(self.node.try_get_context("active_index")).lower() != "false",
+        )
 
         # 2) 部署 API（傳入 table）
         self.api = ApiGatewayStack(
             self,
             "CrawlerApi",
             table=self.ddb.table,
+            # cdk deploy -c api_mode=router：所有 /targets 路由由單一 Lambda 處理
+            router=self.node.try_get_context("api_mode") == "router",
+            # cdk deploy -c api_cache=true：GET 路由走 API Gateway stage cache（各路由 TTL 見 DEFAULT_CACHE_TTLS）
+            cache_ttls=DEFAULT_CACHE_TTLS if str(self.node.try_get_context("api_cache")).lower() == "true" else None,
+            function_config=function_config,
         )
         self.api.add_dependency(self.ddb)  # 確保順序：先表再 API
 
@@ -33,5 +50,16 @@ class CrawlerAppStage(Stage):
             self,
             "HelloLambda",
             table=self.ddb.table,
+            # cdk deploy -c crawl_mode=fanout：改用 dispatcher + SQS + worker 分 shard 探測
+            fan_out=self.node.try_get_context("crawl_mode") == "fanout",
+            # cdk deploy -c numpy_layer_arn=<ARN>：提供 numpy 給延遲異常分數的批次計算（選用）
+            numpy_layer_arn=self.node.try_get_context("numpy_layer_arn"),
+            # cdk deploy -c alarm_mode=runtime：儀表板改用 Metrics Insights，per-URL alarm 由 Lambda 依目標增刪管理
+            alarm_mode=self.node.try_get_context("alarm_mode") or "static",
+            function_config=function_config,
         )
         self.crawler.add_dependency(self.ddb)  # 確保順序：先表再 Crawler
+
+        # cdk synth -c bundle_report=true：列出每支 function 的 bundle 大小與本機量到的 import 時間
+        if str(self.node.try_get_context("bundle_report")).lower() == "true":
+            print(bundles.format_report(bundles.report(self)), file=sys.stderr)
@@ -0,0 +1,477 @@
+# tests/fakes.py
+# 本地替身（fake AWS clients），讓單元測試與 benchmark 不需要連到 AWS。
+import threading
+import time
+
+from botocore.exceptions import ClientError
+
+
+class FakeCloudWatch:
+    """記錄每次 put_metric_data 呼叫；可設定前 N 次呼叫回傳 Throttling"""
+
+    def __init__(self, throttle_first=0):
+        self.lock = threading.Lock()
+        self.calls = []            # [(namespace, [datum, ...]), ...]
+        self.throttled = 0
+        self._throttle_left = throttle_first
+
+    def put_metric_data(self, Namespace, MetricData):
+        with self.lock:
+            if self._throttle_left > 0:
+                self._throttle_left -= 1
+                self.throttled += 1
+                raise ClientError({"Error": {"Code": "Throttling", "Message": "Rate exceeded"}}, "PutMetricData")
+            self.calls.append((Namespace, list(MetricData)))
+        return {}
+
+    def datums(self, namespace=None):
+        return [d for ns, batch in self.calls if namespace in (None, ns) for d in batch]
+
+    # --- alarm（target_alarms 用）---
+    alarms = None
+
+    def put_metric_alarm(self, **alarm):
+        with self.lock:
+            if self.alarms is None:
+                self.alarms = {}
+            self.alarms[alarm["AlarmName"]] = alarm
+        return {}
+
+    def delete_alarms(self, AlarmNames):
+        assert len(AlarmNames) <= 100
+        with self.lock:
+            for name in AlarmNames:
+                (self.alarms or {}).pop(name, None)
+        return {}
+
+    def get_paginator(self, operation):
+        assert operation == "describe_alarms"
+        fake = self
+
+        class _Paginator:
+            def paginate(self, AlarmNamePrefix="", **kwargs):
+                alarms = [a for n, a in sorted((fake.alarms or {}).items()) if n.startswith(AlarmNamePrefix)]
+                for i in range(0, max(len(alarms), 1), 100):
+                    yield {"MetricAlarms": alarms[i:i + 100]}
+
+        return _Paginator()
+
+
+# --- DynamoDB ----------------------------------------------------------------
+import copy
+import json
+import math
+import re
+import zlib
+from decimal import Decimal
+
+from boto3.dynamodb.conditions import AttributeBase, ConditionBase
+
+
+def _item_size(item):
+    return len(json.dumps(item, default=str))
+
+
+def _sort_value(v):
+    return (0, v) if isinstance(v, (int, float, Decimal)) else (1, str(v))
+
+
+def _evaluate(cond, item):
+    """在 Python 端評估 boto3 的 Key()/Attr() 條件物件"""
+    op = cond.expression_operator
+    vals = cond._values
+    if op == "AND":
+        return _evaluate(vals[0], item) and _evaluate(vals[1], item)
+    if op == "OR":
+        return _evaluate(vals[0], item) or _evaluate(vals[1], item)
+    if op == "NOT":
+        return not _evaluate(vals[0], item)
+    name = vals[0].name
+    if op == "attribute_exists":
+        return name in item
+    if op == "attribute_not_exists":
+        return name not in item
+    if name not in item:
+        return False
+    left, args = item[name], [v.name if isinstance(v, AttributeBase) else v for v in vals[1:]]
+    if op == "=":
+        return left == args[0]
+    if op == "<>":
+        return left != args[0]
+    if op == "<":
+        return left < args[0]
+    if op == "<=":
+        return left <= args[0]
+    if op == ">":
+        return left > args[0]
+    if op == ">=":
+        return left >= args[0]
+    if op == "BETWEEN":
+        return args[0] <= left <= args[1]
+    if op == "begins_with":
+        return str(left).startswith(args[0])
+    if op == "contains":
+        return args[0] in left
+    if op == "IN":
+        return left in args[0]
+    raise NotImplementedError(op)
+
+
+class FakeTable:
+    """
+    DynamoDB Table（boto3 resource）的本地替身，支援 CRUD、segmented scan、
+    GSI query（含 sparse index）、分頁與 consumed capacity（RCU/WCU）計算。
+    page_items 模擬 DynamoDB 1MB 分頁：每頁最多讀幾筆。
+    """
+
+    def __init__(self, key="targetId", sort_key=None, indexes=None, page_items=100, call_latency=0.0):
+        self.call_latency = call_latency  # 模擬每次 API round-trip 的延遲（秒）
+        self.key = key
+        self.sort_key = sort_key
+        self.indexes = indexes or {}      # name -> (pk, sk)
+        self.page_items = page_items
+        self.items = {}
+        self.lock = threading.Lock()
+        self.calls = []
+        self.consumed_rcu = 0.0
+        self.consumed_wcu = 0.0
+
+    # -- helpers --
+    def _key_of(self, item):
+        return (item[self.key],) + ((item[self.sort_key],) if self.sort_key else ())
+
+    def _key_names(self):
+        return [self.key] + ([self.sort_key] if self.sort_key else [])
+
+    def _read_cost(self, nbytes, consistent=False):
+        units = max(1, math.ceil(nbytes / 4096))
+        return units if consistent else units / 2
+
+    def _write_cost(self, item):
+        return max(1, math.ceil(_item_size(item) / 1024))
+
+    def _project(self, item, kwargs):
+        proj = kwargs.get("ProjectionExpression")
+        if not proj:
+            return copy.deepcopy(item)
+        names = kwargs.get("ExpressionAttributeNames", {})
+        fields = [names.get(p.strip(), p.strip()) for p in proj.split(",")]
+        return {f: copy.deepcopy(item[f]) for f in fields if f in item}
+
+    def _capacity(self, kwargs, units):
+        if kwargs.get("ReturnConsumedCapacity") in ("TOTAL", "INDEXES"):
+            return {"ConsumedCapacity": {"TableName": "fake", "CapacityUnits": units}}
+        return {}
+
+    def _page(self, ordered, key_fn, kwargs, consistent=False):
+        start = kwargs.get("ExclusiveStartKey")
+        if start is not None:
+            start_key = key_fn(start)
+            ordered = [i for i in ordered if key_fn(i) > start_key]
+        limit = min(kwargs.get("Limit") or self.page_items, self.page_items)
+        page, rest = ordered[:limit], ordered[limit:]
+        flt = kwargs.get("FilterExpression")
+        units = self._read_cost(sum(_item_size(i) for i in page), consistent)
+        resp = {
+            "Items": [self._project(i, kwargs) for i in page if flt is None or _matches(flt, i, kwargs)],
+            "ScannedCount": len(page),
+        }
+        resp["Count"] = len(resp["Items"])
+        if rest and page:
+            last = page[-1]
+            names = set(self._key_names())
+            if kwargs.get("IndexName"):
+                names.update(k for k in self.indexes[kwargs["IndexName"]] if k)
+            resp["LastEvaluatedKey"] = {k: last[k] for k in names}
+        self.consumed_rcu += units
+        resp.update(self._capacity(kwargs, units))
+        return resp
+
+    # -- Table API --
+    def _round_trip(self):
+        if self.call_latency:
+            time.sleep(self.call_latency)
+
+    def put_item(self, Item, **kwargs):
+        self._round_trip()
+        with self.lock:
+            self.calls.append("put_item")
+            self.consumed_wcu += self._write_cost(Item)
+            self.items[self._key_of(Item)] = copy.deepcopy(Item)
+        return {}
+
+    def get_item(self, Key, **kwargs):
+        with self.lock:
+            self.calls.append("get_item")
+            item = self.items.get(self._key_of(Key))
+            self.consumed_rcu += self._read_cost(_item_size(item) if item else 1, kwargs.get("ConsistentRead"))
+            return {"Item": self._project(item, kwargs)} if item else {}
+
+    def delete_item(self, Key, ConditionExpression=None, **kwargs):
+        with self.lock:
+            self.calls.append("delete_item")
+            k = self._key_of(Key)
+            if ConditionExpression is not None and k not in self.items:
+                raise ClientError({"Error": {"Code": "ConditionalCheckFailedException", "Message": "failed"}}, "DeleteItem")
+            self.consumed_wcu += 1
+            self.items.pop(k, None)
+        return {}
+
+    def update_item(self, Key, UpdateExpression, ExpressionAttributeNames=None,
+                    ExpressionAttributeValues=None, ConditionExpression=None, ReturnValues="NONE", **kwargs):
+        names, values = ExpressionAttributeNames or {}, ExpressionAttributeValues or {}
+        with self.lock:
+            self.calls.append("update_item")
+            k = self._key_of(Key)
+            old = self.items.get(k)
+            if ConditionExpression is not None and not _evaluate_condition(ConditionExpression, old or {}, names, values):
+                raise ClientError({"Error": {"Code": "ConditionalCheckFailedException", "Message": "failed"}}, "UpdateItem")
+            new = copy.deepcopy(old) if old else dict(Key)
+            _apply_update(new, UpdateExpression, names, values)
+            self.items[k] = new
+            self.consumed_wcu += self._write_cost(new)
+            if ReturnValues == "ALL_NEW":
+                return {"Attributes": copy.deepcopy(new)}
+            if ReturnValues in ("ALL_OLD", "UPDATED_OLD") and old:
+                return {"Attributes": copy.deepcopy(old)}
+            return {}
+
+    def scan(self, **kwargs):
+        with self.lock:
+            self.calls.append("scan")
+            ordered = sorted(self.items.values(), key=lambda i: [_sort_value(v) for v in self._key_of(i)])
+            if "TotalSegments" in kwargs:
+                total, seg = kwargs["TotalSegments"], kwargs["Segment"]
+                ordered = [i for i in ordered if zlib.crc32(str(i[self.key]).encode()) % total == seg]
+            return self._page(ordered, lambda i: [_sort_value(v) for v in self._key_of(i)], kwargs,
+                              kwargs.get("ConsistentRead", False))
+
+    def query(self, KeyConditionExpression, IndexName=None, ScanIndexForward=True, **kwargs):
+        kwargs["IndexName"] = IndexName
+        with self.lock:
+            self.calls.append("query")
+            if IndexName:
+                if IndexName not in self.indexes:
+                    raise ClientError({"Error": {"Code": "ValidationException",
+                                                 "Message": "The table does not have the specified index"}}, "Query")
+                pk, sk = self.indexes[IndexName]
+            else:
+                pk, sk = self.key, self.sort_key
+            matched = [i for i in self.items.values()
+                       if pk in i and (sk is None or sk in i) and _matches(KeyConditionExpression, i, kwargs)]
+
+            def key_fn(i):
+                return [_sort_value(i[sk]) if sk else None] + [_sort_value(v) for v in self._key_of(i)]
+
+            ordered = sorted(matched, key=key_fn, reverse=not ScanIndexForward)
+            if not ScanIndexForward:
+                start = kwargs.pop("ExclusiveStartKey", None)
+                if start is not None:
+                    ordered = [i for i in ordered if key_fn(i) < key_fn(start)]
+            return self._page(ordered, key_fn, kwargs, kwargs.get("ConsistentRead", False))
+
+
+def _split_top_level(expr):
+    parts, depth, cur = [], 0, ""
+    for ch in expr:
+        if ch == "," and depth == 0:
+            parts.append(cur.strip())
+            cur = ""
+            continue
+        depth += ch == "("
+        depth -= ch == ")"
+        cur += ch
+    if cur.strip():
+        parts.append(cur.strip())
+    return parts
+
+
+def _operand(token, item, names, values):
+    token = token.strip()
+    if token.startswith(":"):
+        return copy.deepcopy(values[token])
+    if token.startswith("if_not_exists("):
+        path, default = _split_top_level(token[len("if_not_exists("):-1])
+        name = names.get(path, path)
+        return copy.deepcopy(item[name]) if name in item else _operand(default, item, names, values)
+    if "+" in token:
+        a, b = token.split("+", 1)
+        return _operand(a, item, names, values) + _operand(b, item, names, values)
+    if " - " in token:
+        a, b = token.split(" - ", 1)
+        return _operand(a, item, names, values) - _operand(b, item, names, values)
+    return copy.deepcopy(item.get(names.get(token, token)))
+
+
+def _apply_update(item, expression, names, values):
+    """支援 SET（:v、#a + :v、if_not_exists）、ADD、REMOVE 三種子句"""
+    clauses = re.split(r"\b(SET|ADD|REMOVE)\b", expression)
+    for action, body in zip(clauses[1::2], clauses[2::2]):
+        for part in _split_top_level(body):
+            if action == "SET":
+                path, rhs = part.split("=", 1)
+                item[names.get(path.strip(), path.strip())] = _operand(rhs, item, names, values)
+            elif action == "ADD":
+                path, val = part.split()
+                name = names.get(path, path)
+                item[name] = item.get(name, 0) + values[val]
+            else:
+                item.pop(names.get(part, part), None)
+
+
+def _evaluate_condition(cond, item, names, values):
+    if isinstance(cond, ConditionBase):
+        return _evaluate(cond, item)
+    return _ExpressionParser(cond, item, names, values).parse()
+
+
+def _matches(cond, item, kwargs):
+    """KeyConditionExpression / FilterExpression：boto3 條件物件或字串（配合 ExpressionAttributeNames/Values）"""
+    return _evaluate_condition(cond, item, kwargs.get("ExpressionAttributeNames") or {},
+                               kwargs.get("ExpressionAttributeValues") or {})
+
+
+_MISSING = object()
+_TOKEN = re.compile(r"\s*(<>|<=|>=|=|<|>|\(|\)|,|[#:]?[A-Za-z_][\w.]*)")
+_COMPARE = {"=": lambda a, b: a == b, "<>": lambda a, b: a != b, "<": lambda a, b: a < b,
+            "<=": lambda a, b: a <= b, ">": lambda a, b: a > b, ">=": lambda a, b: a >= b}
+
+
+class _ExpressionParser:
+    """
+    字串條件的最小 parser：OR / AND / NOT、括號、比較運算子、BETWEEN、
+    attribute_exists / attribute_not_exists / begins_with / contains
+    """
+
+    def __init__(self, expr, item, names, values):
+        self.tokens = _TOKEN.findall(expr)
+        self.pos = 0
+        self.item, self.names, self.values = item, names, values
+
+    def parse(self):
+        result = self._or()
+        assert self.pos == len(self.tokens), f"unparsed tokens: {self.tokens[self.pos:]}"
+        return result
+
+    def _peek(self):
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else None
+
+    def _take(self, expected=None):
+        token = self.tokens[self.pos]
+        assert expected is None or token == expected, f"expected {expected}, got {token}"
+        self.pos += 1
+        return token
+
+    def _or(self):
+        result = self._and()
+        while self._peek() == "OR":
+            self._take()
+            right = self._and()
+            result = result or right
+        return result
+
+    def _and(self):
+        result = self._not()
+        while self._peek() == "AND":
+            self._take()
+            right = self._not()
+            result = result and right
+        return result
+
+    def _not(self):
+        if self._peek() == "NOT":
+            self._take()
+            return not self._not()
+        return self._primary()
+
+    def _primary(self):
+        if self._peek() == "(":
+            self._take()
+            result = self._or()
+            self._take(")")
+            return result
+        if self._peek() in ("attribute_exists", "attribute_not_exists", "begins_with", "contains"):
+            func = self._take()
+            self._take("(")
+            args = [self._operand()]
+            while self._peek() == ",":
+                self._take()
+                args.append(self._operand())
+            self._take(")")
+            if func == "attribute_exists":
+                return args[0] is not _MISSING
+            if func == "attribute_not_exists":
+                return args[0] is _MISSING
+            if args[0] is _MISSING:
+                return False
+            return str(args[0]).startswith(args[1]) if func == "begins_with" else args[1] in args[0]
+        left = self._operand()
+        op = self._take()
+        if op == "BETWEEN":
+            low = self._operand()
+            self._take("AND")
+            high = self._operand()
+            return left is not _MISSING and low <= left <= high
+        right = self._operand()
+        if left is _MISSING or right is _MISSING:
+            return False
+        return _COMPARE[op](left, right)
+
+    def _operand(self):
+        token = self._take()
+        if token.startswith(":"):
+            return self.values[token]
+        return self.item.get(self.names.get(token, token), _MISSING)
+class _FakeMeta:
+    def __init__(self, client):
+        self.client = client
+
+
+class FakeDynamoClient:
+    """對應 table.meta.client：batch_write_item / batch_get_item，可模擬 UnprocessedItems"""
+
+    def __init__(self, tables, unprocessed_rounds=0):
+        self.tables = tables                # TableName -> FakeTable
+        self.unprocessed_rounds = unprocessed_rounds
+        self.batch_calls = 0
+        self.lock = threading.Lock()
+
+    def batch_write_item(self, RequestItems, **kwargs):
+        assert sum(len(v) for v in RequestItems.values()) <= 25, "BatchWriteItem allows at most 25 requests"
+        unprocessed = {}
+        for table in self.tables.values():
+            table._round_trip()
+            break
+        with self.lock:
+            self.batch_calls += 1
+            throttle = self.unprocessed_rounds > 0
+            self.unprocessed_rounds -= throttle
+        for name, requests in RequestItems.items():
+            table = self.tables[name]
+            keys = [table._key_of(_request_item(r)) for r in requests]
+            assert len(set(keys)) == len(keys), "duplicate keys in BatchWriteItem"
+            # 被 throttle 時只處理前半，後半回傳為 UnprocessedItems
+            cut = len(requests) // 2 if throttle else len(requests)
+            for r in requests[:cut]:
+                if "PutRequest" in r:
+                    with table.lock:
+                        table.items[table._key_of(r["PutRequest"]["Item"])] = copy.deepcopy(r["PutRequest"]["Item"])
+                        table.consumed_wcu += table._write_cost(r["PutRequest"]["Item"])
+                else:
+                    table.items.pop(table._key_of(r["DeleteRequest"]["Key"]), None)
+                    table.consumed_wcu += 1
+            if requests[cut:]:
+                unprocessed[name] = requests[cut:]
+        return {"UnprocessedItems": unprocessed}
+
+
+def _request_item(request):
+    if "PutRequest" in request:
+        return request["PutRequest"]["Item"]
+    return request["DeleteRequest"]["Key"]
+
+
+def attach_client(table, name="CrawlerTargets", **kwargs):
+    """替 FakeTable 掛上 meta.client（同 boto3 Table.meta.client）"""
+    table.meta = _FakeMeta(FakeDynamoClient({name: table}, **kwargs))
+    return table
@@ -0,0 +1,15 @@
+import os
+import sys
+import pathlib
+
+# Lambda 程式碼不是 package（資料夾名叫 lambda），直接把資產資料夾加進 sys.path
+ROOT = pathlib.Path(__file__).resolve().parents[2]
+# shared layer（aws_clients）在 Lambda 上位於 /opt/python
+for asset_dir in ("hello_lambda/lambda", "hello_lambda/alarm_logger", "hello_lambda/layers/shared/python"):
+    path = str(ROOT / asset_dir)
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+# handler 在 import 時就會讀這些環境變數 / 建 boto3 client
+os.environ.setdefault("TABLE_NAME", "CrawlerTargets")
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-2")
@@ -0,0 +1,310 @@
+import gzip
+import json
+from decimal import Decimal
+
+import pytest
+from botocore.exceptions import ClientError
+
+import aws_clients
+import export_items
+import stage_cache
+import targets_router
+from backfill_targets import backfill
+from target_items import item_type, new_item, update_kwargs
+from ttl_cache import TTLCache
+
+from tests.fakes import FakeTable, attach_client
+
+
+def _table():
+    return FakeTable(indexes={"ActiveIndex": ("activeStatus", "createdAt"),
+                              "UpdatedAtIndex": ("itemType", "updatedAt")})
+
+
+def _seed(table, n):
+    for i in range(n):
+        active = i % 3 != 0
+        table.put_item(Item={"targetId": f"t{i:04d}", "url": f"https://s{i}.example/", "active": active,
+                             "activeStatus": "true" if active else "false", "itemType": "target",
+                             "createdAt": f"2026-01-01T00:{i // 60:02d}:{i % 60:02d}"})
+
+
+@pytest.fixture
+def list_targets(monkeypatch):
+    import list_targets as mod
+    table = _table()
+    monkeypatch.setattr(mod, "table", table)
+    return mod, table
+
+
+def _get(mod, **qs):
+    resp = mod.handler({"queryStringParameters": qs or None}, None)
+    return resp["statusCode"], json.loads(resp["body"])
+
+
+def test_list_targets_paginates_with_next_token(list_targets):
+    mod, table = list_targets
+    _seed(table, 120)
+    seen, token = [], None
+    while True:
+        status, body = _get(mod, limit="50", **({"nextToken": token} if token else {}))
+        assert status == 200 and body["count"] <= 50
+        seen += [i["targetId"] for i in body["items"]]
+        token = body.get("nextToken")
+        if not token:
+            break
+    assert sorted(seen) == [f"t{i:04d}" for i in range(120)]
+
+
+def test_list_targets_active_filter_uses_index_query(list_targets):
+    mod, table = list_targets
+    _seed(table, 30)
+    status, body = _get(mod, active="false", limit="200")
+    assert status == 200
+    assert body["count"] == 10 and all(i["active"] is False for i in body["items"])
+    assert "scan" not in table.calls and "query" in table.calls
+
+
+def test_list_targets_falls_back_to_filtered_scan_without_index(list_targets):
+    mod, table = list_targets
+    _seed(table, 30)
+    del table.indexes["ActiveIndex"]
+    table.put_item(Item={"targetId": "legacy", "url": "https://legacy.example/"})   # 沒有 active / activeStatus
+    seen, token = [], None
+    while True:
+        status, body = _get(mod, active="true", limit="7", **({"nextToken": token} if token else {}))
+        assert status == 200
+        seen += [i["targetId"] for i in body["items"]]
+        token = body.get("nextToken")
+        if not token:
+            break
+    assert len(seen) == 21 and "legacy" in seen
+    assert "query" in table.calls and "scan" in table.calls
+
+
+def test_backfill_sets_missing_index_keys_once():
+    table = _table()
+    table.put_item(Item={"targetId": "old-1", "url": "https://a.example/"})
+    table.put_item(Item={"targetId": "old-2", "url": "https://b.example/", "active": False, "itemType": "target"})
+    table.put_item(Item={"targetId": "new", "url": "https://c.example/", "active": True, "activeStatus": "true",
+                         "itemType": item_type("new"), "updatedAt": "2026-01-01T00:00:00"})
+    assert backfill(table, total_segments=2) == {"scanned": 3, "updated": 2, "changed": 0}
+    assert table.items[("old-1",)]["activeStatus"] == "true"
+    assert table.items[("old-2",)]["activeStatus"] == "false" and table.items[("old-2",)]["itemType"] == item_type("old-2")
+    assert "updatedAt" not in table.items[("old-1",)]
+    assert backfill(table, total_segments=2)["updated"] == 0
+
+
+def test_list_targets_rejects_token_from_other_filter(list_targets):
+    mod, table = list_targets
+    _seed(table, 10)
+    _, body = _get(mod, active="true", limit="2")
+    status, _ = _get(mod, active="false", nextToken=body["nextToken"])
+    assert status == 400
+    status, _ = _get(mod, nextToken="not-a-token")
+    assert status == 400
+
+
+# --- batch endpoints -----------------------------------------------------------
+
+
+@pytest.fixture
+def batch(monkeypatch):
+    import batch_targets as mod
+    table = attach_client(_table(), unprocessed_rounds=3)
+    monkeypatch.setattr(mod, "table", table)
+    sleeps = []
+    monkeypatch.setattr(mod.time, "sleep", sleeps.append)
+    table.sleeps = sleeps
+    return mod, table
+
+
+def _call(mod, method, body):
+    resp = mod.handler({"httpMethod": method, "body": json.dumps(body)}, None)
+    return resp["statusCode"], json.loads(resp["body"])
+
+
+def test_batch_create_retries_unprocessed_and_reports_per_item(batch):
+    mod, table = batch
+    items = [{"url": f"https://s{i}.example/"} for i in range(60)] + [{"notes": "missing url"}]
+    status, body = _call(mod, "POST", {"items": items})
+    assert status == 200
+    assert body["succeeded"] == 60 and body["failed"] == 1
+    assert body["results"][-1]["statusCode"] == 400
+    assert len(table.items) == 60
+    assert table.meta.client.batch_calls == 3 + 3  # 3 批 + 3 次 UnprocessedItems 重試
+    assert len(table.sleeps) == 3
+
+
+def test_batch_chunk_error_fails_only_that_chunk(batch, monkeypatch):
+    mod, table = batch
+    client = table.meta.client
+    client.unprocessed_rounds = 0
+    write = client.batch_write_item
+
+    def throttle_second_chunk(RequestItems, **kwargs):
+        if any(r["PutRequest"]["Item"]["url"] == "https://s30.example/" for r in RequestItems[mod.TABLE_NAME]):
+            raise ClientError({"Error": {"Code": "ProvisionedThroughputExceededException"}}, "BatchWriteItem")
+        return write(RequestItems, **kwargs)
+
+    monkeypatch.setattr(mod, "WRITE_CONCURRENCY", 1)
+    monkeypatch.setattr(client, "batch_write_item", throttle_second_chunk)
+    status, body = _call(mod, "POST", {"items": [{"url": f"https://s{i}.example/"} for i in range(60)]})
+    assert status == 200
+    assert body["succeeded"] == 35 and body["failed"] == 25
+    assert {r["statusCode"] for r in body["results"][25:50]} == {503}
+    assert len(table.items) == 35
+
+
+def test_batch_update_and_delete(batch):
+    mod, table = batch
+    _seed(table, 5)
+    status, body = _call(mod, "PUT", {"items": [
+        {"targetId": "t0001", "active": False}, {"targetId": "missing", "notes": "x"}, {"targetId": "t0002"},
+    ]})
+    assert [r["statusCode"] for r in body["results"]] == [200, 404, 400]
+    assert table.items[("t0001",)]["activeStatus"] == "false"
+
+    status, body = _call(mod, "DELETE", {"targetIds": ["t0001", "t0002", "t0001"]})
+    assert [r["statusCode"] for r in body["results"]] == [204, 204, 204]
+    assert ("t0001",) not in table.items and ("t0002",) not in table.items
+
+
+def test_batch_rejects_empty_or_oversized_requests(batch):
+    mod, _ = batch
+    assert _call(mod, "POST", {"items": []})[0] == 400
+    assert _call(mod, "DELETE", {"targetIds": ["x"] * (mod.MAX_ITEMS + 1)})[0] == 400
+    for body in ([{"url": "https://a.example/"}], "items", 3):
+        assert _call(mod, "POST", body) == (400, {"error": "request body must be a JSON object"})
+
+
+# --- NDJSON export ---------------------------------------------------------------
+
+
+def test_export_streams_ndjson_with_optional_gzip():
+    table = FakeTable(page_items=7)
+    for i in range(100):
+        table.put_item(Item={"targetId": f"t{i:03d}", "url": f"https://s{i}.example/", "latency": Decimal("0.25")})
+
+    out = bytearray()
+    stats = export_items.export(table, out.extend, gzip=True, total_segments=3)
+    lines = gzip.decompress(bytes(out)).decode().splitlines()
+    assert stats["items"] == 100 and stats["outputBytes"] == len(out)
+    rows = [json.loads(line) for line in lines]
+    assert sorted(r["targetId"] for r in rows) == [f"t{i:03d}" for i in range(100)]
+    assert rows[0]["latency"] == 0.25
+
+
+def test_interval_is_clamped_and_schedule_state_serializes(list_targets):
+    assert new_item({"url": "https://a.example/", "intervalSeconds": "5"})["intervalSeconds"] == 60
+    assert "intervalSeconds" not in new_item({"url": "https://a.example/", "intervalSeconds": "soon"})
+    assert update_kwargs("t1", {"intervalSeconds": 10 ** 9})["ExpressionAttributeValues"][":v1"] == 86400
+
+    mod, table = list_targets
+    _seed(table, 1)
+    table.update_item(Key={"targetId": "t0000"}, UpdateExpression="SET flapScore = :f, nextDueAt = :n",
+                      ExpressionAttributeValues={":f": Decimal("1.5"), ":n": Decimal(1700000000)})
+    status, body = _get(mod)
+    assert status == 200
+    assert body["items"][0]["flapScore"] == 1.5 and body["items"][0]["nextDueAt"] == 1700000000
+
+
+# --- single router mode --------------------------------------------------------
+@pytest.fixture
+def router(monkeypatch):
+    table = attach_client(_table())
+    for name in ("create_target", "get_target", "update_target", "delete_target", "list_targets", "batch_targets"):
+        monkeypatch.setattr(__import__(name), "table", table)
+    monkeypatch.setattr(targets_router, "cache", TTLCache(maxsize=2, ttl=60))
+    return targets_router, table
+
+
+def _route(mod, method, resource, target_id=None, body=None):
+    event = {"httpMethod": method, "resource": resource, "body": json.dumps(body) if body is not None else None,
+             "pathParameters": {"targetId": target_id} if target_id else None, "queryStringParameters": None}
+    return mod.handler(event, None)
+
+
+def test_router_serves_hot_gets_from_cache_until_a_write(router):
+    mod, table = router
+    created = json.loads(_route(mod, "POST", "/targets", body={"url": "https://a.example/"})["body"])["item"]
+    tid = created["targetId"]
+
+    first = _route(mod, "GET", "/targets/{targetId}", tid)
+    second = _route(mod, "GET", "/targets/{targetId}", tid)
+    assert first["headers"]["X-Cache"] == "MISS" and second["headers"]["X-Cache"] == "HIT"
+    assert json.loads(second["body"])["item"] == created
+    assert table.calls.count("get_item") == 1
+
+    _route(mod, "PUT", "/targets/{targetId}", tid, body={"notes": "changed"})
+    third = _route(mod, "GET", "/targets/{targetId}", tid)
+    assert third["headers"]["X-Cache"] == "MISS" and json.loads(third["body"])["item"]["notes"] == "changed"
+
+    _route(mod, "DELETE", "/targets/{targetId}", tid)
+    assert _route(mod, "GET", "/targets/{targetId}", tid)["statusCode"] == 404
+
+
+def test_router_unknown_routes():
+    assert _route(targets_router, "PATCH", "/targets")["statusCode"] == 405
+    assert _route(targets_router, "GET", "/nope")["statusCode"] == 404
+
+
+def test_ttl_cache_evicts_least_recently_used_and_expired():
+    now = [0.0]
+    cache = TTLCache(maxsize=2, ttl=10, clock=lambda: now[0])
+    cache.put("a", 1)
+    cache.put("b", 2)
+    cache.get("a")
+    cache.put("c", 3)        # b 最久沒用 → 淘汰
+    assert cache.get("b") is None and cache.get("a") == 1
+    now[0] = 11
+    assert cache.get("a") is None and len(cache) == 1
+
+
+# --- ETag / 304 與 stage cache 失效 ----------------------------------------------
+class _FakeApiGateway:
+    def __init__(self):
+        self.flushes = []
+
+    def flush_stage_cache(self, **kwargs):
+        self.flushes.append(kwargs)
+
+
+def _conditional(mod, method, resource, target_id=None, etag=None, qs=None):
+    event = {"httpMethod": method, "resource": resource, "body": None, "queryStringParameters": qs,
+             "pathParameters": {"targetId": target_id} if target_id else None,
+             "headers": {"if-none-match": etag} if etag else {}}
+    return mod.handler(event, None)
+
+
+def test_gets_answer_if_none_match_with_304_until_the_item_changes(router):
+    mod, table = router
+    tid = json.loads(_route(mod, "POST", "/targets", body={"url": "https://a.example/"})["body"])["item"]["targetId"]
+
+    first = _conditional(mod, "GET", "/targets/{targetId}", tid)
+    tag = first["headers"]["ETag"]
+    assert first["statusCode"] == 200 and tag.startswith('"')
+    hit = _conditional(mod, "GET", "/targets/{targetId}", tid, etag=f"W/{tag}")   # 快取命中也要比對
+    assert hit["statusCode"] == 304 and hit["body"] == "" and hit["headers"]["X-Cache"] == "HIT"
+
+    listed = _conditional(mod, "GET", "/targets")
+    assert _conditional(mod, "GET", "/targets", etag=listed["headers"]["ETag"])["statusCode"] == 304
+    # crawler 寫回最新狀態不改 updatedAt，ETag 仍要改變
+    table.update_item(Key={"targetId": tid}, UpdateExpression="SET lastStatus = :s",
+                      ExpressionAttributeValues={":s": {"success": False}})
+    assert _conditional(mod, "GET", "/targets", etag=listed["headers"]["ETag"])["statusCode"] == 200
+
+
+def test_writes_flush_the_stage_cache_when_enabled(router, monkeypatch):
+    mod, _ = router
+    apigw = _FakeApiGateway()
+    monkeypatch.setitem(aws_clients._clients, "apigateway", apigw)
+    assert stage_cache.invalidate() is False                     # 沒啟用：不呼叫 API
+    monkeypatch.setattr(stage_cache, "REST_API_ID", "abc123")
+    monkeypatch.setattr(stage_cache, "STAGE_NAME", "prod")
+
+    tid = json.loads(_route(mod, "POST", "/targets", body={"url": "https://a.example/"})["body"])["item"]["targetId"]
+    _route(mod, "PUT", "/targets/{targetId}", tid, body={"notes": "x"})
+    _route(mod, "GET", "/targets/{targetId}", tid)
+    _route(mod, "DELETE", "/targets/{targetId}", tid)
+    assert apigw.flushes == [{"restApiId": "abc123", "stageName": "prod"}] * 3
@@ -0,0 +1,133 @@
+import json
+from datetime import datetime, timezone
+from decimal import Decimal
+
+import pytest
+from botocore.exceptions import ClientError
+
+import alarm_history
+import alarm_logger
+
+from tests.fakes import FakeTable, attach_client
+
+
+def _record(name, when, state="ALARM", value=1.5):
+    message = {
+        "AlarmName": name, "NewStateValue": state, "NewStateReason": "Threshold Crossed",
+        "StateChangeTime": when,
+        "Trigger": {"MetricName": "Latency", "Namespace": "WebsiteMonitor", "Threshold": value,
+                    "Dimensions": [{"name": "URL", "value": "https://www.bbc.com/"}]},
+    }
+    return {"EventSource": "aws:sns", "Sns": {"Message": json.dumps(message)}}
+
+
+@pytest.fixture
+def logger_mod(monkeypatch):
+    table = attach_client(FakeTable(key="AlarmName", sort_key="StateChangeTime"),
+                          name=alarm_logger.TABLE_NAME, unprocessed_rounds=2)
+    monkeypatch.setattr(alarm_logger, "table", table)
+    monkeypatch.setattr(alarm_logger, "_seen_keys", alarm_logger.OrderedDict())
+    monkeypatch.setattr(alarm_logger.time, "sleep", lambda s: None)
+    return alarm_logger, table
+
+
+def test_alarm_logger_batches_and_drops_duplicates(logger_mod):
+    mod, table = logger_mod
+    records = [_record(f"LatencyAlarm_{i}", "2026-10-17T00:00:00.000+0000") for i in range(60)]
+    records += records[:10]  # 同一批內重複
+    resp = mod.handler({"Records": records}, None)
+
+    assert resp["body"] == "ok (written=60, duplicates=10)"
+    assert len(table.items) == 60
+    assert table.meta.client.batch_calls == 3 + 2  # 3 批 + 2 次 UnprocessedItems 重試
+    item = table.items[("LatencyAlarm_0", "2026-10-17T00:00:00.000+0000")]
+    assert item["Raw"]["Trigger"]["Threshold"] == Decimal("1.5")
+    assert item["Dimensions"] == {"URL": "https://www.bbc.com/"}
+
+    # SNS 重送：warm container 直接略過，不再寫入
+    calls = table.meta.client.batch_calls
+    resp = mod.handler({"Records": records[:5]}, None)
+    assert resp["body"] == "ok (written=0, duplicates=5)"
+    assert table.meta.client.batch_calls == calls
+
+
+def test_alarm_logger_raises_when_a_chunk_fails_so_sns_retries(logger_mod, monkeypatch):
+    mod, table = logger_mod
+    client = table.meta.client
+    client.unprocessed_rounds = 0
+    write = client.batch_write_item
+    failing = [True]
+
+    def fail_first_chunk(RequestItems, **kwargs):
+        if failing[0]:
+            failing[0] = False
+            raise ClientError({"Error": {"Code": "ProvisionedThroughputExceededException"}}, "BatchWriteItem")
+        return write(RequestItems, **kwargs)
+
+    monkeypatch.setattr(client, "batch_write_item", fail_first_chunk)
+    records = [_record(f"LatencyAlarm_{i}", "2026-10-17T00:00:00.000+0000") for i in range(30)]
+    with pytest.raises(RuntimeError, match="25 of 30"):
+        mod.handler({"Records": records}, None)
+    assert len(table.items) == 5
+
+    # 重試：已寫入的 5 筆略過，只補寫失敗的 25 筆
+    resp = mod.handler({"Records": records}, None)
+    assert resp["body"] == "ok (written=25, duplicates=5)"
+    assert len(table.items) == 30
+
+
+# --- rollups & history API ------------------------------------------------------
+def test_alarm_logger_rollups_count_recoveries_once(logger_mod, monkeypatch):
+    mod, table = logger_mod
+    rollups = FakeTable(key="AlarmName", sort_key="Period")
+    monkeypatch.setattr(mod, "rollup_table", rollups)
+
+    records = [
+        _record("AvailabilityAlarm_bbc", "2026-10-17T01:00:00.000+0000", "ALARM"),
+        _record("AvailabilityAlarm_bbc", "2026-10-17T01:10:00.000+0000", "OK"),
+        _record("AvailabilityAlarm_bbc", "2026-10-17T02:00:00.000+0000", "ALARM"),
+        _record("AvailabilityAlarm_bbc", "2026-10-17T02:05:00.000+0000", "OK"),
+    ]
+    mod.handler({"Records": records}, None)
+    # 冷容器收到重送：主表冪等覆寫，計數不會重複
+    mod._seen_keys.clear()
+    mod.handler({"Records": records[1:2]}, None)
+
+    day = rollups.items[("AvailabilityAlarm_bbc", "2026-10-17")]
+    assert day["transitions"] == 4 and day["alarmCount"] == 2 and day["okCount"] == 2
+    assert day["recoveries"] == 2 and day["recoverySeconds"] == Decimal("900.0")
+    assert rollups.items[("AvailabilityAlarm_bbc", "STATE")]["lastState"] == "OK"
+
+
+def test_alarm_history_routes(logger_mod, monkeypatch):
+    mod, table = logger_mod
+    table.indexes["StateTimeIndex"] = ("NewStateValue", "StateChangeTime")
+    rollups = FakeTable(key="AlarmName", sort_key="Period")
+    monkeypatch.setattr(mod, "rollup_table", rollups)
+    mod.handler({"Records": [
+        _record("A", "2026-10-16T23:00:00.000+0000", "ALARM"),
+        _record("A", "2026-10-17T00:30:00.000+0000", "OK"),
+        _record("B", "2026-10-17T00:45:00.000+0000", "ALARM"),
+    ]}, None)
+    monkeypatch.setattr(alarm_history, "table", table)
+    monkeypatch.setattr(alarm_history, "rollup_table", rollups)
+
+    resp = alarm_history.handler({"resource": "/alarms/{alarmName}/history", "pathParameters": {"alarmName": "A"},
+                                  "queryStringParameters": {"from": "2026-10-17", "to": "2026-10-18"}}, None)
+    body = json.loads(resp["body"])
+    assert [i["StateChangeTime"] for i in body["items"]] == ["2026-10-17T00:30:00.000+0000"]
+    assert "Raw" not in body["items"][0]
+
+    resp = alarm_history.recent_transitions({"hours": "1.5"}, now=datetime(2026, 10, 17, 1, 0, tzinfo=timezone.utc))
+    assert [i["AlarmName"] for i in json.loads(resp["body"])["items"]] == ["B"]
+    for hours in ("inf", "nan", "0", "-1", "soon"):
+        resp = alarm_history.handler({"resource": "/alarms/transitions", "queryStringParameters": {"hours": hours}},
+                                     None)
+        assert resp["statusCode"] == 400
+    resp = alarm_history.handler({"resource": "/alarms/transitions", "queryStringParameters": {"hours": "1e12"}}, None)
+    assert resp["statusCode"] == 200
+
+    resp = alarm_history.handler({"resource": "/alarms/{alarmName}/rollups", "pathParameters": {"alarmName": "A"},
+                                  "queryStringParameters": {"from": "2026-10-16", "to": "2026-10-17"}}, None)
+    summary = json.loads(resp["body"])["summary"]
+    assert summary == {"transitions": 2, "flapCount": 1, "recoveries": 1, "mttrSeconds": 5400.0}
@@ -0,0 +1,89 @@
+from decimal import Decimal
+
+import boto3
+import pytest
+from boto3.dynamodb.conditions import Attr, Key
+from botocore.stub import Stubber
+
+import aws_clients
+
+
+@pytest.fixture
+def stubbed():
+    client = boto3.client("dynamodb", region_name="us-east-2",
+                          aws_access_key_id="x", aws_secret_access_key="x")
+    with Stubber(client) as stub:
+        yield aws_clients.Table("CrawlerTargets", factory=lambda: client), stub
+        stub.assert_no_pending_responses()
+
+
+def test_serialize_round_trip_matches_boto3_types():
+    from boto3.dynamodb.types import TypeDeserializer, TypeSerializer
+
+    value = {"s": "x", "n": 3, "d": Decimal("1.5"), "b": True, "none": None, "l": [1, "a"],
+             "m": {"k": Decimal("2")}, "ss": {"a", "b"}, "raw": b"\x00"}
+    assert aws_clients.serialize(value) == TypeSerializer().serialize(value)
+    av = aws_clients.serialize(value)
+    assert aws_clients.deserialize(av) == TypeDeserializer().deserialize(av)
+    with pytest.raises(TypeError):
+        aws_clients.serialize(1.5)
+
+
+def test_table_query_builds_conditions_and_deserializes(stubbed):
+    table, stub = stubbed
+    stub.add_response("query", {
+        "Items": [{"targetId": {"S": "t1"}, "nextDueAt": {"N": "17"}}],
+        "LastEvaluatedKey": {"targetId": {"S": "t1"}},
+    }, {
+        "TableName": "CrawlerTargets", "IndexName": "ActiveIndex", "Limit": 5,
+        "KeyConditionExpression": "#n0 = :v0",
+        "ExpressionAttributeNames": {"#n0": "activeStatus"},
+        "ExpressionAttributeValues": {":v0": {"S": "true"}},
+        "ExclusiveStartKey": {"targetId": {"S": "t0"}},
+    })
+    resp = table.query(IndexName="ActiveIndex", KeyConditionExpression=Key("activeStatus").eq("true"),
+                       Limit=5, ExclusiveStartKey={"targetId": "t0"})
+    assert resp["Items"] == [{"targetId": "t1", "nextDueAt": Decimal(17)}]
+    assert resp["LastEvaluatedKey"] == {"targetId": "t1"}
+
+
+def test_table_update_merges_placeholders(stubbed):
+    table, stub = stubbed
+    stub.add_response("update_item", {"Attributes": {"flapScore": {"N": "1.5"}}}, {
+        "TableName": "CrawlerTargets", "Key": {"targetId": {"S": "t1"}},
+        "UpdateExpression": "SET #f = :f",
+        "ConditionExpression": "attribute_exists(#n0)",
+        "ExpressionAttributeNames": {"#f": "flapScore", "#n0": "targetId"},
+        "ExpressionAttributeValues": {":f": {"N": "1.5"}},
+        "ReturnValues": "ALL_NEW",
+    })
+    resp = table.update_item(Key={"targetId": "t1"}, UpdateExpression="SET #f = :f",
+                             ExpressionAttributeNames={"#f": "flapScore"},
+                             ExpressionAttributeValues={":f": Decimal("1.5")},
+                             ConditionExpression=Attr("targetId").exists(), ReturnValues="ALL_NEW")
+    assert resp["Attributes"] == {"flapScore": Decimal("1.5")}
+
+
+def test_meta_client_batch_write_round_trips_unprocessed_items(stubbed):
+    table, stub = stubbed
+    stub.add_response("batch_write_item", {
+        "UnprocessedItems": {"CrawlerTargets": [{"PutRequest": {"Item": {"targetId": {"S": "t2"}}}}]},
+    }, {"RequestItems": {"CrawlerTargets": [
+        {"PutRequest": {"Item": {"targetId": {"S": "t1"}, "tags": {"L": []}}}},
+        {"PutRequest": {"Item": {"targetId": {"S": "t2"}, "tags": {"L": []}}}},
+    ]}})
+    resp = table.meta.client.batch_write_item(RequestItems={"CrawlerTargets": [
+        {"PutRequest": {"Item": {"targetId": "t1", "tags": []}}},
+        {"PutRequest": {"Item": {"targetId": "t2", "tags": []}}},
+    ]})
+    assert resp["UnprocessedItems"] == {"CrawlerTargets": [{"PutRequest": {"Item": {"targetId": "t2"}}}]}
+
+
+def test_clients_are_created_lazily_and_shared(monkeypatch):
+    created = []
+    monkeypatch.setattr(aws_clients, "_clients", {})
+    monkeypatch.setattr(boto3, "client", lambda service, **kw: created.append(service) or object())
+    table = aws_clients.table("CrawlerTargets")
+    assert created == []
+    assert aws_clients.client("dynamodb") is table._factory()
+    assert created == ["dynamodb"]
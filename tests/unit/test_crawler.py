@@ -0,0 +1,910 @@
+import hashlib
+import http.server
+import json
+import random
+import socket
+import threading
+import time
+import types
+import urllib.error
+from collections import Counter
+from decimal import Decimal
+
+import pytest
+
+import circuit_breaker
+import crawl_dispatcher
+import crawl_state
+import crawl_worker
+import get_target
+import instrumentation
+import lambda_function
+import latency_baseline
+import numpy_loader
+import target_status
+from content_fingerprint import SimHasher, change_ratio, fingerprint
+from http_pool import CachingResolver, HTTPPool
+from http_probe import ValidatorCache, probe
+from latency_baseline import LatencyHistory, decode_window, encode_window
+from metrics_buffer import EmfMetricBuffer, MAX_DATUMS_PER_CALL, MetricBuffer, metric_buffer_from_env
+from probe_engine import run_probes
+from schedule import MAX_INTERVAL_SECONDS, Scheduler, next_state
+from target_index import TargetIndex
+from target_items import UPDATED_AT_SHARDS, item_type, update_kwargs
+from target_state import TargetStateWriter
+from work_queue import InMemoryWorkQueue
+
+from tests.fakes import FakeCloudWatch, FakeTable
+
+
+class _Tracker:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.running = 0
+        self.peak = 0
+        self.per_host = {}
+        self.peak_per_host = {}
+
+    def enter(self, host):
+        with self.lock:
+            self.running += 1
+            self.peak = max(self.peak, self.running)
+            self.per_host[host] = self.per_host.get(host, 0) + 1
+            self.peak_per_host[host] = max(self.peak_per_host.get(host, 0), self.per_host[host])
+
+    def leave(self, host):
+        with self.lock:
+            self.running -= 1
+            self.per_host[host] -= 1
+
+
+def test_run_probes_is_bounded_by_slowest_probe_not_sum():
+    urls = [f"https://site{i}.example/" for i in range(20)]
+    start = time.monotonic()
+    results = run_probes(urls, lambda u: (time.sleep(0.2), u)[1], max_workers=20)
+    elapsed = time.monotonic() - start
+    assert results == urls
+    assert elapsed < 1.0  # 串行需要 4 秒
+
+
+def test_run_probes_respects_global_and_per_host_limits():
+    tracker = _Tracker()
+    urls = [f"https://a.example/{i}" for i in range(6)] + [f"https://b{i}.example/" for i in range(6)]
+
+    def probe(url):
+        host = url.split("/")[2]
+        tracker.enter(host)
+        time.sleep(0.05)
+        tracker.leave(host)
+        return url
+
+    results = run_probes(urls, probe, max_workers=4, per_host=2)
+    assert results == urls
+    assert tracker.peak <= 4
+    assert tracker.peak_per_host["a.example"] <= 2
+
+
+def test_run_probes_returns_partial_results_at_deadline():
+    def probe(url):
+        time.sleep(2 if "slow" in url else 0.01)
+        return url
+
+    urls = ["https://fast.example/", "https://slow.example/"]
+    start = time.monotonic()
+    results = run_probes(urls, probe, deadline=time.monotonic() + 0.3)
+    assert time.monotonic() - start < 1.0
+    assert results == ["https://fast.example/", None]
+
+
+# --- metrics buffer ---------------------------------------------------------
+
+
+def test_metric_buffer_sends_full_batches_per_namespace():
+    cw = FakeCloudWatch()
+    buf = MetricBuffer(cw)
+    for i in range(2500):
+        buf.put("WebsiteMonitor", "Latency", 0.1, "Seconds", {"URL": f"https://s{i}.example/"})
+    buf.put("WebsiteMonitorCrawler", "RunTimeMs", 123, "Milliseconds")
+    stats = buf.flush()
+
+    sizes = sorted(len(batch) for ns, batch in cw.calls if ns == "WebsiteMonitor")
+    assert sizes == [500, MAX_DATUMS_PER_CALL, MAX_DATUMS_PER_CALL]
+    assert len(cw.datums("WebsiteMonitorCrawler")) == 1
+    assert stats == {"calls": 4, "failed": 0}
+
+
+def test_metric_buffer_retries_throttled_calls():
+    cw = FakeCloudWatch(throttle_first=2)
+    buf = MetricBuffer(cw, sleep=lambda s: None)
+    buf.put("WebsiteMonitor", "IsSuccess", 1, "Count", {"URL": "https://a.example/"})
+    assert buf.flush() == {"calls": 1, "failed": 0}
+    assert cw.throttled == 2
+    assert len(cw.datums()) == 1
+
+
+def test_handler_publishes_metrics_in_one_batch_per_namespace(monkeypatch):
+    cw = FakeCloudWatch()
+    monkeypatch.setattr(lambda_function, "metrics", MetricBuffer(cw))
+    urls = [f"https://s{i}.example/" for i in range(50)]
+    monkeypatch.setattr(lambda_function, "load_target_items", lambda: [{"targetId": u, "url": u} for u in urls])
+    monkeypatch.setattr(lambda_function, "scheduler", Scheduler())
+    monkeypatch.setattr(lambda_function, "get_state_writer", lambda: None)
+    monkeypatch.setattr(lambda_function, "probe",
+                        lambda url, **kwargs: (_ for _ in ()).throw(OSError("offline")))
+
+    resp = lambda_function.handler({}, None)
+    assert resp["statusCode"] == 500
+    assert [ns for ns, _ in cw.calls].count("WebsiteMonitor") == 1
+    assert len(cw.datums("WebsiteMonitor")) == 100
+    assert {d["MetricName"] for d in cw.datums("WebsiteMonitorCrawler")} == {"RunTimeMs", "SitesChecked", "SitesSkipped", "SitesShortCircuited", "SitesNotDue"}
+
+
+
+def test_per_url_latency_and_probe_phase_are_separate_histograms(monkeypatch):
+    lines = []
+    monkeypatch.setattr(instrumentation, "write", lines.append)
+    monkeypatch.setattr(lambda_function, "metrics", MetricBuffer(FakeCloudWatch()))
+    urls = [f"https://s{i}.example/" for i in range(5)]
+    monkeypatch.setattr(lambda_function, "load_target_items", lambda: [{"targetId": u, "url": u} for u in urls])
+    monkeypatch.setattr(lambda_function, "scheduler", Scheduler())
+    monkeypatch.setattr(lambda_function, "get_state_writer", lambda: None)
+    monkeypatch.setattr(lambda_function, "probe", lambda url, **kwargs: {
+        "status": 200, "content_length": 1, "sha256": None, "not_modified": False, "timings": {}})
+
+    lambda_function.handler({}, None)
+    docs = [json.loads(line) for text in lines for line in text.splitlines() if line.startswith('{"_aws"')]
+    assert sum(len(d.get("probe_url", [])) for d in docs) == 5
+    assert sum(len(d.get("probe", [])) for d in docs) == 1     # 整個探測 phase 一個值
+
+
+# --- adaptive scheduling ------------------------------------------------------
+
+
+def test_scheduler_only_returns_due_targets_and_backs_off():
+    now = [1000.0]
+    sched = Scheduler(clock=lambda: now[0], rng=lambda: 0.5)   # rng=0.5 → 無 jitter
+    sched.sync([{"targetId": "ok", "url": "u1"}, {"targetId": "dead", "url": "u2"},
+                {"targetId": "later", "url": "u3", "nextDueAt": 1200}])
+    assert {t["targetId"] for t in sched.due()} == {"ok", "dead"}
+    assert sched.record("ok", True)["nextDueAt"] == 1300
+    sched.record("dead", False)
+    assert sched.due() == []
+
+    intervals = []
+    for _ in range(30):
+        now[0] = sched.targets["dead"]["nextDueAt"]
+        assert "dead" in {t["targetId"] for t in sched.due()}
+        intervals.append(sched.record("dead", False)["currentInterval"])
+    # 長時間失敗：間隔緩慢遞增直到上限
+    assert intervals[0] < intervals[5] < intervals[10] and intervals[-1] == MAX_INTERVAL_SECONDS
+    assert sched.record("dead", True)["currentInterval"] == 300
+
+
+def test_scheduler_spreads_overdue_restored_targets_over_their_interval():
+    now = [100_000.0]
+    rng = random.Random(1)
+    sched = Scheduler(clock=lambda: now[0], rng=rng.random)
+    sched.sync([{"targetId": f"t{i}", "url": "u", "nextDueAt": 90_000, "currentInterval": 300} for i in range(100)]
+               + [{"targetId": "new", "url": "u"}, {"targetId": "later", "url": "u", "nextDueAt": 100_200}])
+    due_at = {tid: t["nextDueAt"] for tid, t in sched.targets.items()}
+    assert due_at["new"] == 100_000 and due_at["later"] == 100_200
+    spread = [due_at[f"t{i}"] for i in range(100)]
+    assert all(100_000 <= d < 100_300 for d in spread) and len(set(spread)) > 50
+    assert len(sched.due()) < 10     # cold start 後不會全部同時到期
+
+
+def test_flapping_targets_back_off_faster_than_dead_ones():
+    flap = {"lastSuccess": True}
+    dead = {"lastSuccess": False}
+    for i in range(4):
+        flap.update(next_state(flap, i % 2 == 1, 0, rng=lambda: 0.5))
+        dead.update(next_state(dead, False, 0, rng=lambda: 0.5))
+    assert flap["currentInterval"] > dead["currentInterval"]
+
+
+def test_scheduler_drops_removed_targets_and_honours_interval():
+    sched = Scheduler(clock=lambda: 0, rng=lambda: 0.5)
+    sched.sync([{"targetId": "a", "url": "u", "intervalSeconds": 120}, {"targetId": "b", "url": "v"}])
+    sched.sync([{"targetId": "a", "url": "u", "intervalSeconds": 120}])
+    assert [t["targetId"] for t in sched.due()] == ["a"]
+    assert sched.record("a", True)["nextDueAt"] == 120
+
+
+def test_handler_probes_only_due_targets_and_persists_schedule(monkeypatch):
+    table = FakeTable()
+    for i in range(3):
+        table.put_item(Item={"targetId": f"t{i}", "url": f"https://s{i}.example/", "updatedAt": "2026-01-01T00:00:00"})
+    writer = TargetStateWriter(table)
+    monkeypatch.setattr(lambda_function, "metrics", MetricBuffer(FakeCloudWatch()))
+    monkeypatch.setattr(lambda_function, "scheduler", Scheduler())
+    monkeypatch.setattr(lambda_function, "get_state_writer", lambda: writer)
+    monkeypatch.setattr(lambda_function, "load_target_items",
+                        lambda: [{"targetId": f"t{i}", "url": f"https://s{i}.example/"} for i in range(3)])
+    probed = []
+
+    def fake_probe(url, **kwargs):
+        probed.append(url)
+        return {"status": 200, "content_length": 1, "sha256": None, "not_modified": False, "timings": {}}
+
+    monkeypatch.setattr(lambda_function, "probe", fake_probe)
+    lambda_function.handler({}, None)
+    assert len(probed) == 3
+    item = table.get_item(Key={"targetId": "t0"})["Item"]
+    assert item["lastSuccess"] is True and item["consecutiveFailures"] == 0
+    assert item["updatedAt"] == "2026-01-01T00:00:00"   # 不影響增量同步
+
+    resp = lambda_function.handler({}, None)          # 下一個 tick：沒有到期目標
+    assert len(probed) == 3
+    assert resp["statusCode"] == 200
+
+
+def test_emf_buffer_writes_one_document_per_dimension_set():
+    out = []
+    emf = EmfMetricBuffer(write=out.append, clock=lambda: 1700000000.0)
+    for i in range(3):
+        dims = {"URL": f"https://s{i}.example/"}
+        emf.put("WebsiteMonitor", "Latency", 0.1 * i, "Seconds", dims)
+        emf.put("WebsiteMonitor", "IsSuccess", 1, "Count", dims)
+    for _ in range(150):
+        emf.put("WebsiteMonitor", "Latency", 0.5, "Seconds", {"URL": "https://s0.example/"})
+    emf.put("WebsiteMonitorCrawler", "RunTimeMs", 1234, "Milliseconds")
+    stats = emf.flush()
+
+    docs = [json.loads(line) for line in "".join(out).splitlines()]
+    assert stats["calls"] == 0 and stats["documents"] == len(docs) == 5   # s0 超過 100 個值 → 2 份
+    s1 = next(d for d in docs if d.get("URL") == "https://s1.example/")
+    directive = s1["_aws"]["CloudWatchMetrics"][0]
+    assert s1["_aws"]["Timestamp"] == 1700000000000
+    assert directive["Namespace"] == "WebsiteMonitor" and directive["Dimensions"] == [["URL"]]
+    assert {m["Name"]: m["Unit"] for m in directive["Metrics"]} == {"Latency": "Seconds", "IsSuccess": "Count"}
+    assert s1["IsSuccess"] == 1
+    s0_values = sum(len(d["Latency"]) if isinstance(d["Latency"], list) else 1
+                    for d in docs if d.get("URL") == "https://s0.example/")
+    assert s0_values == 151
+    crawler = next(d for d in docs if "RunTimeMs" in d)
+    assert crawler["_aws"]["CloudWatchMetrics"][0]["Dimensions"] == [[]]
+    assert emf.flush()["documents"] == 0
+
+
+def test_metrics_backend_is_chosen_by_env(monkeypatch):
+    monkeypatch.setenv("METRICS_BACKEND", "emf")
+    assert isinstance(metric_buffer_from_env(lambda: 1 / 0), EmfMetricBuffer)
+    monkeypatch.setenv("METRICS_BACKEND", "api")
+    assert isinstance(metric_buffer_from_env(FakeCloudWatch), MetricBuffer)
+
+
+def test_metric_client_is_created_on_first_send_not_at_import(monkeypatch):
+    monkeypatch.setenv("METRICS_BACKEND", "api")
+    created = []
+
+    def factory():
+        created.append(FakeCloudWatch())
+        return created[-1]
+
+    buf = metric_buffer_from_env(factory)
+    for i in range(3):
+        buf.put("WebsiteMonitor", "IsSuccess", 1, "Count", {"URL": f"https://s{i}.example/"})
+    assert created == []        # cold start / put 都不建 client
+    assert buf.flush()["calls"] == 1 and buf.flush()["calls"] == 0
+    assert len(created) == 1 and len(created[0].datums("WebsiteMonitor")) == 3
+
+
+# --- target index -------------------------------------------------------------
+
+
+def _target(tid, url, updated="2026-01-01T00:00:00", active=True):
+    return {"targetId": tid, "url": url, "active": active, "itemType": item_type(tid),
+            "updatedAt": updated, "notes": "x" * 100}
+
+
+def test_target_index_full_scan_then_incremental_query():
+    table = FakeTable(indexes={"UpdatedAtIndex": ("itemType", "updatedAt")}, page_items=7)
+    for i in range(50):
+        table.put_item(Item=_target(f"t{i:03d}", f"https://s{i}.example/", active=i % 10 != 0))
+    now = [time.mktime(time.strptime("2026-01-01T00:10:00", "%Y-%m-%dT%H:%M:%S"))]
+    index = TargetIndex(table, total_segments=4, full_resync_seconds=3600, clock=lambda: now[0])
+
+    first = index.active_targets()
+    assert len(first) == 45
+    assert "notes" not in first[0]  # 只投影 crawler 需要的欄位
+    assert table.calls.count("scan") >= 4 and "query" not in table.calls
+
+    table.calls.clear()
+    table.put_item(Item=_target("t999", "https://new.example/", updated="2026-01-01T00:12:00"))
+    table.put_item(Item=_target("t001", "https://s1.example/", updated="2026-01-01T00:12:00", active=False))
+    now[0] += 300
+    second = index.active_targets()
+    assert "scan" not in table.calls
+    assert table.calls.count("query") == UPDATED_AT_SHARDS   # 每個 itemType shard 一次
+    urls = {t["url"] for t in second}
+    assert "https://new.example/" in urls and "https://s1.example/" not in urls
+    assert len(second) == 45
+
+
+def test_updated_at_index_key_spreads_targets_over_shards():
+    shards = Counter(item_type(f"t{i:04d}") for i in range(1000))
+    assert len(shards) == UPDATED_AT_SHARDS
+    assert max(shards.values()) < 2 * 1000 / UPDATED_AT_SHARDS
+    assert item_type("t0001") == item_type("t0001")
+    assert update_kwargs("t0001", {"notes": "x"})["ExpressionAttributeValues"][":target"] == item_type("t0001")
+
+
+def test_load_targets_falls_back_to_targets_file(monkeypatch, caplog):
+    def broken():
+        raise RuntimeError("no credentials")
+
+    monkeypatch.setattr(lambda_function, "TABLE_NAME", "CrawlerTargets")
+    monkeypatch.setattr(lambda_function, "_get_target_index", broken)
+    assert lambda_function.load_targets() == lambda_function.load_targets_file()
+    (record,) = [r for r in caplog.records if r.name == "lambda_function"]
+    assert record.levelname == "ERROR" and "no credentials" in record.exc_text
+
+
+# --- streamed / conditional probing ------------------------------------------
+
+BODY = b"<html>" + b"x" * 300_000 + b"</html>"
+
+
+class _SiteHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"   # keep-alive
+    requests = []
+
+    def do_HEAD(self):
+        self._respond(send_body=False)
+
+    def do_GET(self):
+        self._respond(send_body=True)
+
+    def _respond(self, send_body):
+        type(self).requests.append((self.command, self.path, self.headers.get("If-None-Match")))
+        if self.path == "/missing":
+            self.send_error(404)
+            return
+        if self.headers.get("If-None-Match") == '"v1"':
+            self.send_response(304)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("ETag", '"v1"')
+        self.send_header("Content-Length", str(len(BODY)))
+        self.end_headers()
+        if send_body:
+            self.wfile.write(BODY)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def site():
+    _SiteHandler.requests = []
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), _SiteHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+def test_probe_streams_body_and_uses_304_on_repeat(site, tmp_path):
+    cache = ValidatorCache(str(tmp_path / "validators.json"))
+    first = probe(site + "/", mode="conditional", cache=cache)
+    assert first["status"] == 200 and not first["not_modified"]
+    assert first["content_length"] == len(BODY) and first["sha256"] == hashlib.sha256(BODY).hexdigest()
+    cache.save()
+
+    second = probe(site + "/", mode="conditional", cache=ValidatorCache(str(tmp_path / "validators.json")))
+    assert second["status"] == 304 and second["not_modified"]
+    assert second["content_length"] == len(BODY) and second["sha256"] == first["sha256"]
+    assert first["simhash"] and second["simhash"] == first["simhash"]
+    assert _SiteHandler.requests[-1] == ("GET", "/", '"v1"')
+
+
+def test_validators_stored_on_the_target_survive_a_cold_start(site, tmp_path, monkeypatch):
+    table = FakeTable()
+    table.put_item(Item={"targetId": "t0", "url": site + "/"})
+    writer = TargetStateWriter(table)
+    clock = [0]
+    monkeypatch.setattr(lambda_function, "metrics", MetricBuffer(FakeCloudWatch()))
+    monkeypatch.setattr(lambda_function, "get_state_writer", lambda: writer)
+    monkeypatch.setattr(lambda_function, "load_target_items", lambda: [dict(i) for i in table.items.values()])
+
+    def cold_start(name):
+        # 新 container：沒有記憶體中的排程，/tmp 也是空的
+        monkeypatch.setattr(lambda_function, "scheduler", Scheduler(keep=crawl_state.OWNED_FIELDS,
+                                                                    clock=lambda: clock[0], rng=lambda: 0.0))
+        monkeypatch.setattr(lambda_function, "validator_cache", ValidatorCache(str(tmp_path / name)))
+        lambda_function.handler({}, None)
+        return _SiteHandler.requests[-1][2]
+
+    assert cold_start("a.json") is None
+    assert table.get_item(Key={"targetId": "t0"})["Item"]["httpValidators"] == {"etag": '"v1"', "size": len(BODY)}
+    clock[0] += 3600
+    assert cold_start("b.json") == '"v1"'           # 表裡的 validator：第一次探測就是 conditional GET
+    before, probes = table.calls.count("update_item"), len(_SiteHandler.requests)
+    clock[0] += 400                                  # 到期，但 heartbeat 還沒到
+    lambda_function.handler({}, None)
+    assert len(_SiteHandler.requests) == probes + 1 and _SiteHandler.requests[-1][2] == '"v1"'
+    assert table.calls.count("update_item") == before   # 304：validator 沒變，不寫
+
+
+def test_probe_head_mode_and_http_errors(site):
+    head = probe(site + "/", mode="head")
+    assert (head["status"], head["content_length"], head["sha256"]) == (200, len(BODY), None)
+    assert _SiteHandler.requests[-1][0] == "HEAD"
+    with pytest.raises(urllib.error.HTTPError):
+        probe(site + "/missing", mode="get")
+
+
+def test_pool_reuses_keep_alive_connections_and_reports_phases(site):
+    pool = HTTPPool()
+    first = probe(site + "/", mode="get", pool=pool)
+    second = probe(site + "/", mode="get", pool=pool)
+    assert pool.stats == {"created": 1, "reused": 1}
+    assert first["timings"]["reused"] is False and second["timings"]["reused"] is True
+    assert second["timings"]["connect"] == 0.0
+    assert set(first["timings"]) >= {"dns", "connect", "tls", "ttfb", "transfer"}
+
+
+# --- fan-out：dispatcher → 佇列 → worker ---
+
+
+def test_hash_ring_balances_and_is_stable():
+    ids = [f"t-{i}" for i in range(2000)]
+    sizes = [len(s) for s in crawl_dispatcher.partition([{"targetId": t, "url": t} for t in ids], 8)]
+    assert sum(sizes) == 2000
+    assert max(sizes) < 2 * min(sizes)
+    # 多一個 shard 時大部分目標不搬家
+    before, after = crawl_dispatcher.HashRing(8), crawl_dispatcher.HashRing(9)
+    moved = sum(1 for t in ids if before.shard_for(t) != after.shard_for(t))
+    assert moved < len(ids) * 0.25
+
+
+def _fan_out(monkeypatch, table, probe, clock):
+    """dispatcher + worker 以 InMemoryWorkQueue 串起來；回傳 (FakeCloudWatch, tick)，tick 跑一次 dispatcher 與所有 worker"""
+    cw = FakeCloudWatch()
+    writer = TargetStateWriter(table)
+    work, results = InMemoryWorkQueue(), InMemoryWorkQueue()
+    monkeypatch.setattr(lambda_function, "metrics", MetricBuffer(cw))
+    monkeypatch.setattr(lambda_function, "probe", probe)
+    monkeypatch.setattr(crawl_dispatcher, "metrics", MetricBuffer(cw))
+    monkeypatch.setattr(crawl_dispatcher, "get_state_writer", lambda: writer)
+    monkeypatch.setattr(crawl_dispatcher, "load_target_items", lambda: [dict(i) for i in table.items.values()])
+    monkeypatch.setattr(crawl_dispatcher, "scheduler", Scheduler(keep=crawl_state.OWNED_FIELDS, clock=lambda: clock[0]))
+    monkeypatch.setattr(crawl_dispatcher, "latency_history", LatencyHistory())
+    monkeypatch.setattr(crawl_dispatcher, "_queue", work)
+    monkeypatch.setattr(crawl_dispatcher, "_result_queue", results)
+    monkeypatch.setattr(crawl_worker, "_result_queue", results)
+    # worker 判斷 breaker 是否冷卻完畢也用同一個時鐘
+    monkeypatch.setattr(crawl_worker, "time", types.SimpleNamespace(time=lambda: clock[0]))
+
+    def tick(step):
+        clock[0] += step
+        dispatched = json.loads(crawl_dispatcher.handler({}, None)["body"])
+        shards = [s for event in work.drain_events() for s in crawl_worker.handler(event, None)["shards"]]
+        return dispatched, shards
+
+    return cw, tick
+
+
+def test_fan_out_probes_every_target_exactly_once(monkeypatch):
+    probed = Counter()
+
+    def fake_probe(url, **kwargs):
+        probed[url] += 1
+        return {"status": 200, "content_length": 1, "sha256": None, "not_modified": False, "timings": {}}
+
+    table = FakeTable()
+    targets = [{"targetId": f"t-{i}", "url": f"https://site{i}.example/"} for i in range(120)]
+    for t in targets:
+        table.put_item(Item=dict(t))
+    monkeypatch.setattr(crawl_dispatcher, "TARGETS_PER_SHARD", 20)
+    cw, tick = _fan_out(monkeypatch, table, fake_probe, [time.time()])
+
+    dispatched, shards = tick(0)
+    assert dispatched["targets"] == 120 and dispatched["messages"] == 6 and len(shards) == 6
+    assert probed == Counter(t["url"] for t in targets)
+    sites = sum(d["Value"] for d in cw.datums("WebsiteMonitorCrawler") if d["MetricName"] == "SitesChecked")
+    assert sites == 120
+
+    # 結果在下一個 tick 由 dispatcher 記錄、彙總並寫回；還沒到期的目標不會再被派送
+    dispatched, _ = tick(1)
+    assert dispatched["targets"] == 0
+    total = dispatched["applied"]
+    assert total["shards"] == 6 and total["checked"] == 120 and total["failed"] == 0
+    run_time = [d["Value"] for d in cw.datums("WebsiteMonitorCrawler") if d["MetricName"] == "RunTimeMs"]
+    assert run_time == [max(s["runTimeMs"] for s in shards)]
+    assert all(item["consecutiveFailures"] == 0 and "nextDueAt" in item for item in table.items.values())
+
+
+def test_fan_out_state_is_owned_by_the_dispatcher_across_ticks(monkeypatch):
+    table = FakeTable()
+    table.put_item(Item={"targetId": "t0", "url": "https://dead.example/"})
+
+    def dead(url, **kwargs):
+        raise urllib.error.URLError("connection refused")
+
+    clock = [time.time()]
+    _, tick = _fan_out(monkeypatch, table, dead, clock)
+    intervals = []
+    for failures in range(1, 4):
+        assert tick(3600)[0]["targets"] == 1       # 到期：派送給 worker
+        assert tick(1)[0]["targets"] == 0          # 下一個 tick 套用結果，依結果重新排程
+        item = table.get_item(Key={"targetId": "t0"})["Item"]
+        assert item["consecutiveFailures"] == failures
+        intervals.append(item["currentInterval"])
+    assert intervals[0] < intervals[1] < intervals[2]      # 連續失敗時間隔逐次拉長
+    target = crawl_dispatcher.scheduler.targets["t0"]
+    assert target["lastStatus"]["streak"] == 3 and target["nextDueAt"] > clock[0]
+
+
+def test_worker_reports_bad_messages_as_batch_item_failures(monkeypatch):
+    monkeypatch.setattr(lambda_function, "get_state_writer", lambda: None)
+    event = {"Records": [{"messageId": "m-1", "body": "not json"}]}
+    assert crawl_worker.handler(event, None)["batchItemFailures"] == [{"itemIdentifier": "m-1"}]
+
+
+# --- 內容變化偵測 ------------------------------------------------------------
+
+
+def _page(words, seed):
+    rng = random.Random(seed)
+    return b" ".join(rng.choice(words) for _ in range(5000))
+
+
+def test_fingerprint_is_streaming_and_tracks_amount_of_change():
+    words = [f"word{i}".encode() for i in range(2000)]
+    page = _page(words, 1)
+    hasher = SimHasher()
+    for i in range(0, len(page), 7):          # chunk 邊界切在 token 中間也一樣
+        hasher.update(page[i:i + 7])
+    assert hasher.hexdigest() == fingerprint(page) and len(fingerprint(page)) == 16
+
+    small_edit = page.replace(page[500:700], b"breaking news", 1)
+    assert change_ratio(fingerprint(page), fingerprint(page)) == 0
+    assert change_ratio(fingerprint(page), fingerprint(small_edit)) < 0.25
+    assert change_ratio(fingerprint(page), fingerprint(_page(words, 2))) > 0.6
+    assert fingerprint(b"") is None and change_ratio(None, fingerprint(page)) is None
+
+
+def test_handler_reports_content_change_and_stores_fingerprint(monkeypatch):
+    words = [f"word{i}".encode() for i in range(2000)]
+    pages = iter([_page(words, 1), _page(words, 1), _page(words, 2)])
+    cw, table = FakeCloudWatch(), FakeTable()
+    table.put_item(Item={"targetId": "t0", "url": "https://s0.example/"})
+    writer = TargetStateWriter(table)
+    monkeypatch.setattr(lambda_function, "metrics", MetricBuffer(cw))
+    monkeypatch.setattr(lambda_function, "scheduler", Scheduler(clock=lambda: clock[0]))
+    monkeypatch.setattr(lambda_function, "get_state_writer", lambda: writer)
+    monkeypatch.setattr(lambda_function, "load_target_items", lambda: [{"targetId": "t0", "url": "https://s0.example/"}])
+    monkeypatch.setattr(lambda_function, "probe", lambda url, **kwargs: {
+        "status": 200, "content_length": 1, "sha256": None, "simhash": fingerprint(next(pages)),
+        "not_modified": False, "timings": {}})
+    clock = [0]
+    ratios = []
+    for _ in range(3):
+        lambda_function.handler({}, None)
+        ratios.append([d["Value"] for d in cw.datums("WebsiteMonitor") if d["MetricName"] == "ContentChangeRatio"])
+        clock[0] += 3600                       # 下一次一定到期
+    assert ratios[0] == []                     # 第一次沒有可比較的指紋
+    assert ratios[1] == [0.0] and ratios[2][-1] > 0.6
+    assert table.get_item(Key={"targetId": "t0"})["Item"]["contentSimhash"] == fingerprint(_page(words, 2))
+
+
+def test_fan_out_compares_each_fingerprint_with_the_previous_probe(monkeypatch):
+    words = [f"word{i}".encode() for i in range(2000)]
+    pages = iter([_page(words, 1), _page(words, 1), _page(words, 2)])
+    table = FakeTable()
+    table.put_item(Item={"targetId": "t0", "url": "https://s0.example/"})
+    cw, tick = _fan_out(monkeypatch, table, lambda url, **kwargs: {
+        "status": 200, "content_length": 1, "sha256": None, "simhash": fingerprint(next(pages)),
+        "not_modified": False, "timings": {}}, [time.time()])
+    ratios, fingerprints = [], []
+    for _ in range(3):
+        tick(3600)
+        tick(1)                                # dispatcher 套用結果時比較指紋
+        ratios.append([d["Value"] for d in cw.datums("WebsiteMonitor") if d["MetricName"] == "ContentChangeRatio"])
+        fingerprints.append(crawl_dispatcher.scheduler.targets["t0"]["contentSimhash"])
+    assert ratios[0] == [] and ratios[1] == [0.0] and ratios[2][-1] > 0.6
+    assert fingerprints == [fingerprint(_page(words, 1))] * 2 + [fingerprint(_page(words, 2))]
+    assert table.get_item(Key={"targetId": "t0"})["Item"]["contentSimhash"] == fingerprints[-1]
+
+
+# --- 延遲異常分數 --------------------------------------------------------------
+
+
+@pytest.fixture(params=["numpy", "python"])
+def backend(request, monkeypatch):
+    if request.param == "numpy":
+        pytest.importorskip("numpy")
+        monkeypatch.setattr(latency_baseline, "NUMPY_MIN_TARGETS", 0)
+    else:
+        monkeypatch.setattr(numpy_loader, "_numpy", False)
+    return request.param
+
+
+def test_anomaly_score_is_relative_to_each_targets_own_history(backend):
+    history = LatencyHistory(window=16, capacity=2)   # capacity 2：第三個目標觸發擴充
+    for i in range(20):
+        jitter = 0.01 * (i % 3)
+        history.score(["fast", "slow"], [0.2 + jitter, 2.0 + 10 * jitter])
+    fast, slow, new = history.score(["fast", "slow", "new"], [0.8, 2.1, 5.0])
+    assert fast > 10            # 快的網站變成 0.8 秒是異常
+    assert slow < 1             # 平常就 2 秒的網站不算
+    assert new is None          # 沒有歷史不評分
+    assert len(history.samples("fast")) == 16 and history.samples("fast")[-1] == pytest.approx(0.8)
+
+    history.retain(["slow"])
+    assert "fast" not in history and len(history) == 1
+    history.seed("restored", decode_window(encode_window([0.5] * 40)))
+    assert len(history.samples("restored")) == 16
+    assert history.score(["restored"], [0.5]) == [0.0]
+
+
+def test_history_moves_to_numpy_only_when_the_batch_is_large():
+    pytest.importorskip("numpy")
+    rng = random.Random(3)
+    small, large = LatencyHistory(numpy_min_targets=4), LatencyHistory(numpy_min_targets=1000)
+    rounds = [[rng.uniform(0.1, 0.3) for _ in range(3)] for _ in range(40)]
+    for latencies in rounds:
+        assert small.score(["a", "b", "c"], latencies) == large.score(["a", "b", "c"], latencies)
+    small.retain(["a", "c"])
+    assert small._np is None    # 3 個目標：沒有 import numpy
+
+    ids, latencies = ["a", "c", "d", "e"], [0.9, 0.2, 0.2, 0.2]
+    before = {t: small.samples(t) for t in ids}
+    scores = small.score(ids, latencies)
+    assert small._np is not None    # 換成矩陣後分數、視窗都與純 Python 相同（float32 儲存）
+    assert scores == pytest.approx(large.score(ids, latencies), rel=1e-4)
+    assert all(small.samples(t) == pytest.approx(before[t][-31:] + [v], rel=1e-3) for t, v in zip(ids, latencies))
+
+
+def test_handler_publishes_anomaly_score_and_persists_window(monkeypatch):
+    cw, table = FakeCloudWatch(), FakeTable()
+    table.put_item(Item={"targetId": "t0", "url": "https://s0.example/",
+                         "latencyWindow": encode_window([0.1] * 10)})
+    writer = TargetStateWriter(table)
+    clock = [0]
+    monkeypatch.setattr(lambda_function, "metrics", MetricBuffer(cw))
+    monkeypatch.setattr(lambda_function, "latency_history", LatencyHistory())
+    monkeypatch.setattr(lambda_function, "scheduler", Scheduler(clock=lambda: clock[0]))
+    monkeypatch.setattr(lambda_function, "get_state_writer", lambda: writer)
+    monkeypatch.setattr(lambda_function, "load_target_items", lambda: [dict(i) for i in table.items.values()])
+
+    def slow_probe(url, **kwargs):
+        time.sleep(0.3)
+        return {"status": 200, "content_length": 1, "sha256": None, "not_modified": False, "timings": {}}
+
+    monkeypatch.setattr(lambda_function, "probe", slow_probe)
+    lambda_function.handler({}, None)
+    scores = [d["Value"] for d in cw.datums("WebsiteMonitor") if d["MetricName"] == "LatencyAnomalyScore"]
+    assert len(scores) == 1 and scores[0] > 4     # 表裡還原的歷史都是 0.1 秒
+    window = decode_window(table.get_item(Key={"targetId": "t0"})["Item"]["latencyWindow"])
+    assert len(window) == 11 and window[-1] == pytest.approx(0.3, abs=0.02)
+
+
+# --- circuit breaker / 負向 DNS 快取 -------------------------------------------
+
+
+def test_crawl_leaves_the_normal_timeout_to_check_website(monkeypatch):
+    calls = {}
+    monkeypatch.setattr(lambda_function, "check_website",
+                        lambda url, **kwargs: calls.setdefault(url, kwargs) and {"url": url, "success": True})
+    lambda_function.crawl(["https://a.example/", "https://b.example/"], None, trial={"https://b.example/"},
+                          validators={"https://a.example/": {"etag": '"v1"'}})
+    assert calls["https://a.example/"] == {"validators": {"etag": '"v1"'}}   # 沒有覆蓋 timeout
+    assert calls["https://b.example/"] == {"timeout": circuit_breaker.TRIAL_TIMEOUT, "validators": None}
+
+
+def test_breaker_opens_after_repeated_failures_and_fast_fails(monkeypatch):
+    cw, table = FakeCloudWatch(), FakeTable()
+    table.put_item(Item={"targetId": "t0", "url": "https://dead.example/"})
+    writer = TargetStateWriter(table)
+    clock = [0]
+    monkeypatch.setattr(lambda_function, "metrics", MetricBuffer(cw))
+    monkeypatch.setattr(lambda_function, "scheduler", Scheduler(clock=lambda: clock[0]))
+    monkeypatch.setattr(lambda_function, "get_state_writer", lambda: writer)
+    monkeypatch.setattr(lambda_function, "load_target_items", lambda: [{"targetId": "t0", "url": "https://dead.example/"}])
+    timeouts = []
+    up = [False]
+
+    def fake_probe(url, timeout, **kwargs):
+        timeouts.append(timeout)
+        if not up[0]:
+            raise socket.gaierror(socket.EAI_NONAME, "Name or service not known")
+        return {"status": 200, "content_length": 1, "sha256": None, "not_modified": False, "timings": {}}
+
+    monkeypatch.setattr(lambda_function, "probe", fake_probe)
+
+    def tick():
+        clock[0] += 3600
+        lambda_function.handler({}, None)
+        return table.get_item(Key={"targetId": "t0"})["Item"]
+
+    for _ in range(circuit_breaker.BREAKER_FAILURE_THRESHOLD):
+        item = tick()
+    assert item["breakerState"] == "open" and len(timeouts) == circuit_breaker.BREAKER_FAILURE_THRESHOLD
+    until = item["breakerUntil"]
+
+    clock[0] = until - 3600 - 1            # 冷卻中：不探測，但照樣送 IsSuccess=0
+    before = len(cw.datums("WebsiteMonitor"))
+    tick()
+    assert len(timeouts) == circuit_breaker.BREAKER_FAILURE_THRESHOLD
+    assert [d["MetricName"] for d in cw.datums("WebsiteMonitor")[before:]] == ["IsSuccess"]
+    assert cw.datums("WebsiteMonitor")[-1]["Value"] == 0
+
+    item = tick()                          # 冷卻結束：短 timeout 試探，失敗則冷卻加倍
+    assert timeouts[-1] == circuit_breaker.TRIAL_TIMEOUT
+    assert item["breakerCooldown"] == 2 * circuit_breaker.BREAKER_COOLDOWN_SECONDS
+
+    up[0] = True
+    clock[0] = item["breakerUntil"] - 3600
+    item = tick()
+    assert item["breakerState"] == "closed" and item["consecutiveFailures"] == 0
+
+
+def test_fan_out_breaker_opens_and_dispatcher_sends_it_to_workers(monkeypatch):
+    table = FakeTable()
+    table.put_item(Item={"targetId": "t0", "url": "https://dead.example/"})
+    probed = []
+
+    def dead(url, timeout, **kwargs):
+        probed.append(timeout)
+        raise socket.gaierror(socket.EAI_NONAME, "Name or service not known")
+
+    cw, tick = _fan_out(monkeypatch, table, dead, [time.time()])
+    for _ in range(circuit_breaker.BREAKER_FAILURE_THRESHOLD):
+        tick(3600)
+        tick(1)
+    item = table.get_item(Key={"targetId": "t0"})["Item"]
+    assert item["breakerState"] == "open" and item["consecutiveFailures"] == circuit_breaker.BREAKER_FAILURE_THRESHOLD
+    assert len(probed) == circuit_breaker.BREAKER_FAILURE_THRESHOLD
+
+    # 冷卻期間（BREAKER_COOLDOWN_SECONDS）再次到期：派送時帶著 open 的 breaker，worker 不連網路，直接記為失敗
+    before = len(cw.datums("WebsiteMonitor"))
+    dispatched, shards = tick(600)
+    assert dispatched["targets"] == 1 and shards[0]["shortCircuited"] == 1
+    assert len(probed) == circuit_breaker.BREAKER_FAILURE_THRESHOLD
+    assert [d["MetricName"] for d in cw.datums("WebsiteMonitor")[before:]] == ["IsSuccess"]
+    tick(1)
+    target = crawl_dispatcher.scheduler.targets["t0"]
+    assert target["breakerState"] == "open"
+    assert target["consecutiveFailures"] == circuit_breaker.BREAKER_FAILURE_THRESHOLD + 1
+
+
+def test_breaker_state_is_per_url_and_most_permissive_wins():
+    now = 1000
+    targets = [{"targetId": "a", "url": "u1", "breakerState": "open", "breakerUntil": 2000},
+               {"targetId": "b", "url": "u1"},
+               {"targetId": "c", "url": "u2", "breakerState": "open", "breakerUntil": 2000},
+               {"targetId": "d", "url": "u3", "breakerState": "open", "breakerUntil": 500}]
+    assert circuit_breaker.url_states(targets, now) == {"u1": "closed", "u2": "open", "u3": "half_open"}
+    # open 中但因同 URL 的其他目標而真的探測到：成功就關閉，失敗維持原狀
+    assert circuit_breaker.transition(targets[0], True, 0, now)["breakerState"] == "closed"
+    assert circuit_breaker.transition(targets[0], False, 9, now) == {}
+
+
+def test_resolver_caches_negative_answers_but_not_temporary_failures():
+    calls = []
+
+    def resolve(host, port):
+        calls.append(host)
+        if host == "flaky.example":
+            raise socket.gaierror(socket.EAI_AGAIN, "Temporary failure in name resolution")
+        if host == "gone.example":
+            raise socket.gaierror(socket.EAI_NONAME, "Name or service not known")
+        return [("addr", host)]
+
+    resolver = CachingResolver(resolve=resolve)
+    for _ in range(3):
+        assert resolver("ok.example", 443) == [("addr", "ok.example")]
+        with pytest.raises(socket.gaierror):
+            resolver("gone.example", 443)
+        with pytest.raises(socket.gaierror):
+            resolver("flaky.example", 443)
+    assert calls.count("ok.example") == 1 and calls.count("gone.example") == 1
+    assert calls.count("flaky.example") == 3
+
+
+# --- 最新狀態（lastStatus）-----------------------------------------------------
+
+
+def test_latest_status_is_written_only_on_change_or_heartbeat(monkeypatch):
+    table = FakeTable()
+    for i in range(2):
+        table.put_item(Item={"targetId": f"t{i}", "url": f"https://s{i}.example/"})
+    writer = TargetStateWriter(table)
+    clock = [0]
+    monkeypatch.setattr(lambda_function, "metrics", MetricBuffer(FakeCloudWatch()))
+    monkeypatch.setattr(lambda_function, "scheduler", Scheduler(clock=lambda: clock[0]))
+    monkeypatch.setattr(lambda_function, "get_state_writer", lambda: writer)
+    monkeypatch.setattr(lambda_function, "load_target_items",
+                        lambda: [{"targetId": f"t{i}", "url": f"https://s{i}.example/"} for i in range(2)])
+    codes = {"https://s0.example/": 200, "https://s1.example/": 200}
+    monkeypatch.setattr(lambda_function, "probe", lambda url, **kwargs: {
+        "status": codes[url], "content_length": 1, "sha256": None, "not_modified": False, "timings": {}})
+
+    def tick():
+        before = table.calls.count("update_item")
+        clock[0] += 400
+        lambda_function.handler({}, None)
+        return table.calls.count("update_item") - before
+
+    assert tick() == 2                         # 第一次：兩個都寫
+    assert tick() == 0 and tick() == 0         # 狀態沒變：不寫
+    codes["https://s1.example/"] = 503
+    assert tick() == 1                         # 只寫改變的那個
+    status = table.get_item(Key={"targetId": "t1"})["Item"]["lastStatus"]
+    assert status["success"] is False and status["status"] == 503 and status["streak"] == 1
+    assert table.get_item(Key={"targetId": "t0"})["Item"]["lastStatus"]["streak"] == 1
+
+    clock[0] += target_status.STATUS_HEARTBEAT_SECONDS
+    assert tick() == 2                         # heartbeat
+    item = table.get_item(Key={"targetId": "t0"})["Item"]
+    assert item["lastStatus"]["streak"] == 5 and item["lastStatus"]["since"] <= item["lastStatus"]["checkedAt"]
+
+    # GET /targets/{id} 直接帶回 lastStatus
+    monkeypatch.setattr(get_target, "table", table)
+    resp = get_target.handler({"pathParameters": {"targetId": "t1"}}, None)
+    assert json.loads(resp["body"])["item"]["lastStatus"]["status"] == 503
+
+
+
+def test_conditional_304_is_not_a_status_change(monkeypatch):
+    table = FakeTable()
+    table.put_item(Item={"targetId": "t0", "url": "https://s0.example/"})
+    writer = TargetStateWriter(table)
+    clock = [0]
+    monkeypatch.setattr(lambda_function, "metrics", MetricBuffer(FakeCloudWatch()))
+    monkeypatch.setattr(lambda_function, "scheduler", Scheduler(clock=lambda: clock[0]))
+    monkeypatch.setattr(lambda_function, "get_state_writer", lambda: writer)
+    monkeypatch.setattr(lambda_function, "load_target_items", lambda: [{"targetId": "t0", "url": "https://s0.example/"}])
+    codes = [200]
+    monkeypatch.setattr(lambda_function, "probe", lambda url, **kwargs: {
+        "status": codes[0], "content_length": 1, "sha256": None, "not_modified": codes[0] == 304, "timings": {}})
+
+    def tick(code):
+        codes[0] = code
+        before = table.calls.count("update_item")
+        clock[0] += 400
+        lambda_function.handler({}, None)
+        return table.calls.count("update_item") - before
+
+    assert tick(200) == 1
+    assert [tick(304), tick(200), tick(304)] == [0, 0, 0]      # 200 ↔ 304：沒變，不寫
+    status = lambda_function.scheduler.targets["t0"]["lastStatus"]
+    assert status["status"] == 200 and status["streak"] == 4 and status["since"] == table.get_item(
+        Key={"targetId": "t0"})["Item"]["lastStatus"]["since"]
+    assert tick(503) == 1
+
+def test_fan_out_latest_status_keeps_streak_and_writes_only_on_change(monkeypatch):
+    table = FakeTable()
+    for i in range(2):
+        table.put_item(Item={"targetId": f"t{i}", "url": f"https://s{i}.example/"})
+    codes = {"https://s0.example/": 200, "https://s1.example/": 200}
+    _, tick = _fan_out(monkeypatch, table, lambda url, **kwargs: {
+        "status": codes[url], "content_length": 1, "sha256": None, "not_modified": False, "timings": {}}, [time.time()])
+
+    def cycle():
+        before = table.calls.count("update_item")
+        assert tick(400)[0]["targets"] == 2
+        tick(1)
+        return table.calls.count("update_item") - before
+
+    assert cycle() == 2                        # 第一次：兩個都寫
+    assert cycle() == 0 and cycle() == 0       # 狀態沒變、heartbeat 未到：不寫
+    codes["https://s1.example/"] = 503
+    assert cycle() == 1                        # 只寫改變的那個
+    first = table.get_item(Key={"targetId": "t0"})["Item"]["lastStatus"]
+    status = crawl_dispatcher.scheduler.targets["t0"]["lastStatus"]
+    assert status["streak"] == 4 and status["since"] == first["since"]      # 記憶體中的版本：連續次數與起始時間延續
+    assert table.get_item(Key={"targetId": "t1"})["Item"]["lastStatus"]["streak"] == 1
+
+
+def test_dispatcher_messages_carry_only_breaker_state_and_validators_as_plain_json():
+    t = {"targetId": "a", "url": "u", "consecutiveFailures": Decimal(2), "breakerState": "open",
+         "breakerUntil": Decimal(1700000900), "lastStatus": {"success": False, "status": Decimal(503)},
+         "httpValidators": {"etag": '"v1"', "size": Decimal(12)}}
+    out = json.loads(json.dumps(crawl_dispatcher._message_target(t)))
+    assert out == {"targetId": "a", "url": "u", "breakerState": "open", "breakerUntil": 1700000900,
+                   "httpValidators": {"etag": '"v1"', "size": 12}}
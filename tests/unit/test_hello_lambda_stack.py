@@ -1,15 +1,227 @@
+import pathlib
+
 import aws_cdk as core
 import aws_cdk.assertions as assertions
+import pytest
 
+from hello_lambda import bundles
+from hello_lambda.api_gateway_stack import ApiGatewayStack
+from hello_lambda.dynamodb_stack import DynamoDBStack
 from hello_lambda.hello_lambda_stack import HelloLambdaStack
 
-# example tests. To run these tests, uncomment this file along with the example
-# resource in hello_lambda/hello_lambda_stack.py
+def test_api_router_mode_uses_one_function():
+    app = core.App()
+    ddb = DynamoDBStack(app, "crawler-dynamodb")
+    template = assertions.Template.from_stack(ApiGatewayStack(app, "crawler-api", table=ddb.table, router=True))
+    template.resource_count_is("AWS::Lambda::Function", 1)
+    template.has_resource_properties("AWS::Lambda::Function", {"Handler": "targets_router.handler"})
+    template.resource_count_is("AWS::ApiGateway::Method", 8)
+
+
 def test_sqs_queue_created():
     app = core.App()
-    stack = HelloLambdaStack(app, "hello-lambda")
+    ddb = DynamoDBStack(app, "crawler-dynamodb")
+    stack = HelloLambdaStack(app, "hello-lambda", table=ddb.table, fan_out=True)
     template = assertions.Template.from_stack(stack)
 
-#     template.has_resource_properties("AWS::SQS::Queue", {
-#         "VisibilityTimeout": 300
-#     })
+    template.has_resource_properties("AWS::SQS::Queue", {
+        "VisibilityTimeout": 360
+    })
+    template.has_resource_properties("AWS::Lambda::EventSourceMapping", {
+        "BatchSize": 1,
+        "FunctionResponseTypes": ["ReportBatchItemFailures"],
+    })
+    template.has_resource_properties("AWS::SQS::Queue", {"VisibilityTimeout": 90})   # worker → dispatcher 結果
+    for handler in ("crawl_dispatcher.handler", "crawl_worker.handler"):
+        template.has_resource_properties("AWS::Lambda::Function", {
+            "Handler": handler,
+            "Environment": {"Variables": assertions.Match.object_like({"RESULT_QUEUE_URL": assertions.Match.any_value()})},
+        })
+
+
+def test_fan_out_deploys_and_alarms_on_dispatcher_and_worker():
+    app = core.App()
+    ddb = DynamoDBStack(app, "crawler-dynamodb")
+    template = assertions.Template.from_stack(HelloLambdaStack(app, "hello-lambda", table=ddb.table, fan_out=True))
+    functions = template.find_resources("AWS::Lambda::Function")
+    assert not any(r["Properties"].get("Handler") == "lambda_function.handler" for r in functions.values())
+    template.resource_count_is("AWS::Lambda::Alias", 2)
+    template.resource_count_is("AWS::CodeDeploy::DeploymentGroup", 2)
+    mappings = template.find_resources("AWS::Lambda::EventSourceMapping")
+    assert [rid.startswith("CrawlWorkerAlias") for rid in mappings] == [True]   # SQS 觸發 worker 的 ProdAlias
+    template.has_resource_properties("AWS::CloudWatch::Alarm", {"MetricName": "RunTimeMs"})
+
+
+
+@pytest.mark.parametrize("fan_out", [False, True])
+def test_only_one_container_owns_the_schedule(fan_out):
+    app = core.App()
+    ddb = DynamoDBStack(app, "crawler-dynamodb")
+    template = assertions.Template.from_stack(HelloLambdaStack(app, "hello-lambda", table=ddb.table, fan_out=fan_out))
+    owner = "crawl_dispatcher.handler" if fan_out else "lambda_function.handler"
+    functions = {r["Properties"].get("Handler"): r["Properties"]
+                 for r in template.find_resources("AWS::Lambda::Function").values()}
+    assert functions[owner]["ReservedConcurrentExecutions"] == 1
+    if fan_out:
+        assert "ReservedConcurrentExecutions" not in functions["crawl_worker.handler"]
+    configs = sorted(str(r["Properties"]["DeploymentConfigName"])
+                     for r in template.find_resources("AWS::CodeDeploy::DeploymentGroup").values())
+    # 狀態 owner 一次切換；無狀態的 worker 照樣 canary
+    assert configs == (["CodeDeployDefault.LambdaAllAtOnce", "CodeDeployDefault.LambdaCanary10Percent5Minutes"]
+                       if fan_out else ["CodeDeployDefault.LambdaAllAtOnce"])
+    template.has_resource_properties("AWS::Lambda::EventInvokeConfig", {"MaximumEventAgeInSeconds": 60})
+
+def test_crawler_ticks_every_minute():
+    app = core.App()
+    ddb = DynamoDBStack(app, "crawler-dynamodb")
+    template = assertions.Template.from_stack(HelloLambdaStack(app, "hello-lambda", table=ddb.table))
+    template.has_resource_properties("AWS::Events::Rule", {"ScheduleExpression": "rate(1 minute)"})
+
+
+def test_latency_alarms_use_anomaly_score():
+    app = core.App()
+    ddb = DynamoDBStack(app, "crawler-dynamodb")
+    template = assertions.Template.from_stack(HelloLambdaStack(app, "hello-lambda", table=ddb.table))
+    template.has_resource_properties("AWS::CloudWatch::Alarm", {"MetricName": "LatencyAnomalyScore", "DatapointsToAlarm": 2})
+    assert not template.find_resources("AWS::CloudWatch::Alarm", {"Properties": {"MetricName": "Latency"}})
+
+
+def test_runtime_alarm_mode_has_no_per_url_resources():
+    app = core.App()
+    ddb = DynamoDBStack(app, "crawler-dynamodb")
+    stack = HelloLambdaStack(app, "hello-lambda", table=ddb.table, alarm_mode="runtime")
+    template = assertions.Template.from_stack(stack)
+    alarms = template.find_resources("AWS::CloudWatch::Alarm")
+    assert not [a for a in alarms.values()
+                if any(d["Name"] == "URL" for d in a["Properties"].get("Dimensions", []))]
+    template.has_resource_properties("AWS::CloudWatch::Alarm", {"Metrics": assertions.Match.array_with([
+        assertions.Match.object_like({"Expression": "SELECT AVG(IsSuccess) FROM SCHEMA(WebsiteMonitor, URL)"})])})
+    template.has_resource_properties("AWS::Lambda::Function", {"Handler": "target_alarms.handler"})
+    template.has_resource_properties("AWS::Lambda::EventSourceMapping", {"StartingPosition": "LATEST"})
+
+
+def test_single_function_mode_has_no_crawl_queue():
+    app = core.App()
+    ddb = DynamoDBStack(app, "crawler-dynamodb")
+    template = assertions.Template.from_stack(HelloLambdaStack(app, "hello-lambda", table=ddb.table))
+    # 唯一的 queue 是 alarm logger 的 DLQ
+    template.resource_count_is("AWS::SQS::Queue", 1)
+    template.has_resource_properties("AWS::Lambda::Function", {
+        "Handler": "alarm_logger.handler",
+        "DeadLetterConfig": {"TargetArn": assertions.Match.any_value()},
+    })
+    template.has_resource_properties("AWS::Lambda::EventInvokeConfig", {"MaximumRetryAttempts": 2})
+
+
+def test_targets_table_indexes():
+    app = core.App()
+    template = assertions.Template.from_stack(DynamoDBStack(app, "crawler-dynamodb"))
+    template.has_resource_properties("AWS::DynamoDB::Table", {
+        "GlobalSecondaryIndexes": assertions.Match.array_with([
+            assertions.Match.object_like({
+                "IndexName": "UpdatedAtIndex",
+                "KeySchema": [
+                    {"AttributeName": "itemType", "KeyType": "HASH"},
+                    {"AttributeName": "updatedAt", "KeyType": "RANGE"},
+                ],
+            }),
+            assertions.Match.object_like({
+                "IndexName": "ActiveIndex",
+                "KeySchema": [
+                    {"AttributeName": "activeStatus", "KeyType": "HASH"},
+                    {"AttributeName": "createdAt", "KeyType": "RANGE"},
+                ],
+            }),
+        ]),
+    })
+
+
+def test_active_index_can_be_staged_for_existing_tables():
+    app = core.App()
+    template = assertions.Template.from_stack(DynamoDBStack(app, "crawler-dynamodb", active_index=False))
+    (table,) = template.find_resources("AWS::DynamoDB::Table").values()
+    assert [g["IndexName"] for g in table["Properties"]["GlobalSecondaryIndexes"]] == ["UpdatedAtIndex"]
+
+
+def test_api_has_batch_routes():
+    app = core.App()
+    ddb = DynamoDBStack(app, "crawler-dynamodb")
+    template = assertions.Template.from_stack(ApiGatewayStack(app, "crawler-api", table=ddb.table))
+    template.has_resource_properties("AWS::ApiGateway::Resource", {"PathPart": "targets:batch"})
+    for method in ["POST", "PUT", "DELETE"]:
+        template.has_resource_properties("AWS::ApiGateway::Method", {
+            "HttpMethod": method,
+            "ResourceId": {"Ref": assertions.Match.string_like_regexp("CrawlerTargetsApitargetsbatch")},
+        })
+
+
+def test_api_compresses_and_optionally_caches_gets():
+    app = core.App()
+    ddb = DynamoDBStack(app, "crawler-dynamodb")
+    plain = assertions.Template.from_stack(ApiGatewayStack(app, "crawler-api", table=ddb.table))
+    plain.has_resource_properties("AWS::ApiGateway::RestApi", {"MinimumCompressionSize": 1024})
+    plain.has_resource_properties("AWS::ApiGateway::Stage", {"CacheClusterEnabled": assertions.Match.absent()})
+
+    app = core.App()
+    ddb = DynamoDBStack(app, "crawler-dynamodb")
+    template = assertions.Template.from_stack(ApiGatewayStack(
+        app, "crawler-api-cached", table=ddb.table, router=True, cache_ttls={"/targets": 30, "/targets/{targetId}": 60}))
+    template.has_resource_properties("AWS::ApiGateway::Stage", {
+        "CacheClusterEnabled": True,
+        "MethodSettings": assertions.Match.array_with([
+            assertions.Match.object_like({"ResourcePath": "/~1targets~1{targetId}", "HttpMethod": "GET",
+                                          "CachingEnabled": True, "CacheTtlInSeconds": 60}),
+        ]),
+    })
+    template.has_resource_properties("AWS::ApiGateway::Method", {
+        "HttpMethod": "GET",
+        "RequestParameters": {"method.request.path.targetId": True, "method.request.header.If-None-Match": False},
+        "Integration": assertions.Match.object_like({"CacheKeyParameters": assertions.Match.array_with(
+            ["method.request.header.If-None-Match"])}),
+    })
+    template.has_resource_properties("AWS::Lambda::Function", {
+        "Environment": {"Variables": assertions.Match.object_like({"API_CACHE_STAGE": "prod"})}})
+
+
+def test_each_function_ships_only_its_own_modules():
+    assert bundles.bundle_files("hello_lambda/lambda", "get_target") == ["etag.py", "get_target.py", "target_items.py"]
+    assert "targets.json" in bundles.bundle_files("hello_lambda/lambda", "crawl_worker")
+    assert "targets.json" not in bundles.bundle_files("hello_lambda/lambda", "targets_router")
+
+    app = core.App()
+    ddb = DynamoDBStack(app, "crawler-dynamodb")
+    api = ApiGatewayStack(app, "crawler-api", table=ddb.table)
+    functions = assertions.Template.from_stack(api).find_resources("AWS::Lambda::Function")
+    keys = {rid: r["Properties"]["Code"]["S3Key"] for rid, r in functions.items()}
+    assert len(set(keys.values())) == len(keys) == 6
+    get_key = next(k for rid, k in keys.items() if rid.startswith("GetTargetFn"))
+    asset_dir = pathlib.Path(app.synth().directory) / f"asset.{get_key[:-len('.zip')]}"
+    assert sorted(p.name for p in asset_dir.iterdir()) == ["etag.py", "get_target.py", "target_items.py"]
+
+
+def test_architecture_and_memory_are_configurable_per_function():
+    config = {"default": {"architecture": "arm64"}, "CrawlWorkerFunction": {"architecture": "x86_64", "memory": 1024}}
+    assert bundles.function_settings(config, "CrawlWorkerFunction", 256) == ("x86_64", 1024)
+    assert bundles.function_settings(config, "ExportFunction", 512) == ("arm64", 512)
+    assert bundles.function_settings(None, "GetTargetFn") == ("x86_64", None)
+    with pytest.raises(ValueError):
+        bundles.function_settings({"default": {"architecture": "arm"}}, "GetTargetFn")
+
+    app = core.App()
+    ddb = DynamoDBStack(app, "crawler-dynamodb")
+    stack = HelloLambdaStack(app, "hello-lambda", table=ddb.table, fan_out=True, function_config=config)
+    template = assertions.Template.from_stack(stack)
+    template.has_resource_properties("AWS::Lambda::Function", {
+        "Handler": "crawl_worker.handler", "Architectures": ["x86_64"], "MemorySize": 1024})
+    template.has_resource_properties("AWS::Lambda::Function", {
+        "Handler": "crawl_dispatcher.handler", "Architectures": ["arm64"], "MemorySize": 256})
+    template.has_resource_properties("AWS::Lambda::LayerVersion", {"CompatibleArchitectures": ["x86_64", "arm64"]})
+
+    rows = bundles.report(stack, measure=False)
+    worker = next(r for r in rows if r["handler"] == "crawl_worker")
+    assert worker["architecture"] == "x86_64" and worker["memory"] == 1024 and worker["bytes"] > 0
+
+
+def test_bundle_imports_on_its_own():
+    # bundle 漏了模組時子行程的 import 會失敗（CalledProcessError）
+    assert bundles.import_ms("hello_lambda/lambda", "get_target", repeat=1) > 0
@@ -0,0 +1,97 @@
+import json
+
+import pytest
+
+import get_target
+import instrumentation
+import targets_router
+from instrumentation import Histogram, elapsed_ms, instrumented, observe, phase
+
+from tests.fakes import FakeTable
+
+
+@pytest.fixture
+def lines(monkeypatch):
+    out = []
+    monkeypatch.setattr(instrumentation, "write", out.append)
+    return out
+
+
+def _emf(lines):
+    return [json.loads(line) for text in lines for line in text.splitlines() if line.startswith('{"_aws"')]
+
+
+def test_api_handler_gets_server_timing_and_one_emf_line(lines):
+    @instrumented("demo")
+    def handler(event, context):
+        with phase("dynamo"):
+            with phase("page"):
+                pass
+            with phase("page"):
+                pass
+        with phase("serialize"):
+            pass
+        observe("item", 3.0)
+        return {"statusCode": 200, "body": json.dumps({"dynamoLatencyMs": elapsed_ms("dynamo")})}
+
+    resp = handler({"httpMethod": "GET"}, None)
+    names = [entry.split(";")[0] for entry in resp["headers"]["Server-Timing"].split(", ")]
+    assert names == ["init", "dynamo.page", "dynamo", "serialize", "total"]
+    assert json.loads(resp["body"])["dynamoLatencyMs"] >= 0
+    (doc,) = _emf(lines)
+    assert doc["Handler"] == "demo" and doc["item"] == [Histogram.representative(6)]
+    assert len(doc["dynamo.page"]) == 2                 # 直方圖每次進入一筆；Server-Timing 是累計
+    assert {m["Name"] for m in doc["_aws"]["CloudWatchMetrics"][0]["Metrics"]} >= {"total", "init", "dynamo"}
+
+    resp = handler({}, None)                            # 非 API 事件：不加 header；warm 時沒有 init
+    assert "headers" not in resp
+    assert "init" not in _emf(lines)[-1]
+
+
+def test_nested_handlers_report_as_phases_of_the_outer_one(lines, monkeypatch):
+    table = FakeTable()
+    table.put_item(Item={"targetId": "t1", "url": "https://a.example/"})
+    monkeypatch.setattr(get_target, "table", table)
+    targets_router.cache.clear()
+    resp = targets_router.handler({"httpMethod": "GET", "resource": "/targets/{targetId}",
+                                   "pathParameters": {"targetId": "t1"}}, None)
+    assert resp["headers"]["X-Cache"] == "MISS"
+    timing = resp["headers"]["Server-Timing"]
+    assert "get_target.dynamo;dur=" in timing and "get_target;dur=" in timing
+    assert [d["Handler"] for d in _emf(lines)] == ["targets_router"]
+
+
+def test_histogram_buckets_and_percentiles():
+    hist = Histogram()
+    for v in [1.0] * 90 + [100.0] * 10:
+        hist.add(v)
+    hist.add(0)
+    assert hist.percentile(50) == pytest.approx(1.0, rel=0.1)
+    assert hist.percentile(99) == pytest.approx(100.0, rel=0.1)
+    assert hist.values()[0] == (0.0, 1)
+    assert len(hist.values()) == 3
+
+
+def test_emf_documents_respect_value_limits():
+    trace = instrumentation.Trace("demo")
+    for i in range(250):
+        trace.observe("probe", 1.0 + i)
+    docs = list(trace.emf_documents(0))
+    assert [len(d["probe"]) for d in docs] == [100, 100, 50]
+
+
+def test_sampled_profiler_writes_hotspots(lines, monkeypatch):
+    monkeypatch.setattr(instrumentation, "PROFILE_SAMPLE_RATE", 1)
+    monkeypatch.setattr(instrumentation, "PROFILE_MEMORY", True)
+    monkeypatch.setattr(instrumentation, "EMF_ENABLED", False)
+
+    def busy():
+        return sum(i * i for i in range(20000))
+
+    @instrumented("demo")
+    def handler(event, context):
+        return busy()
+
+    handler({}, None)
+    (report,) = lines
+    assert "Profile of demo" in report and "busy" in report and "Memory of demo" in report
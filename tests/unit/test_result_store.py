@@ -0,0 +1,136 @@
+import os
+import time
+
+import pytest
+
+import lambda_function
+import numpy_loader
+import result_store
+from metrics_buffer import MetricBuffer
+from result_store import LocalResultStore, ResultBatch, S3ResultStore, sla_report
+from schedule import Scheduler
+
+from tests.fakes import FakeCloudWatch
+
+T0 = 1_790_000_000 - 1_790_000_000 % 3600     # 整點
+
+
+def _results(ts, fail_every=4):
+    out = []
+    for i in range(6):
+        ok = i % fail_every != 0
+        out.append({"url": f"https://s{i}.example/", "ts": ts, "status": 200 if ok else 503, "latency": 0.1 * (i + 1),
+                    "content_length": 1000 * i, "success": ok, "not_modified": i == 5,
+                    "timings": {"dns": 0.001, "ttfb": 0.05 * (i + 1)}})
+    out.append({"url": "https://slow.example/", "status": None, "latency": None, "content_length": 0,
+                "success": False, "skipped": True})
+    return out
+
+
+@pytest.fixture(params=["numpy", "python"])
+def backend(request, monkeypatch):
+    if request.param == "numpy":
+        pytest.importorskip("numpy")
+    else:
+        monkeypatch.setattr(numpy_loader, "_numpy", False)
+    return request.param
+
+
+def test_batches_are_partitioned_by_hour_and_memory_mapped(tmp_path, backend):
+    store = LocalResultStore(str(tmp_path))
+    key = store.append(_results(T0 + 10), "run-1", ts=T0 + 10)
+    assert key.startswith("results/dt=") and "/hour=" in key and key.endswith("/run-1.prc")
+    assert store.append([], "empty", ts=T0) is None
+
+    with ResultBatch(os.path.join(str(tmp_path), key)) as batch:
+        assert batch.rows == 7
+        assert list(batch.column("status")) == [503, 200, 200, 200, 503, 200, 0]
+        assert list(batch.column("size"))[:3] == [0, 1000, 2000]
+        assert batch.column("latencyMs")[2] == pytest.approx(300)
+        assert batch.column("ttfbMs")[1] == pytest.approx(100)
+        assert list(batch.column("flags")) == [0, 1, 1, 1, 0, 3, 4]
+        assert batch.column("ts")[6] == T0 + 10              # skipped：沿用 run 的時間
+        assert batch.urls[result_store.url_id("https://s3.example/")] == "https://s3.example/"
+
+
+def test_sla_report_aggregates_range_across_partitions(tmp_path, backend):
+    store = LocalResultStore(str(tmp_path))
+    for hour in range(30):
+        ts = T0 + hour * 3600
+        store.append(_results(ts), f"run-{hour}", ts=ts)
+
+    report = sla_report(store, T0, T0 + 24 * 3600)
+    assert report["files"] == 24 and report["probes"] == 24 * 6     # skipped 不計
+    by_url = {row["url"]: row for row in report["targets"]}
+    assert "https://slow.example/" not in by_url
+    assert by_url["https://s0.example/"]["availability"] == 0
+    assert by_url["https://s0.example/"]["p50LatencyMs"] is None
+    s2 = by_url["https://s2.example/"]
+    assert (s2["probes"], s2["successes"], s2["p50LatencyMs"], s2["p95LatencyMs"]) == (24, 24, 300.0, 300.0)
+    assert s2["avgTtfbMs"] == pytest.approx(150.0)
+    assert report["availability"] == pytest.approx(4 / 6, abs=1e-4)
+    assert report["targets"][0]["url"] in ("https://s0.example/", "https://s4.example/")   # 最差的排前面
+
+
+def test_batch_is_partitioned_by_its_earliest_row_and_found_from_the_next_hour(tmp_path, backend):
+    store = LocalResultStore(str(tmp_path))
+    rows = _results(T0 + 3600 - 30)
+    for i, r in enumerate(rows[:6]):
+        r["ts"] += 10 * i        # 最後幾列已經是下一個小時
+    key = store.append(rows, "run-late", ts=T0 + 3600 + 40)   # 寫入時已經跨過整點
+    assert key == store.key(T0, "run-late")
+
+    late = sla_report(store, T0 + 3600, T0 + 7200)
+    assert late["files"] == 1 and late["probes"] == 3
+    early = sla_report(store, T0, T0 + 3600)
+    assert early["probes"] == 3
+    with pytest.raises(TypeError):
+        result_store.ResultStore()
+
+
+class _FakeS3:
+    def __init__(self):
+        self.objects, self.downloads = {}, 0
+
+    def put_object(self, Bucket, Key, Body, **kwargs):
+        self.objects[Key] = Body
+
+    def get_paginator(self, operation):
+        objects = self.objects
+
+        class _Paginator:
+            def paginate(self, Bucket, Prefix):
+                yield {"Contents": [{"Key": k, "Size": len(v)} for k, v in sorted(objects.items()) if k.startswith(Prefix)]}
+
+        return _Paginator()
+
+    def download_file(self, bucket, key, path):
+        self.downloads += 1
+        with open(path, "wb") as f:
+            f.write(self.objects[key])
+
+
+def test_s3_store_caches_downloaded_batches(tmp_path):
+    s3 = _FakeS3()
+    store = S3ResultStore(s3, "bucket", cache_dir=str(tmp_path))
+    for hour in range(3):
+        store.append(_results(T0 + hour * 3600), f"run-{hour}", ts=T0 + hour * 3600)
+    assert sla_report(store, T0, T0 + 3 * 3600)["probes"] == 18
+    sla_report(store, T0, T0 + 3 * 3600)
+    assert s3.downloads == 3
+
+
+def test_handler_stores_each_run(monkeypatch, tmp_path):
+    store = LocalResultStore(str(tmp_path))
+    monkeypatch.setattr(lambda_function, "metrics", MetricBuffer(FakeCloudWatch()))
+    monkeypatch.setattr(lambda_function, "scheduler", Scheduler())
+    monkeypatch.setattr(lambda_function, "get_state_writer", lambda: None)
+    monkeypatch.setattr(lambda_function, "get_result_store", lambda: store)
+    monkeypatch.setattr(lambda_function, "load_target_items",
+                        lambda: [{"targetId": f"t{i}", "url": f"https://s{i}.example/"} for i in range(3)])
+    monkeypatch.setattr(lambda_function, "probe", lambda url, **kwargs: {
+        "status": 200, "content_length": 10, "sha256": None, "not_modified": False, "timings": {"ttfb": 0.01}})
+    lambda_function.handler({}, None)
+    now = time.time()
+    report = sla_report(store, now - 3600, now + 3600)
+    assert report["files"] == 1 and report["probes"] == 3 and report["availability"] == 1
@@ -0,0 +1,54 @@
+from aws_clients import serialize
+
+import target_alarms
+from tests.fakes import FakeCloudWatch
+
+
+def _record(event, old=None, new=None):
+    data = {}
+    if old is not None:
+        data["OldImage"] = {k: serialize(v) for k, v in old.items()}
+    if new is not None:
+        data["NewImage"] = {k: serialize(v) for k, v in new.items()}
+    return {"eventName": event, "dynamodb": data}
+
+
+def test_stream_creates_updates_and_deletes_target_alarms():
+    cw = FakeCloudWatch()
+    a = {"targetId": "a", "url": "https://a.example/", "active": True}
+    b = {"targetId": "b", "url": "https://b.example/", "active": True}
+    result = target_alarms.apply(cw, target_alarms.plan([_record("INSERT", new=a), _record("INSERT", new=b)]))
+    assert result == {"updated": 2, "deleted": 0}
+    assert sorted(cw.alarms) == sorted(target_alarms.alarm_names("a") + target_alarms.alarm_names("b"))
+    latency = cw.alarms["WebsiteMonitor-a-LatencyAnomaly"]
+    assert latency["MetricName"] == "LatencyAnomalyScore"
+    assert latency["Dimensions"] == [{"Name": "URL", "Value": "https://a.example/"}]
+
+    records = [
+        # crawler 寫回排程狀態：url / active 沒變，不動 alarm
+        _record("MODIFY", old=a, new=dict(a, nextDueAt=100)),
+        _record("MODIFY", old=a, new=dict(a, url="https://a2.example/")),
+        _record("MODIFY", old=b, new=dict(b, active=False)),
+    ]
+    assert target_alarms.plan(records[:1]) == {}
+    assert target_alarms.apply(cw, target_alarms.plan(records)) == {"updated": 1, "deleted": 2}
+    assert sorted(cw.alarms) == sorted(target_alarms.alarm_names("a"))
+    assert cw.alarms["WebsiteMonitor-a-Availability"]["Dimensions"][0]["Value"] == "https://a2.example/"
+
+    target_alarms.apply(cw, target_alarms.plan([_record("REMOVE", old=dict(a, url="https://a2.example/"))]))
+    assert cw.alarms == {}
+
+
+def test_reconcile_backfills_missing_and_removes_orphaned_alarms():
+    cw = FakeCloudWatch()
+    for spec in target_alarms.alarm_specs("gone", "https://gone.example/"):
+        cw.put_metric_alarm(**spec)
+    for spec in target_alarms.alarm_specs("moved", "https://old.example/"):
+        cw.put_metric_alarm(**spec)
+    targets = [{"targetId": f"t{i}", "url": f"https://s{i}.example/"} for i in range(120)]
+    targets.append({"targetId": "moved", "url": "https://new.example/"})
+
+    assert target_alarms.reconcile(cw, targets) == {"updated": 121, "deleted": 2}
+    assert len(cw.alarms) == 2 * 121
+    assert cw.alarms["WebsiteMonitor-moved-Availability"]["Dimensions"][0]["Value"] == "https://new.example/"
+    assert target_alarms.reconcile(cw, targets) == {"updated": 0, "deleted": 0}